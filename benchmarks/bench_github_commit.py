@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+data/ の JSON を GitHub に保存するときの往復回数・コミット数・所要時間を、ローカルの FakeGitHub に対して比べる。
+
+    python benchmarks/bench_github_commit.py
+    python benchmarks/bench_github_commit.py --latency 0.1 --mapping-keywords 20000
+
+- contents: 以前の方式 (ファイルごとに contents API で SHA を GET して PUT)
+- git-data: github_commit.GitHubCommitter (変更分だけ blob を作り、1コミットにまとめる)
+
+シナリオごとに、3ファイルとも変更 / 1ファイルだけ変更 / 変更なし / ref 更新の直前に別のコミットが入る、を計測し、
+最後にブランチ先頭のファイル内容が手元と一致することを確かめる。
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+from fake_github_server import FakeGitHub  # noqa: E402
+from github_commit import GitHubCommitter  # noqa: E402
+from http_client import create_session  # noqa: E402
+
+MAPPING_PATH = "data/linkMapping.json"
+USAGE_PATH = "data/linkUsage.json"
+ARTICLES_PATH = "data/articles.json"
+
+
+def make_files(keywords: int, articles: int, rng) -> dict:
+    urls = [f"https://example.invalid/media/column/{i}" for i in range(1, articles + 1)]
+    mapping = {"Uncategorized": {f"キーワード{i}": rng.choice(urls) for i in range(keywords)}}
+    usage = {kw: {"url": url, "articles_used_in": {str(rng.randint(1, articles)): 1 for _ in range(3)}}
+             for kw, url in mapping["Uncategorized"].items()}
+    arts = [{"id": str(i), "title": f"記事 {i}", "url": url} for i, url in enumerate(urls, 1)]
+    return {path: json.dumps(data, ensure_ascii=False, indent=2)
+            for path, data in ((MAPPING_PATH, mapping), (USAGE_PATH, usage), (ARTICLES_PATH, arts))}
+
+
+def commit_via_contents(session, api_url: str, files: dict, message: str):
+    """以前の manage_link_mapping.commit_to_github と同じ手順をファイルごとに繰り返す"""
+    for path, json_str in files.items():
+        url = f"{api_url}/repos/owner/repo/contents/{path}?ref=main"
+        get_res = session.get(url)
+        sha = get_res.json().get("sha") if get_res.status_code == 200 else None
+        put_data = {"message": message, "branch": "main",
+                    "content": base64.b64encode(json_str.encode("utf-8")).decode("utf-8")}
+        if sha:
+            put_data["sha"] = sha
+        session.put(url, json=put_data)
+
+
+def commit_via_git_data(session, api_url: str, files: dict, message: str):
+    committer = GitHubCommitter("owner", "repo", "main", "token", api_url=api_url, session=session)
+    for path, json_str in files.items():
+        committer.stage(path, json_str)
+    return committer.commit(message)
+
+
+def edit(files: dict, paths, rng) -> dict:
+    """指定したファイルの末尾に変更を加えたコピー"""
+    out = dict(files)
+    for path in paths:
+        out[path] = out[path] + f"\n{rng.random()}"
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.05, help="擬似サーバの応答遅延 (秒)")
+    parser.add_argument("--mapping-keywords", type=int, default=5000)
+    parser.add_argument("--articles", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    base = make_files(args.mapping_keywords, args.articles, rng)
+    size_kb = sum(len(v.encode("utf-8")) for v in base.values()) / 1024
+    scenarios = [
+        ("all changed", edit(base, list(base), rng), 0),
+        ("1 of 3 changed", edit(base, [USAGE_PATH], rng), 0),
+        ("unchanged", dict(base), 0),
+        ("ref race", edit(base, list(base), rng), 1),
+    ]
+
+    print(f"files={len(base)} ({size_kb:.0f} KiB) latency={args.latency * 1000:.0f}ms")
+    print(f"{'scenario':>16} {'method':>9} {'requests':>9} {'commits':>8} {'elapsed(s)':>11} {'match':>6}")
+    for name, files, races in scenarios:
+        for method, func in (("contents", commit_via_contents), ("git-data", commit_via_git_data)):
+            with FakeGitHub(base, latency=args.latency) as gh:
+                gh.race_ref_updates = races if method == "git-data" else 0
+                before = dict(gh.stats)
+                session = create_session(pool_size=2)
+                started = time.perf_counter()
+                func(session, gh.url, files, "bench")
+                elapsed = time.perf_counter() - started
+                head_files = gh.files()
+                match = all(head_files.get(p) == c.encode("utf-8") for p, c in files.items())
+                requests_made = gh.stats["requests"] - before["requests"]
+                # 割り込ませたコミットは数えない
+                commits = gh.stats["commits"] - before["commits"] - (races if method == "git-data" else 0)
+            print(f"{name:>16} {method:>9} {requests_made:>9} {commits:>8} {elapsed:11.2f} {str(match):>6}")
+
+
+if __name__ == "__main__":
+    main()
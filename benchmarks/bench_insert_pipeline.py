@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+insert_links.process_articles のスループットをローカルの FakeWordPress に対して計測する。
+
+    python benchmarks/bench_insert_pipeline.py
+    python benchmarks/bench_insert_pipeline.py --posts 500 --latency 0.05 --workers 1 4 8 16
+
+ワーカー数ごとに 記事数/秒 と、サーバ側で受け付けた TCP 接続数を出力する。
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+from bench_keyword_matcher import make_keywords, make_post  # noqa: E402
+from fake_wp_server import FakeWordPress  # noqa: E402
+from insert_links import process_articles  # noqa: E402
+from keyword_matcher import KeywordMatcher  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=200)
+    parser.add_argument("--keywords", type=int, default=300)
+    parser.add_argument("--post-chars", type=int, default=10000)
+    parser.add_argument("--latency", type=float, default=0.02, help="擬似サーバの応答遅延 (秒)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--rate", type=float, default=0, help="HostRateLimiter の上限 (0 で無制限)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    keywords = make_keywords(args.keywords, rng)
+    mapping = {kw: f"http://example.invalid/media/column/{i + 1}" for i, kw in enumerate(keywords)}
+    matcher = KeywordMatcher(mapping)
+    posts = {
+        pid: {"content": make_post(args.post_chars, keywords, rng, hits=1), "title": f"post {pid}"}
+        for pid in range(1, args.posts + 1)
+    }
+    articles = [{"id": str(pid), "title": p["title"], "url": f"http://example.invalid/media/column/{pid}"}
+                for pid, p in posts.items()]
+
+    print(f"posts={args.posts} keywords={args.keywords} latency={args.latency * 1000:.0f}ms rate={args.rate or '∞'}")
+    print(f"{'workers':>8} {'elapsed(s)':>11} {'posts/s':>9} {'updated':>8} {'connections':>12}")
+    for workers in args.workers:
+        with FakeWordPress(posts, latency=args.latency) as wp:
+            # 記事ごとのログは計測の邪魔なので捨てる
+            with contextlib.redirect_stdout(io.StringIO()):
+                stats = process_articles(articles, matcher, wp.url, "user", "pass",
+                                         workers=workers, rate=args.rate)
+            conns = wp.stats["connections"]
+        rate = stats["total"] / stats["elapsed"] if stats["elapsed"] else 0
+        print(f"{workers:>8} {stats['elapsed']:11.2f} {rate:9.1f} {stats['updated']:>8} {conns:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+insert_link_once のキーワード探索を、マッピング件数ごとに計測するベンチマーク。
+
+    python benchmarks/bench_keyword_matcher.py
+    python benchmarks/bench_keyword_matcher.py --sizes 10 100 1000 10000 --post-chars 10000
+
+旧実装 (本文の各位置 × 全キーワードでスライス比較) との比較も出力する。
+旧実装はキーワード数に比例して遅くなるため、--naive-max を超えるサイズでは省略する。
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+from keyword_matcher import KeywordMatcher  # noqa: E402
+from insert_links import insert_link_once  # noqa: E402
+
+KANA = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをん"
+WORDS = ["アプリ", "おすすめ", "無料", "ポイ活", "ゲーム", "比較", "人気", "ランキング", "使い方", "初心者"]
+
+
+def make_keywords(n, rng):
+    """重複しない日本語キーワードを n 件生成する"""
+    keywords = set()
+    while len(keywords) < n:
+        kw = rng.choice(WORDS) + "".join(rng.choice(KANA) for _ in range(rng.randint(2, 6))) + rng.choice(WORDS)
+        keywords.add(kw)
+    return sorted(keywords)
+
+
+def make_post(n_chars, keywords, rng, hits=3):
+    """約 n_chars 文字の本文を生成し、末尾付近にキーワードを hits 個だけ埋め込む"""
+    parts = []
+    size = 0
+    while size < n_chars:
+        para = "".join(rng.choice(KANA) for _ in range(rng.randint(40, 120)))
+        parts.append(f"<p>{para}</p>\n")
+        size += len(parts[-1])
+    # キーワードは後半に置き、走査が本文全体に及ぶ最悪に近いケースにする
+    for kw in rng.sample(keywords, min(hits, len(keywords))):
+        parts.insert(len(parts) - 1, f"<p>{kw}</p>\n")
+    parts.insert(len(parts) // 2, '<p>[caption id="1"]画像[/caption]<a href="https://example.com/">既存リンク</a></p>\n')
+    return "".join(parts)
+
+
+def naive_first_match(content, link_mapping, article_url):
+    """旧 insert_link_once の探索ループ (比較用)"""
+    for i in range(len(content)):
+        for kw, url in link_mapping.items():
+            if url == article_url:
+                continue
+            if content[i:i+len(kw)] == kw:
+                return i, kw, url
+    return None
+
+
+def time_it(func, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--post-chars", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--naive-max", type=int, default=1000,
+                        help="旧実装を計測するマッピング件数の上限")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    article_url = "https://good-apps.jp/media/column/0"
+
+    print(f"post size: ~{args.post_chars} chars, best of {args.repeat}")
+    print(f"{'keywords':>9} {'build(ms)':>10} {'matcher(ms)':>12} {'insert(ms)':>11} {'naive(ms)':>10}")
+    for n in args.sizes:
+        keywords = make_keywords(n, rng)
+        mapping = {kw: f"https://good-apps.jp/media/column/{i + 1}" for i, kw in enumerate(keywords)}
+        post = make_post(args.post_chars, keywords, rng)
+
+        t0 = time.perf_counter()
+        matcher = KeywordMatcher(mapping)
+        build = time.perf_counter() - t0
+
+        t_match = time_it(lambda: matcher.find_first(post, exclude_urls={article_url}), args.repeat)
+        t_insert = time_it(lambda: insert_link_once(post, matcher, article_url), args.repeat)
+        if n <= args.naive_max:
+            t_naive = time_it(lambda: naive_first_match(post, mapping, article_url), 1)
+            naive_txt = f"{t_naive * 1000:10.1f}"
+        else:
+            naive_txt = f"{'-':>10}"
+
+        print(f"{n:>9} {build * 1000:10.1f} {t_match * 1000:12.2f} {t_insert * 1000:11.2f} {naive_txt}")
+
+
+if __name__ == "__main__":
+    main()
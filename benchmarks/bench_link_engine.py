@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+link_engine.link_corpus (プロセスプールでのリンク挿入) のスケーリングを計測する。
+
+    python benchmarks/bench_link_engine.py
+    python benchmarks/bench_link_engine.py --posts 5000 --keywords 5000 --processes 1 2 4 8
+
+コーパス全体を張り直す場合を想定し、本文は手元で生成したものを使う (HTTP は含まない)。
+基準は insert_link_once を1プロセスで順に呼んだ時間で、プロセス数ごとに 記事数/秒 と倍率を出力する。
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+from bench_keyword_matcher import make_keywords, make_post  # noqa: E402
+from insert_links import insert_link_once  # noqa: E402
+from keyword_matcher import KeywordMatcher  # noqa: E402
+from link_engine import DEFAULT_BATCH_SIZE, link_corpus  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--keywords", type=int, default=2000)
+    parser.add_argument("--post-chars", type=int, default=10000)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    keywords = make_keywords(args.keywords, rng)
+    matcher = KeywordMatcher({kw: f"https://example.invalid/media/column/{i + 1}" for i, kw in enumerate(keywords)})
+    items = [(str(pid), make_post(args.post_chars, keywords, rng, hits=1),
+              f"https://example.invalid/media/column/{pid}") for pid in range(1, args.posts + 1)]
+
+    started = time.perf_counter()
+    expected = {post_id: insert_link_once(content, matcher, url) for post_id, content, url in items}
+    baseline = time.perf_counter() - started
+
+    print(f"posts={args.posts} keywords={args.keywords} post_chars={args.post_chars} "
+          f"batch_size={args.batch_size} cpus={os.cpu_count()}")
+    print(f"{'processes':>10} {'elapsed(s)':>11} {'posts/s':>9} {'speedup':>8}")
+    print(f"{'inline':>10} {baseline:11.2f} {args.posts / baseline:9.1f} {1.0:8.2f}")
+    for processes in args.processes:
+        started = time.perf_counter()
+        results = {r.post_id: r for r in link_corpus(iter(items), matcher, processes, args.batch_size)}
+        elapsed = time.perf_counter() - started
+        content_of = {post_id: content for post_id, content, _ in items}
+        assert all((r.content or content_of[post_id]) == expected[post_id] for post_id, r in results.items())
+        print(f"{processes:>10} {elapsed:11.2f} {args.posts / elapsed:9.1f} {baseline / elapsed:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
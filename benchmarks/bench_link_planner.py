@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+link_planner.plan_corpus_links (コーパス全体のリンク割り当て) の速さと、被リンクの偏りを計測する。
+
+    python benchmarks/bench_link_planner.py
+    python benchmarks/bench_link_planner.py --posts 10000 --keywords 5000 --per-post 40 --max-inbound 20
+
+出現行列 (記事 × キーワード) は本文を走査せずに直接生成する。キーワードの出現頻度は
+Zipf 風に偏らせ (少数のキーワードが多くの記事に出る)、記事の URL はリンク先と重なるようにする
+(自記事へのリンクの除外も効く)。比較用に、記事ごとに linkMapping の順で最初の max_per_post 個を選ぶ
+従来の選び方 (plan_links_to_content と同じ) の被リンク数の分布も出力する。
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+from link_planner import plan_corpus_links  # noqa: E402
+
+
+def make_occurrences(posts: int, keywords: int, per_post: int, rng) -> list:
+    weights = [1.0 / (k + 1) for k in range(keywords)]
+    rows = []
+    for pid in range(1, posts + 1):
+        hits = set(rng.choices(range(keywords), weights=weights, k=per_post))
+        for k in hits:
+            rows.append((f"キーワード{k}", str(pid), rng.randint(1, 5), rng.randint(0, 20000)))
+    return rows
+
+
+def greedy_inbound(rows, link_mapping: dict, max_per_post: int) -> dict:
+    """記事ごとに linkMapping の順で最初の max_per_post 個 (従来の選び方)"""
+    order = {kw: i for i, kw in enumerate(link_mapping)}
+    per_post = {}
+    for kw, post_id, _, _ in rows:
+        per_post.setdefault(post_id, []).append(kw)
+    inbound = {}
+    for kws in per_post.values():
+        for kw in sorted(kws, key=order.__getitem__)[:max_per_post]:
+            inbound[link_mapping[kw]] = inbound.get(link_mapping[kw], 0) + 1
+    return inbound
+
+
+def describe(inbound: dict, targets: int) -> str:
+    counts = sorted(list(inbound.values()) + [0] * (targets - len(inbound)))
+    return (f"links={sum(counts)} linked_targets={sum(1 for c in counts if c)}/{targets} "
+            f"max={counts[-1]} p50={counts[len(counts) // 2]} p90={counts[int(len(counts) * 0.9)]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=10000)
+    parser.add_argument("--keywords", type=int, default=5000)
+    parser.add_argument("--per-post", type=int, default=30, help="1記事に出現するキーワード数 (重複を除く前)")
+    parser.add_argument("--max-per-post", type=int, default=3)
+    parser.add_argument("--max-inbound", type=int, default=0)
+    parser.add_argument("--min-inbound", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    link_mapping = {f"キーワード{k}": f"https://example.invalid/media/column/{k + 1}" for k in range(args.keywords)}
+    post_urls = {str(pid): f"https://example.invalid/media/column/{pid}" for pid in range(1, args.posts + 1)}
+    started = time.perf_counter()
+    rows = make_occurrences(args.posts, args.keywords, args.per_post, rng)
+    print(f"posts={args.posts} keywords={args.keywords} occurrences={len(rows)} "
+          f"(generated in {time.perf_counter() - started:.1f}s)")
+
+    started = time.perf_counter()
+    inbound = greedy_inbound(rows, link_mapping, args.max_per_post)
+    print(f"{'greedy':>8} {time.perf_counter() - started:6.2f}s  "
+          f"{describe(inbound, args.keywords)}")
+
+    plan = plan_corpus_links(iter(rows), link_mapping, post_urls, max_links_per_post=args.max_per_post,
+                             max_inbound=args.max_inbound, min_inbound=args.min_inbound)
+    planned = {url: t["planned"] for url, t in plan["targets"].items() if t["planned"]}
+    assert all(len(m) <= args.max_per_post for m in plan["posts"].values())
+    assert all(post_urls[pid] not in m.values() for pid, m in plan["posts"].items())
+    print(f"{'planner':>8} {plan['summary']['elapsed']:6.2f}s  {describe(planned, args.keywords)} "
+          f"under_min={plan['summary']['under_min']}")
+
+
+if __name__ == "__main__":
+    main()
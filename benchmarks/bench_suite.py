@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+リンク挿入・使用状況調査の各段階を、生成したコーパス (synthetic_corpus.py) で規模ごとに計測し、JSON に書き出す。
+
+    python benchmarks/bench_suite.py                                   # 既定の規模 (200x500, 1000x2000)
+    python benchmarks/bench_suite.py --scales 100x200 2000x5000 --repeat 3 --output reports/bench/after.json
+    python benchmarks/bench_suite.py --output reports/bench/after.json --compare reports/bench/before.json
+
+規模は 記事数x キーワード数。段階ごとに 秒数 (--repeat 回の最小) / 件数/秒 / MB/秒 と、
+tracemalloc で測ったピークメモリ (KiB。計測時間に影響しないよう別に1回実行する) を出力する。
+
+    flatten_mapping          insert_links.flatten_link_mapping (カテゴリ分けされた linkMapping の平坦化)
+    build_matcher            KeywordMatcher の構築
+    insert_link_once         insert_links.insert_link_once (全記事、1プロセス)
+    insert_links_to_content  Streamlit 一括挿入と同じ plan_links_to_content (記事ごとに本文に出現するキーワード最大10個)
+    detect_count             detect_link_usage の集計 (公開ページの HTML のリンクを数えて linkUsage を作る)
+    pipeline_insert          insert_links.process_articles を FakeWordPress に対して実行 (取得→挿入→更新)
+    pipeline_detect          detect_link_usage.crawl_articles で FakeWordPress の公開ページを取得して集計
+
+通信はすべてローカルの FakeWordPress (fake_wp_server.py) に対して行う。
+--compare に前回の JSON を渡すと段階ごとの秒数の比を出力し、--threshold を超えて遅くなった段階があれば
+終了コード 1 で終わる。
+insert_links_to_content は計測の前に、2回実行しても1回目と同じ本文になる (同じリンクが増えない) ことを確認する。
+pipeline_insert は計測の前に、既定以外の上限の計画でドライランと実行のリンク数が一致することを確認する。
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+from content_tokenizer import build_linked_content  # noqa: E402
+from detect_link_usage import HEADERS, SOURCE_PAGE, aggregate_usage, crawl_articles, fetch_href_counts  # noqa: E402
+from fake_wp_server import PAGE_TEMPLATE, FakeWordPress  # noqa: E402
+from http_client import create_session  # noqa: E402
+from insert_links import flatten_link_mapping, insert_link_once, preview_articles, process_articles  # noqa: E402
+from keyword_index import scan_keywords  # noqa: E402
+from keyword_matcher import KeywordMatcher  # noqa: E402
+from link_transform import plan_links_to_content  # noqa: E402
+from link_urls import count_links  # noqa: E402
+from synthetic_corpus import SITE_URL, make_corpus, rebase_url  # noqa: E402
+
+DEFAULT_SCALES = ["200x500", "1000x2000"]
+DEFAULT_OUTPUT = os.path.join("reports", "bench", "benchSuite.json")
+BULK_KEYWORDS_PER_POST = 10
+PLAN_CHECK_MAX_LINKS = 5  # ドライランと実行の一致の確認に使う、既定 (3) 以外の1記事あたりの上限
+FLATTEN_REPEAT = 20     # 平坦化は1回が短いので、この回数まとめて計る
+
+
+def parse_scale(text: str):
+    posts, _, keywords = text.lower().partition("x")
+    return int(posts), int(keywords)
+
+
+class Scale:
+    """1つの規模のコーパスと、各段階の入力 (計測の前に用意しておく)"""
+
+    def __init__(self, posts, keywords, post_chars, seed):
+        started = time.perf_counter()
+        self.posts, self.keywords = posts, keywords
+        self.corpus = make_corpus(posts, keywords, post_chars, seed)
+        self.flat_map = flatten_link_mapping(self.corpus.link_mapping)
+        self.matcher = KeywordMatcher(self.flat_map)
+        self.items = [(a["id"], self.corpus.posts[int(a["id"])]["content"], a["url"]) for a in self.corpus.articles]
+        self.content_bytes = sum(len(content.encode("utf-8")) for _, content, _ in self.items)
+        # 一括挿入の対象: 本文に出現するキーワード (linkUsage で ON になっているもの) を記事ごとに最大10個
+        self.kw_maps = {}
+        for post_id, content, _ in self.items:
+            found = sorted(scan_keywords(content, self.matcher))[:BULK_KEYWORDS_PER_POST]
+            self.kw_maps[post_id] = {kw: self.flat_map[kw] for kw in found}
+        self.pages = {post_id: PAGE_TEMPLATE.format(title=post_id, content=content)
+                      for post_id, content, _ in self.items}
+        self.page_bytes = sum(len(page.encode("utf-8")) for page in self.pages.values())
+        self.setup_seconds = time.perf_counter() - started
+
+
+# ---- 段階 (戻り値は (件数, 単位, 処理したバイト数)) ----
+
+def stage_flatten_mapping(scale, args):
+    for _ in range(FLATTEN_REPEAT):
+        flatten_link_mapping(scale.corpus.link_mapping)
+    return scale.keywords * FLATTEN_REPEAT, "keywords", 0
+
+
+def stage_build_matcher(scale, args):
+    KeywordMatcher(scale.flat_map)
+    return scale.keywords, "keywords", 0
+
+
+def stage_insert_link_once(scale, args):
+    for _, content, url in scale.items:
+        insert_link_once(content, scale.matcher, url)
+    return scale.posts, "posts", scale.content_bytes
+
+
+def stage_insert_links_to_content(scale, args):
+    for post_id, content, url in scale.items:
+        build_linked_content(content, plan_links_to_content(content, scale.kw_maps[post_id], base_url=url))
+    return scale.posts, "posts", scale.content_bytes
+
+
+def non_idempotent_posts(scale) -> list:
+    """一括挿入を2回実行した本文が1回目と変わる記事ID (同じリンクが増えていないかの確認)"""
+    changed = []
+    for post_id, content, url in scale.items:
+        once = build_linked_content(content, plan_links_to_content(content, scale.kw_maps[post_id], base_url=url))
+        twice = build_linked_content(once, plan_links_to_content(once, scale.kw_maps[post_id], base_url=url))
+        if twice != once:
+            changed.append(post_id)
+    return changed
+
+
+def plan_dry_run_mismatch(scale, args):
+    """
+    計画 (記事ごとのキーワード、上限 PLAN_CHECK_MAX_LINKS) をドライラン (preview_articles) と
+    実行 (process_articles) で処理し、リンク数が違えば (ドライランの数, 実際に増えたリンク数) を返す。一致すれば None。
+    """
+    anchors_before = sum(post["content"].count("<a ") for post in scale.corpus.posts.values())
+    with FakeWordPress(scale.corpus.posts, latency=args.latency) as wp, \
+            contextlib.redirect_stdout(io.StringIO()):
+        report = preview_articles(scale.corpus.articles, None, wp.url, "user", "pass", workers=args.workers,
+                                  rate=0, processes=1, kw_maps=scale.kw_maps,
+                                  max_links_per_post=PLAN_CHECK_MAX_LINKS)
+        process_articles(scale.corpus.articles, scale.matcher, wp.url, "user", "pass", workers=args.workers,
+                         rate=0, processes=1, kw_maps=scale.kw_maps, max_links_per_post=PLAN_CHECK_MAX_LINKS)
+        written = sum(post["content"].count("<a ") for post in wp.posts.values()) - anchors_before
+    planned = report["summary"]["links"]
+    return None if planned == written else (planned, written)
+
+
+def stage_detect_count(scale, args):
+    crawled = {a["id"]: count_links(scale.pages[a["id"]], base_url=a["url"]) for a in scale.corpus.articles}
+    aggregate_usage(scale.corpus.articles, crawled, scale.flat_map)
+    return scale.posts, "posts", scale.page_bytes
+
+
+def stage_pipeline_insert(scale, args):
+    with FakeWordPress(scale.corpus.posts, latency=args.latency) as wp, \
+            contextlib.redirect_stdout(io.StringIO()):
+        stats = process_articles(scale.corpus.articles, scale.matcher, wp.url, "user", "pass",
+                                 workers=args.workers, rate=0, processes=1)
+    if stats["fetch_failed"] or stats["write_failed"]:
+        raise RuntimeError(f"pipeline_insert failed: {stats}")
+    return scale.posts, "posts", scale.content_bytes
+
+
+def stage_pipeline_detect(scale, args):
+    with FakeWordPress(scale.corpus.posts, latency=args.latency) as wp, \
+            tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        # 公開ページの URL とリンク先を FakeWordPress のものに付け替える
+        articles = [dict(a, url=rebase_url(a["url"], SITE_URL, wp.url)) for a in scale.corpus.articles]
+        link_mapping = {kw: rebase_url(url, SITE_URL, wp.url) for kw, url in scale.flat_map.items()}
+        session = create_session(pool_size=args.workers, endpoint_timeouts=(), default_timeout=(5, 15),
+                                 headers=HEADERS)
+
+        def fetch_batch(batch):
+            return {a["id"]: fetch_href_counts(session, a["url"]) for a in batch}
+
+        crawled = crawl_articles(articles, fetch_batch, batch_size=1, workers=args.workers,
+                                 journal_path=os.path.join(tmp, "journal.jsonl"), source=SOURCE_PAGE)
+        aggregate_usage(articles, crawled, link_mapping)
+    if len(crawled) != scale.posts:
+        raise RuntimeError(f"pipeline_detect crawled {len(crawled)}/{scale.posts} pages")
+    return scale.posts, "posts", scale.page_bytes
+
+
+STAGES = {
+    "flatten_mapping": stage_flatten_mapping,
+    "build_matcher": stage_build_matcher,
+    "insert_link_once": stage_insert_link_once,
+    "insert_links_to_content": stage_insert_links_to_content,
+    "detect_count": stage_detect_count,
+    "pipeline_insert": stage_pipeline_insert,
+    "pipeline_detect": stage_pipeline_detect,
+}
+
+
+def run_stage(func, scale, args) -> dict:
+    best = None
+    for _ in range(max(1, args.repeat)):
+        started = time.perf_counter()
+        count, unit, nbytes = func(scale, args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    result = {
+        "seconds": round(best, 6),
+        "items": count,
+        "unit": unit,
+        "per_s": round(count / best, 1) if best else None,
+        "mb_per_s": round(nbytes / best / 1e6, 2) if best and nbytes else None,
+        "peak_kib": None,
+    }
+    if not args.no_memory:
+        tracemalloc.start()
+        try:
+            func(scale, args)
+            result["peak_kib"] = tracemalloc.get_traced_memory()[1] // 1024
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def max_rss_kib():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list:
+    """(規模, 段階, 前回の秒数, 今回の秒数, 比) のうち threshold を超えて遅くなったものを返す"""
+    base_scales = {(s["posts"], s["keywords"]): s for s in baseline.get("scales", [])}
+    regressions = []
+    print(f"{'scale':>12} {'stage':<24} {'before(s)':>10} {'after(s)':>10} {'ratio':>7}")
+    for scale in report["scales"]:
+        key = (scale["posts"], scale["keywords"])
+        base = base_scales.get(key)
+        if base is None:
+            continue
+        for name, result in scale["stages"].items():
+            before = base["stages"].get(name, {}).get("seconds")
+            if not before:
+                continue
+            ratio = result["seconds"] / before
+            mark = " SLOWER" if ratio > 1 + threshold else (" faster" if ratio < 1 - threshold else "")
+            print(f"{key[0]:>5}x{key[1]:<6} {name:<24} {before:10.3f} {result['seconds']:10.3f} {ratio:7.2f}{mark}")
+            if ratio > 1 + threshold:
+                regressions.append((key, name, before, result["seconds"], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", nargs="+", default=DEFAULT_SCALES, help="記事数xキーワード数")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--post-chars", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=8, help="pipeline_* の並行数")
+    parser.add_argument("--latency", type=float, default=0.0, help="FakeWordPress の応答遅延 (秒)")
+    parser.add_argument("--repeat", type=int, default=1, help="各段階を何回実行して最小を取るか")
+    parser.add_argument("--no-memory", action="store_true", help="ピークメモリを計測しない")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--compare", help="比較する前回の JSON")
+    parser.add_argument("--threshold", type=float, default=0.1, help="遅くなったとみなす割合")
+    args = parser.parse_args(argv)
+
+    report = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+        "params": {"post_chars": args.post_chars, "workers": args.workers, "latency": args.latency,
+                   "repeat": args.repeat, "seed": args.seed},
+        "scales": [],
+    }
+    for text in args.scales:
+        posts, keywords = parse_scale(text)
+        scale = Scale(posts, keywords, args.post_chars, args.seed)
+        print(f"[INFO] scale {posts}x{keywords}: {scale.content_bytes / 1e6:.1f} MB of content "
+              f"(setup {scale.setup_seconds:.1f}s)")
+        if "insert_links_to_content" in args.stages:
+            changed = non_idempotent_posts(scale)
+            if changed:
+                print(f"[ERROR] insert_links_to_content added links again on a second run: posts {changed[:10]}")
+                return 1
+        if "pipeline_insert" in args.stages:
+            mismatch = plan_dry_run_mismatch(scale, args)
+            if mismatch:
+                print(f"[ERROR] Plan dry run reported {mismatch[0]} links but the run wrote {mismatch[1]} "
+                      f"(max_links_per_post={PLAN_CHECK_MAX_LINKS})")
+                return 1
+        stages = {}
+        for name in args.stages:
+            stages[name] = result = run_stage(STAGES[name], scale, args)
+            rate = f"{result['per_s']:>10.1f} {result['unit']}/s"
+            mbps = f"{result['mb_per_s']:7.2f} MB/s" if result["mb_per_s"] else " " * 12
+            peak = f"peak {result['peak_kib']} KiB" if result["peak_kib"] is not None else ""
+            print(f"    {name:<24} {result['seconds']:8.3f}s {rate} {mbps} {peak}")
+        report["scales"].append({"posts": posts, "keywords": keywords, "post_chars": args.post_chars,
+                                 "content_bytes": scale.content_bytes,
+                                 "setup_seconds": round(scale.setup_seconds, 3), "stages": stages})
+    report["environment"]["max_rss_kib"] = max_rss_kib()
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[INFO] Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print(f"[WARN] {len(regressions)} stages are slower than {args.compare} by more than "
+                  f"{args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+OFF にしたキーワードのリンク削除 (job_runner.run_insert_job の unlink_maps) を FakeWordPress に対して計測する。
+
+    python benchmarks/bench_unlink.py
+    python benchmarks/bench_unlink.py --posts 500 --off 50 --latency 0.02 --workers 8
+
+合成コーパス (synthetic_corpus) の既存リンクのうち、リンクの多いリンク先 --off 個を外す。
+- batched:     全リンク先をまとめた1回のジョブ (記事ごとに1回の取得・1回の更新)
+- per-keyword: リンク先ごとに1回ずつジョブを流した場合 (比較用)
+の所要時間と、サーバが受けた取得 (GET) / 更新 (POST) の回数を出力する。
+どちらも実行後の本文に対象のリンクが残っていないことを確認する。
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+from fake_wp_server import FakeWordPress  # noqa: E402
+from job_runner import run_insert_job  # noqa: E402
+from link_urls import count_links  # noqa: E402
+from synthetic_corpus import make_corpus  # noqa: E402
+
+
+class BenchContext:
+    """run_insert_job() が使う JobContext の一部だけを持つ計測用のコンテキスト"""
+
+    cancelled = False
+
+    def __init__(self, params: dict):
+        self.params = params
+        self.state = {"done": 0, "total": 0, "message": ""}
+        self.done = {}
+
+    def is_done(self, item_id) -> bool:
+        return item_id in self.done
+
+    def start_progress(self, done: int, total: int):
+        self.state.update(done=done, total=total)
+
+    def item_done(self, item_id, ok=True, error=None, skipped=False):
+        self.state["done"] += 1
+        self.done[item_id] = ok
+
+
+def linked_posts(posts: dict, articles: list) -> dict:
+    """{正規化URL: そのURLへのリンクを含む記事IDの集合}"""
+    urls = {a["id"]: a["url"] for a in articles}
+    result = {}
+    for pid, post in posts.items():
+        for url in count_links(post["content"], urls[str(pid)]):
+            result.setdefault(url, set()).add(str(pid))
+    return result
+
+
+def run_jobs(posts, articles, unlink_batches, workers, latency):
+    params_base = {"kw_maps": {}, "article_urls": {a["id"]: a["url"] for a in articles}, "workers": workers,
+                   "rate": 0}
+    with FakeWordPress(posts, latency=latency) as wp:
+        os.environ.update({"WP_URL": wp.url, "WP_USERNAME": "user", "WP_PASSWORD": "pass"})
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for unlink_maps in unlink_batches:
+                run_insert_job(BenchContext(dict(params_base, unlink_maps=unlink_maps)))
+        elapsed = time.perf_counter() - started
+        return elapsed, dict(wp.stats), {pid: p["content"] for pid, p in wp.posts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=500)
+    parser.add_argument("--off", type=int, default=50, help="外すリンク先の数")
+    parser.add_argument("--post-chars", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.01, help="擬似サーバの応答遅延 (秒)")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.posts, keywords=args.off * 4, post_chars=args.post_chars, seed=args.seed)
+    by_url = linked_posts(corpus.posts, corpus.articles)
+    off_urls = sorted(by_url, key=lambda url: (-len(by_url[url]), url))[:args.off]
+    affected = set().union(*(by_url[url] for url in off_urls))
+    print(f"posts={args.posts} off_targets={len(off_urls)} affected_posts={len(affected)} "
+          f"latency={args.latency * 1000:.0f}ms workers={args.workers}")
+
+    batched = [{art_id: off_urls for art_id in sorted(affected, key=int)}]
+    per_keyword = [{art_id: [url] for art_id in sorted(by_url[url], key=int)} for url in off_urls]
+    off_set = set(off_urls)
+    articles_by_id = {a["id"]: a for a in corpus.articles}
+
+    print(f"{'mode':>12} {'elapsed(s)':>11} {'gets':>6} {'updates':>8} {'left':>5}")
+    for mode, batches in (("batched", batched), ("per-keyword", per_keyword)):
+        elapsed, stats, contents = run_jobs(corpus.posts, corpus.articles, batches, args.workers, args.latency)
+        left = sum(1 for pid, content in contents.items()
+                   if off_set & set(count_links(content, articles_by_id[str(pid)]["url"])))
+        print(f"{mode:>12} {elapsed:11.2f} {stats['gets']:>6} {stats['updates']:>8} {left:>5}")
+        if mode == "batched":
+            assert stats["gets"] == stats["updates"] == len(affected), stats
+        assert left == 0
+
+
+if __name__ == "__main__":
+    main()
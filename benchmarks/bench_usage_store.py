@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+linkUsage の保存形式 (JSON / usage_store.py のバイナリ疎行列) のサイズ・読み書き・参照の速さを比べる。
+
+    python benchmarks/bench_usage_store.py
+    python benchmarks/bench_usage_store.py --keywords 5000 --articles 10000 --per-keyword 40
+
+参照は「キーワード → 記事」「記事 → キーワード」をそれぞれ --queries 回ずつ行った1回あたりの時間。
+JSON は読み込み済みの dict を引く (記事 → キーワード は全キーワードを走査する) のに対し、
+バイナリ版は配列を読み込んで (load) CSR / CSC のスライスを引く。
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+from usage_store import UsageMatrix, load_link_usage, save_link_usage  # noqa: E402
+
+
+def make_usage(keywords: int, articles: int, per_keyword: int, rng) -> dict:
+    usage = {}
+    for i in range(keywords):
+        used_in = {str(aid): rng.randint(1, 3) for aid in rng.sample(range(1, articles + 1), per_keyword)}
+        usage[f"キーワード{i}"] = {"url": f"https://example.invalid/media/column/{i}", "articles_used_in": used_in}
+    return usage
+
+
+def timed(func, repeat=1):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - started) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keywords", type=int, default=3000)
+    parser.add_argument("--articles", type=int, default=5000)
+    parser.add_argument("--per-keyword", type=int, default=20, help="1キーワードあたりの使用記事数")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    usage = make_usage(args.keywords, args.articles, args.per_keyword, rng)
+    kw_samples = rng.sample(list(usage), min(args.queries, len(usage)))
+    art_samples = [str(rng.randint(1, args.articles)) for _ in range(args.queries)]
+
+    print(f"keywords={args.keywords} articles={args.articles} entries={args.keywords * args.per_keyword}")
+    print(f"{'format':>7} {'size(KiB)':>10} {'save(s)':>8} {'load(s)':>8} {'kw→art(µs)':>11} {'art→kw(µs)':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "linkUsage.json")
+        store_path = os.path.join(tmp, "linkUsage.bin")
+
+        save_s, _ = timed(lambda: save_link_usage(usage, json_path))
+        load_s, loaded = timed(lambda: load_link_usage(json_path))
+        kw_s = sum(timed(lambda kw=kw: loaded[kw]["articles_used_in"])[0] for kw in kw_samples) / len(kw_samples)
+        art_s = sum(timed(lambda a=a: {kw: info["articles_used_in"][a] for kw, info in loaded.items()
+                                       if a in info["articles_used_in"]})[0]
+                    for a in art_samples) / len(art_samples)
+        print(f"{'json':>7} {os.path.getsize(json_path) / 1024:10.0f} {save_s:8.3f} {load_s:8.3f} "
+              f"{kw_s * 1e6:11.1f} {art_s * 1e6:11.1f}")
+
+        save_s, _ = timed(lambda: save_link_usage(usage, store_path))
+        load_s, matrix = timed(lambda: UsageMatrix.load(store_path))
+        dict_s, loaded_store = timed(matrix.to_dict)
+        assert loaded_store == {kw: {"url": info["url"],
+                                     "articles_used_in": dict(sorted(info["articles_used_in"].items(),
+                                                                     key=lambda x: int(x[0])))}
+                                for kw, info in usage.items()}
+        kw_s = sum(timed(lambda kw=kw: matrix.articles_for(kw))[0] for kw in kw_samples) / len(kw_samples)
+        art_s = sum(timed(lambda a=a: matrix.keywords_for(a))[0] for a in art_samples) / len(art_samples)
+        print(f"{'binary':>7} {os.path.getsize(store_path) / 1024:10.0f} {save_s:8.3f} {load_s:8.3f} "
+              f"{kw_s * 1e6:11.1f} {art_s * 1e6:11.1f}")
+        print(f"(binary → 従来の dict への変換: {dict_s:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ベンチマーク用のローカル GitHub REST API もどき (1リポジトリ・1ブランチ分)。
+
+github_commit.GitHubCommitter と、以前の contents API による保存を比べるためのもので、
+以下のエンドポイントだけを実装している:
+
+    GET   /repos/<owner>/<repo>/git/ref/heads/<branch>
+    PATCH /repos/<owner>/<repo>/git/refs/heads/<branch>   (force=false で早送りでなければ 422)
+    GET   /repos/<owner>/<repo>/git/commits/<sha>
+    POST  /repos/<owner>/<repo>/git/commits
+    GET   /repos/<owner>/<repo>/git/trees/<sha>?recursive=1  (コミット SHA ならそのツリー)
+    POST  /repos/<owner>/<repo>/git/trees                  (base_tree 対応)
+    POST  /repos/<owner>/<repo>/git/blobs                  (encoding=base64 / utf-8)
+    GET   /repos/<owner>/<repo>/contents/<path>
+    PUT   /repos/<owner>/<repo>/contents/<path>            (sha が古ければ 409)
+
+ツリーはディレクトリを持たない {パス: blob SHA} の平らな形で持つ。blob の SHA は git と同じ計算、
+ツリーとコミットの SHA は内容の JSON から作る。race_ref_updates を N にすると、次の N 回の
+ref 更新の直前に別のコミットを割り込ませ、競合時のやり直しを再現する。
+
+    with FakeGitHub({"data/linkMapping.json": "{}"}, latency=0.05) as gh:
+        committer = GitHubCommitter("owner", "repo", "main", "token", api_url=gh.url)
+"""
+
+import base64
+import hashlib
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+def blob_sha(data: bytes) -> str:
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def object_sha(kind: str, obj) -> str:
+    return hashlib.sha1(kind.encode() + json.dumps(obj, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class FakeGitHub:
+    """
+    files: 初期コミットの {パス: 内容(str / bytes)}
+    """
+
+    def __init__(self, files: dict, branch: str = "main", latency: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.branch = branch
+        self.latency = latency
+        self.race_ref_updates = 0
+        self.blobs = {}     # SHA -> bytes
+        self.trees = {}     # SHA -> {パス: blob SHA}
+        self.commits = {}   # SHA -> {"tree", "parents", "message"}
+        self.head = None
+        self.stats = {"requests": 0, "commits": 0, "blobs": 0, "ref_conflicts": 0}
+        self._lock = threading.Lock()
+        self.push(files, "Initial commit")
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ---- オブジェクト ----
+
+    def _put_blob(self, data: bytes) -> str:
+        sha = blob_sha(data)
+        self.blobs[sha] = data
+        return sha
+
+    def _put_tree(self, entries: dict) -> str:
+        sha = object_sha("tree", entries)
+        self.trees[sha] = dict(entries)
+        return sha
+
+    def _put_commit(self, tree: str, parents: list, message: str) -> str:
+        commit = {"tree": tree, "parents": list(parents), "message": message}
+        sha = object_sha("commit", commit)
+        self.commits[sha] = commit
+        return sha
+
+    def files(self, commit_sha: str = None) -> dict:
+        """コミット (省略時はブランチ先頭) の {パス: 内容(bytes)}"""
+        tree = self.trees[self.commits[commit_sha or self.head]["tree"]]
+        return {path: self.blobs[sha] for path, sha in tree.items()}
+
+    def push(self, files: dict, message: str) -> str:
+        """サーバ側で直接コミットしてブランチを進める (別の人のコミットの代わり)"""
+        with self._lock:
+            entries = dict(self.trees[self.commits[self.head]["tree"]]) if self.head else {}
+            for path, content in files.items():
+                entries[path] = self._put_blob(content.encode("utf-8") if isinstance(content, str) else content)
+            self.head = self._put_commit(self._put_tree(entries), [self.head] if self.head else [], message)
+            self.stats["commits"] += 1
+            return self.head
+
+    def _make_handler(self):
+        gh = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            wbufsize = -1
+
+            def setup(self):
+                super().setup()
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body):
+                payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _parse(self):
+                # 遅延はロックの外で入れる (並行リクエストが直列にならないように)
+                if gh.latency:
+                    time.sleep(gh.latency)
+                with gh._lock:
+                    gh.stats["requests"] += 1
+                parts = urlsplit(self.path)
+                query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+                # /repos/<owner>/<repo>/<rest>
+                segments = parts.path.strip("/").split("/", 3)
+                rest = unquote(segments[3]) if len(segments) == 4 and segments[0] == "repos" else ""
+                body = {}
+                length = int(self.headers.get("Content-Length", 0))
+                if length:
+                    body = json.loads(self.rfile.read(length))
+                return rest, query, body
+
+            def do_GET(self):
+                rest, _, _ = self._parse()
+                with gh._lock:
+                    if rest == f"git/ref/heads/{gh.branch}":
+                        return self._send(200, {"ref": f"refs/heads/{gh.branch}",
+                                                "object": {"sha": gh.head, "type": "commit"}})
+                    if rest.startswith("git/commits/"):
+                        commit = gh.commits.get(rest[len("git/commits/"):])
+                        if commit is None:
+                            return self._send(404, {"message": "Not Found"})
+                        return self._send(200, {"sha": rest[len("git/commits/"):],
+                                                "tree": {"sha": commit["tree"]},
+                                                "parents": [{"sha": p} for p in commit["parents"]],
+                                                "message": commit["message"]})
+                    if rest.startswith("git/trees/"):
+                        sha = rest[len("git/trees/"):]
+                        if sha in gh.commits:
+                            # GitHub と同じく、コミット SHA ならそのツリーを返す
+                            sha = gh.commits[sha]["tree"]
+                        tree = gh.trees.get(sha)
+                        if tree is None:
+                            return self._send(404, {"message": "Not Found"})
+                        entries = [{"path": p, "mode": "100644", "type": "blob", "sha": s,
+                                    "size": len(gh.blobs[s])} for p, s in sorted(tree.items())]
+                        return self._send(200, {"sha": sha, "tree": entries, "truncated": False})
+                    if rest.startswith("contents/"):
+                        path = rest[len("contents/"):]
+                        sha = gh.trees[gh.commits[gh.head]["tree"]].get(path)
+                        if sha is None:
+                            return self._send(404, {"message": "Not Found"})
+                        return self._send(200, {"path": path, "sha": sha, "encoding": "base64",
+                                                "content": base64.b64encode(gh.blobs[sha]).decode("ascii")})
+                return self._send(404, {"message": "Not Found"})
+
+            def do_POST(self):
+                rest, _, body = self._parse()
+                with gh._lock:
+                    if rest == "git/blobs":
+                        if body.get("encoding") == "base64":
+                            data = base64.b64decode(body["content"])
+                        else:
+                            data = body["content"].encode("utf-8")
+                        gh.stats["blobs"] += 1
+                        return self._send(201, {"sha": gh._put_blob(data)})
+                    if rest == "git/trees":
+                        entries = dict(gh.trees.get(body.get("base_tree"), {}))
+                        for entry in body["tree"]:
+                            if entry.get("sha") is None:
+                                entries.pop(entry["path"], None)
+                            elif entry["sha"] not in gh.blobs:
+                                return self._send(422, {"message": "tree.sha is not a valid blob"})
+                            else:
+                                entries[entry["path"]] = entry["sha"]
+                        return self._send(201, {"sha": gh._put_tree(entries)})
+                    if rest == "git/commits":
+                        if body["tree"] not in gh.trees:
+                            return self._send(422, {"message": "Tree SHA does not exist"})
+                        sha = gh._put_commit(body["tree"], body.get("parents", []), body["message"])
+                        return self._send(201, {"sha": sha, "tree": {"sha": body["tree"]}})
+                return self._send(404, {"message": "Not Found"})
+
+            def do_PATCH(self):
+                rest, _, body = self._parse()
+                if rest != f"git/refs/heads/{gh.branch}":
+                    return self._send(404, {"message": "Not Found"})
+                if gh.race_ref_updates > 0:
+                    gh.race_ref_updates -= 1
+                    gh.push({"README.md": f"concurrent edit {time.time()}"}, "Concurrent commit")
+                with gh._lock:
+                    commit = gh.commits.get(body["sha"])
+                    if commit is None:
+                        return self._send(422, {"message": "Object does not exist"})
+                    if not body.get("force") and gh.head not in commit["parents"]:
+                        gh.stats["ref_conflicts"] += 1
+                        return self._send(422, {"message": "Update is not a fast forward"})
+                    gh.head = body["sha"]
+                    gh.stats["commits"] += 1
+                    return self._send(200, {"ref": f"refs/heads/{gh.branch}",
+                                            "object": {"sha": gh.head, "type": "commit"}})
+
+            def do_PUT(self):
+                rest, _, body = self._parse()
+                if not rest.startswith("contents/"):
+                    return self._send(404, {"message": "Not Found"})
+                path = rest[len("contents/"):]
+                with gh._lock:
+                    entries = dict(gh.trees[gh.commits[gh.head]["tree"]])
+                    if entries.get(path) != body.get("sha"):
+                        return self._send(409, {"message": f"{path} does not match {body.get('sha')}"})
+                    entries[path] = gh._put_blob(base64.b64decode(body["content"]))
+                    gh.head = gh._put_commit(gh._put_tree(entries), [gh.head], body["message"])
+                    gh.stats["commits"] += 1
+                    return self._send(201, {"content": {"path": path, "sha": entries[path]},
+                                            "commit": {"sha": gh.head}})
+
+        return Handler
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ベンチマーク用のローカル WordPress REST API もどき。
+
+本番サイトに触れずにスクリプトのスループットを測るためのもので、
+以下のエンドポイントだけを実装している:
+
+    GET  /wp-json/wp/v2/posts?page=N&per_page=M   (X-WP-Total / X-WP-TotalPages 付き, _fields / include / modified_after 対応)
+    GET  /wp-json/wp/v2/posts/<id>?context=edit   (content.raw を返す)
+    POST /wp-json/wp/v2/posts/<id>                (JSON の content で本文を更新)
+    GET  /media/column/<id>                       (公開ページの HTML。ETag / If-None-Match 対応)
+
+latency を指定すると各リクエストの応答をその秒数だけ遅らせ、実サイトの往復時間を模擬する。
+HTTP/1.1 keep-alive に対応し、受け付けた TCP 接続数も stats に記録する。
+
+    with FakeWordPress(posts, latency=0.02) as wp:
+        requests.get(f"{wp.url}/wp-json/wp/v2/posts/1?context=edit")
+"""
+
+import hashlib
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+POSTS_PREFIX = "/wp-json/wp/v2/posts"
+PAGE_PREFIX = "/media/column/"
+
+# 公開ページのテーマ部分 (ヘッダ・サイドバー・フッタのナビゲーションリンク)
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html><head><title>{title}</title></head><body>
+<header><nav><a href="/">トップ</a> <a href="/media/column/">コラム一覧</a></nav></header>
+<article class="entry-content">
+{content}
+</article>
+<aside><a href="/media/column/1">人気記事</a></aside>
+<footer><a href="/privacy">プライバシーポリシー</a></footer>
+</body></html>
+"""
+
+
+def filter_fields(data: dict, fields: str) -> dict:
+    """_fields=id,content.raw のような指定 (ネスト対応) で返すキーを絞る"""
+    out = {}
+    for field in fields.split(","):
+        head, _, rest = field.partition(".")
+        if head not in data:
+            continue
+        if rest and isinstance(data[head], dict):
+            out.setdefault(head, {}).update(filter_fields(data[head], rest))
+        else:
+            out[head] = data[head]
+    return out
+
+
+class FakeWordPress:
+    """
+    posts: {post_id(int): {"content": 本文(raw), "link": URL, "title": タイトル}, ...}
+    """
+
+    def __init__(self, posts: dict, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.posts = {int(pid): dict(p) for pid, p in posts.items()}
+        self.latency = latency
+        self.stats = {"requests": 0, "connections": 0, "gets": 0, "updates": 0, "bytes_sent": 0,
+                      "not_modified": 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def _post_json(self, pid, context):
+        p = self.posts[pid]
+        data = {
+            "id": pid,
+            "link": p.get("link", f"http://example.invalid/media/column/{pid}"),
+            "title": {"rendered": p.get("title", f"post {pid}")},
+            "modified_gmt": p.get("modified_gmt", "2024-01-01T00:00:00"),
+            "status": p.get("status", "publish"),
+            "content": {"rendered": p["content"]},
+        }
+        if context == "edit":
+            data["content"]["raw"] = p["content"]
+        return data
+
+    def _make_handler(self):
+        wp = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # ヘッダと本文を1回で送る (分割送信だと Nagle と遅延ACKで 40ms 待たされる)
+            wbufsize = -1
+
+            def setup(self):
+                super().setup()
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                wp._count("connections")
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, headers=None, content_type="application/json; charset=UTF-8"):
+                if isinstance(body, bytes):
+                    payload = body
+                else:
+                    payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                if wp.latency:
+                    time.sleep(wp.latency)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, str(v))
+                self.end_headers()
+                self.wfile.write(payload)
+                wp._count("bytes_sent", len(payload))
+
+            def _route(self):
+                parts = urlsplit(self.path)
+                query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+                if not parts.path.startswith(POSTS_PREFIX):
+                    return None, None, query
+                rest = parts.path[len(POSTS_PREFIX):].strip("/")
+                if not rest:
+                    return "list", None, query
+                try:
+                    return "item", int(rest), query
+                except ValueError:
+                    return None, None, query
+
+            def _send_page(self, pid):
+                p = wp.posts[pid]
+                html = PAGE_TEMPLATE.format(title=p.get("title", f"post {pid}"), content=p["content"])
+                payload = html.encode("utf-8")
+                etag = '"' + hashlib.md5(payload).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    wp._count("not_modified")
+                    return self._send(304, b"", {"ETag": etag})
+                return self._send(200, payload, {"ETag": etag}, content_type="text/html; charset=UTF-8")
+
+            def do_GET(self):
+                wp._count("requests")
+                wp._count("gets")
+                path = urlsplit(self.path).path
+                if path.startswith(PAGE_PREFIX):
+                    try:
+                        pid = int(path[len(PAGE_PREFIX):].strip("/"))
+                    except ValueError:
+                        pid = None
+                    if pid in wp.posts:
+                        return self._send_page(pid)
+                    return self._send(404, b"not found", content_type="text/plain")
+                kind, pid, query = self._route()
+                if kind == "item" and pid in wp.posts:
+                    return self._send(200, wp._post_json(pid, query.get("context")))
+                if kind == "list":
+                    per_page = int(query.get("per_page", 10))
+                    page = int(query.get("page", 1))
+                    ids = sorted(wp.posts, reverse=True)
+                    if "include" in query:
+                        wanted = {int(x) for x in query["include"].split(",") if x}
+                        ids = [i for i in ids if i in wanted]
+                    if "modified_after" in query:
+                        ids = [i for i in ids
+                               if wp.posts[i].get("modified_gmt", "2024-01-01T00:00:00") > query["modified_after"]]
+                    total_pages = max(1, -(-len(ids) // per_page))
+                    if page > total_pages:
+                        return self._send(400, {"code": "rest_post_invalid_page_number"})
+                    chunk = ids[(page - 1) * per_page: page * per_page]
+                    body = [wp._post_json(i, query.get("context")) for i in chunk]
+                    if "_fields" in query:
+                        body = [filter_fields(b, query["_fields"]) for b in body]
+                    return self._send(200, body, {"X-WP-Total": len(ids), "X-WP-TotalPages": total_pages})
+                return self._send(404, {"code": "rest_post_invalid_id"})
+
+            def do_POST(self):
+                wp._count("requests")
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                kind, pid, _ = self._route()
+                if kind != "item" or pid not in wp.posts:
+                    return self._send(404, {"code": "rest_post_invalid_id"})
+                if "content" in body:
+                    with wp._lock:
+                        wp.posts[pid]["content"] = body["content"]
+                wp._count("updates")
+                return self._send(200, wp._post_json(pid, "edit"))
+
+        return Handler
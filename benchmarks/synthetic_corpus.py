@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ベンチマーク用の WordPress 風の日本語記事とキーワードマップを、シードから決定的に生成する。
+
+本文は Gutenberg のブロックコメント (<!-- wp:paragraph --> など) で区切った見出し・段落・リストで、
+リンク挿入で飛ばすべき箇所 (既存の <a>・ショートコード・HTML 属性・ブロックコメントの中) にも
+キーワードを混ぜる。キーワードのリンク先は記事自身の URL と重なるもの (自記事へのリンク) も含む。
+
+    from synthetic_corpus import make_corpus
+    corpus = make_corpus(posts=1000, keywords=2000, post_chars=8000, seed=42)
+    corpus.posts          # {記事ID(int): {"content", "link", "title", "modified_gmt"}} (FakeWordPress にそのまま渡せる)
+    corpus.articles       # articles.json と同じ形 [{"id", "title", "url", "modified"}]
+    corpus.link_mapping   # linkMapping.json と同じカテゴリ分けされた {カテゴリ: {キーワード: URL}}
+
+    python benchmarks/synthetic_corpus.py --posts 3 --keywords 20 --post-chars 1500   # 生成例を表示
+"""
+
+import argparse
+import json
+import random
+from collections import namedtuple
+
+SITE_URL = "https://good-apps.jp"
+COLUMN_PATH = "/media/column/"
+
+CATEGORIES = ["格安SIM", "ポイ活", "ゲーム", "動画配信", "キャッシュレス", "家計簿", "学習", "写真編集"]
+NOUNS = ["スマホ", "アプリ", "料金", "キャンペーン", "ポイント", "回線", "端末", "プラン", "設定", "画面",
+         "通知", "保存", "動画", "写真", "家族", "月額", "無料期間", "特典", "評判", "口コミ", "初心者", "上級者"]
+ADJECTIVES = ["おすすめの", "人気の", "無料の", "お得な", "便利な", "簡単な", "最新の", "安全な"]
+PARTICLES = ["の", "は", "を", "が", "で", "に", "と", "も"]
+ENDINGS = ["です。", "ます。", "でしょう。", "しましょう。", "ください。", "なります。", "できます。"]
+KANA = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをん"
+KEYWORD_SUFFIXES = ["アプリ", "おすすめ", "比較", "使い方", "ランキング", "料金", "評判", "やり方", "始め方", "解約"]
+
+SyntheticCorpus = namedtuple("SyntheticCorpus", ["posts", "articles", "link_mapping"])
+
+
+def column_url(post_id: int, site: str = SITE_URL) -> str:
+    return f"{site}{COLUMN_PATH}{post_id}"
+
+
+def make_keywords(n: int, rng) -> list:
+    """重複しない日本語キーワード (カタカナ・ひらがな・漢字混じり) を n 件"""
+    keywords = set()
+    while len(keywords) < n:
+        head = rng.choice(CATEGORIES + NOUNS)
+        middle = "".join(rng.choice(KANA) for _ in range(rng.randint(0, 3)))
+        keywords.add(head + middle + rng.choice(KEYWORD_SUFFIXES))
+    return sorted(keywords)
+
+
+def make_link_mapping(keywords: list, posts: int, rng, site: str = SITE_URL) -> dict:
+    """キーワードをカテゴリに分け、それぞれ記事 1..posts のどれかへのリンクにする"""
+    mapping = {category: {} for category in CATEGORIES}
+    for kw in keywords:
+        mapping[rng.choice(CATEGORIES)][kw] = column_url(rng.randint(1, posts), site)
+    return {category: kws for category, kws in mapping.items() if kws}
+
+
+def _sentence(rng, keywords, hit_rate: float) -> str:
+    words = []
+    for _ in range(rng.randint(3, 7)):
+        if keywords and rng.random() < hit_rate:
+            words.append(rng.choice(keywords))
+        else:
+            words.append(rng.choice(ADJECTIVES) + rng.choice(NOUNS) if rng.random() < 0.3 else rng.choice(NOUNS))
+        words.append(rng.choice(PARTICLES))
+    return "".join(words[:-1]) + rng.choice(ENDINGS)
+
+
+def _paragraph(rng, keywords, hit_rate, posts, site):
+    text = "".join(_sentence(rng, keywords, hit_rate) for _ in range(rng.randint(2, 5)))
+    roll = rng.random()
+    if roll < 0.25:
+        # 既存の内部リンク (アンカーテキストにキーワードが入っていることもある)
+        anchor = rng.choice(keywords) if keywords and rng.random() < 0.5 else rng.choice(NOUNS) + "の記事"
+        href = f"{COLUMN_PATH}{rng.randint(1, posts)}" if rng.random() < 0.7 else column_url(rng.randint(1, posts), site)
+        text += f'詳しくは<a href="{href}">{anchor}</a>をご覧ください。'
+    elif roll < 0.35:
+        text += f'<strong>{_sentence(rng, keywords, hit_rate)}</strong>'
+    elif roll < 0.45:
+        # 外部リンク・属性の中のキーワード (リンク化してはいけない)
+        title = rng.choice(keywords) if keywords else "外部"
+        text += f'<a href="https://example.com/?q={rng.randint(1, 999)}" title="{title}" target="_blank" rel="noopener">公式サイト</a>'
+    return f"<!-- wp:paragraph -->\n<p>{text}</p>\n<!-- /wp:paragraph -->\n\n"
+
+
+def _heading(rng, keywords, hit_rate):
+    text = (rng.choice(keywords) if keywords and rng.random() < hit_rate * 3 else rng.choice(NOUNS)) + "について"
+    return f'<!-- wp:heading -->\n<h2 class="wp-block-heading">{text}</h2>\n<!-- /wp:heading -->\n\n'
+
+
+def _list(rng, keywords, hit_rate):
+    items = "".join(f"<li>{_sentence(rng, keywords, hit_rate)}</li>" for _ in range(rng.randint(2, 5)))
+    return f"<!-- wp:list -->\n<ul>{items}</ul>\n<!-- /wp:list -->\n\n"
+
+
+def _shortcode(rng, keywords):
+    kw = rng.choice(keywords) if keywords else "画像"
+    kind = rng.randrange(4)
+    if kind == 0:
+        return (f'<!-- wp:shortcode -->\n[caption id="attachment_{rng.randint(1, 9999)}" align="aligncenter"]'
+                f'<img src="/wp-content/uploads/{rng.randint(1, 999)}.png" alt="{kw}" /> {kw}の画面[/caption]\n'
+                f'<!-- /wp:shortcode -->\n\n')
+    if kind == 1:
+        return f'<!-- wp:shortcode -->\n[toc]\n<!-- /wp:shortcode -->\n\n'
+    if kind == 2:
+        return (f'<!-- wp:shortcode -->\n[app_box id="{rng.randint(100, 999)}" name="{kw}"]\n'
+                f'<!-- /wp:shortcode -->\n\n')
+    # ブロックコメントの属性 (JSON) の中のキーワード
+    return (f'<!-- wp:group {{"className":"box","metadata":{{"name":"{kw}"}}}} -->\n'
+            f'<div class="wp-block-group box"><p>{rng.choice(NOUNS)}のポイント</p></div>\n<!-- /wp:group -->\n\n')
+
+
+def make_post(post_id: int, post_chars: int, keywords: list, rng, posts: int, site: str = SITE_URL,
+              hit_rate: float = 0.02) -> str:
+    """約 post_chars 文字の本文。hit_rate は地の文の単語がキーワードになる割合"""
+    blocks, size = [], 0
+    while size < post_chars:
+        roll = rng.random()
+        if roll < 0.12:
+            block = _heading(rng, keywords, hit_rate)
+        elif roll < 0.22:
+            block = _list(rng, keywords, hit_rate)
+        elif roll < 0.3:
+            block = _shortcode(rng, keywords)
+        else:
+            block = _paragraph(rng, keywords, hit_rate, posts, site)
+        blocks.append(block)
+        size += len(block)
+    return "".join(blocks)
+
+
+def make_corpus(posts: int, keywords: int, post_chars: int = 8000, seed: int = 42,
+                site: str = SITE_URL, hit_rate: float = 0.02) -> SyntheticCorpus:
+    rng = random.Random(seed)
+    kws = make_keywords(keywords, rng)
+    link_mapping = make_link_mapping(kws, posts, rng, site)
+    post_map, articles = {}, []
+    for pid in range(1, posts + 1):
+        title = f"{rng.choice(ADJECTIVES)}{rng.choice(NOUNS)}{rng.choice(KEYWORD_SUFFIXES)}まとめ {pid}"
+        modified = f"2024-{1 + pid % 12:02d}-{1 + pid % 28:02d}T00:00:00"
+        post_map[pid] = {"content": make_post(pid, post_chars, kws, rng, posts, site, hit_rate),
+                         "link": column_url(pid, site), "title": title, "modified_gmt": modified}
+        articles.append({"id": str(pid), "title": title, "url": column_url(pid, site), "modified": modified})
+    return SyntheticCorpus(post_map, articles, link_mapping)
+
+
+def rebase_url(url: str, site: str, new_site: str) -> str:
+    """site で始まる URL を new_site に付け替える (FakeWordPress の URL で数えるとき用)"""
+    return new_site + url[len(site):] if url.startswith(site) else url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=3)
+    parser.add_argument("--keywords", type=int, default=20)
+    parser.add_argument("--post-chars", type=int, default=1500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    corpus = make_corpus(args.posts, args.keywords, args.post_chars, args.seed)
+    print(json.dumps(corpus.link_mapping, ensure_ascii=False, indent=2))
+    for pid, post in corpus.posts.items():
+        print(f"===== post {pid}: {post['title']} ({post['link']})")
+        print(post["content"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+WordPress 投稿本文 (content.raw) を 1 回の走査でセグメントに分割する。
+
+セグメントは (種別, 開始位置, 終了位置) で表し、本文文字列はコピーしない。
+キーワードのリンク化は TEXT セグメントの範囲だけを対象にし、
+最後に build_linked_content() で 1 回の join により組み立て直す。
+既存リンクを外すとき (build_unlinked_content) も同じく 1 回の join で組み立てる。
+そのため __ANCHOR_0__ のようなプレースホルダは使わず、
+本文中に同じ文字列が書かれていても衝突しない。
+"""
+
+import re
+
+TEXT      = "text"       # リンク化してよい地の文
+TAG       = "tag"        # <p> や <img ...> などの HTML タグ
+ANCHOR    = "anchor"     # 既存リンク <a ...>...</a> (中身ごと)
+SHORTCODE = "shortcode"  # [caption ...] などのショートコード
+COMMENT   = "comment"    # <!-- wp:paragraph --> などの Gutenberg ブロックコメント
+RAW       = "raw"        # <script> / <style> の中身ごと
+
+_TOKEN_RE = re.compile(
+    r"""
+      (?P<comment><!--.*?-->)
+    | (?P<anchor><a\b[^>]*>.*?</a\s*>)
+    | (?P<raw><(?P<raw_name>script|style)\b[^>]*>.*?</(?P=raw_name)\s*>)
+    | (?P<tag></?[A-Za-z][^>]*>)
+    | (?P<shortcode>\[[^\]\n]*\])
+    """,
+    re.IGNORECASE | re.DOTALL | re.VERBOSE,
+)
+
+_KINDS = {
+    "comment": COMMENT,
+    "anchor": ANCHOR,
+    "raw": RAW,
+    "tag": TAG,
+    "shortcode": SHORTCODE,
+}
+
+
+def iter_segments(content: str):
+    """本文を先頭から順に (種別, 開始位置, 終了位置) へ分割する"""
+    pos = 0
+    for m in _TOKEN_RE.finditer(content):
+        start, end = m.span()
+        if start > pos:
+            yield TEXT, pos, start
+        yield _KINDS[m.lastgroup], start, end
+        pos = end
+    if pos < len(content):
+        yield TEXT, pos, len(content)
+
+
+def iter_text_spans(content: str):
+    """リンク化の対象になる TEXT セグメントの (開始位置, 終了位置) だけを返す"""
+    for kind, start, end in iter_segments(content):
+        if kind == TEXT:
+            yield start, end
+
+
+def build_linked_content(content: str, links) -> str:
+    """
+    links: [(開始位置, 終了位置, URL), ...] (互いに重ならないこと)
+    content の該当範囲を <a href="URL">...</a> で囲んだ本文を 1 回の join で組み立てる。
+    """
+    if not links:
+        return content
+    parts = []
+    pos = 0
+    for start, end, url in sorted(links):
+        parts.append(content[pos:start])
+        parts.append(f'<a href="{url}">')
+        parts.append(content[start:end])
+        parts.append("</a>")
+        pos = end
+    parts.append(content[pos:])
+    return "".join(parts)
+
+
+def anchor_inner_span(content: str, start: int, end: int):
+    """ANCHOR セグメント content[start:end] のうち、<a ...> と </a> に挟まれた中身の (開始位置, 終了位置)"""
+    return content.index(">", start, end) + 1, content.rindex("<", start, end)
+
+
+def build_unlinked_content(content: str, anchors) -> str:
+    """
+    anchors: [(開始位置, 終了位置), ...] (ANCHOR セグメントの範囲。互いに重ならないこと)
+    該当する <a ...>...</a> を外して中身 (リンクテキスト) だけを残した本文を 1 回の join で組み立てる。
+    """
+    if not anchors:
+        return content
+    parts = []
+    pos = 0
+    for start, end in sorted(anchors):
+        inner_start, inner_end = anchor_inner_span(content, start, end)
+        parts.append(content[pos:start])
+        parts.append(content[inner_start:inner_end])
+        pos = end
+    parts.append(content[pos:])
+    return "".join(parts)
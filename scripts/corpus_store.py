@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+記事本文のローカルスナップショット (SQLite)。
+
+articles.json の各記事について
+    id / URL / 更新日時 (modified_gmt) / 本文 (content.raw) / 本文中のリンク数 (content.rendered から)
+を1ファイルに保存し、WordPress に問い合わせずに本文を読めるようにする。
+
+- 同期 (sync_corpus) は articles.json の modified が保存済みのものと違う記事だけを
+  REST API の include で100件ずつ取得する (初回以外は差分のみ)
+- 読み出しは SQLite の mmap (PRAGMA mmap_size) 経由の主キー検索で、記事1件あたり数十µs
+- insert_links.py / detect_link_usage.py / ドライランのプレビューが --corpus で使う
+
+    python scripts/corpus_store.py            # 差分同期
+    python scripts/corpus_store.py --full     # 全記事を取り直す
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from http_client import create_session, print_metrics_summary
+from link_urls import count_links
+from wp_pipeline import DEFAULT_RATE_PER_HOST, DEFAULT_WORKERS, HostRateLimiter
+
+CORPUS_PATH = os.path.join(".cache", "corpus.sqlite3")
+ARTICLES_JSON = os.path.join("data", "articles.json")
+SCHEMA_VERSION = 1                # テーブル構成を変えたら上げる (古いスナップショットは作り直す)
+MMAP_SIZE = 256 * 1024 * 1024     # 読み出しに使う mmap の上限 (バイト)
+SYNC_BATCH_SIZE = 100             # /wp/v2/posts の per_page の上限
+SYNC_FIELDS = "id,link,modified_gmt,content.raw,content.rendered"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    id       TEXT PRIMARY KEY,
+    url      TEXT NOT NULL,
+    modified TEXT NOT NULL,
+    content  TEXT NOT NULL,
+    links    TEXT NOT NULL,
+    synced   REAL NOT NULL
+)
+"""
+
+
+def _is_fresh(stored_modified: str, modified) -> bool:
+    if modified is None:
+        return True
+    return bool(modified) and stored_modified == modified
+
+
+class CorpusStore:
+    """記事本文のスナップショット。複数スレッドから使えるよう1本の接続をロックで守る"""
+
+    def __init__(self, path=CORPUS_PATH):
+        self.path = path
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            if version:
+                print(f"[INFO] Corpus {path} has schema version {version}. Rebuilding.")
+            self._conn.execute("DROP TABLE IF EXISTS posts")
+            self._conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+    def get(self, post_id: str):
+        """{"id", "url", "modified", "content", "links"} を返す。無ければ None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, url, modified, content, links FROM posts WHERE id = ?", (str(post_id),)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"id": row[0], "url": row[1], "modified": row[2], "content": row[3],
+                "links": json.loads(row[4])}
+
+    def get_content(self, post_id: str, modified: str = None):
+        """
+        本文 (content.raw) を返す。無ければ None。
+        modified を渡した場合、保存済みの更新日時と一致しなければ (スナップショットが古いか
+        更新日時が不明なので) None。
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT modified, content FROM posts WHERE id = ?", (str(post_id),)
+            ).fetchone()
+        return row[1] if row and _is_fresh(row[0], modified) else None
+
+    def get_links(self, post_id: str, modified: str = None):
+        """本文中のリンク数 {正規化URL: 回数} を返す。modified の扱いは get_content() と同じ"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT modified, links FROM posts WHERE id = ?", (str(post_id),)
+            ).fetchone()
+        return json.loads(row[1]) if row and _is_fresh(row[0], modified) else None
+
+    def modified_map(self) -> dict:
+        """{記事ID: 保存済みの更新日時}"""
+        with self._lock:
+            return dict(self._conn.execute("SELECT id, modified FROM posts"))
+
+    def url_map(self) -> dict:
+        """{記事ID: 記事URL}"""
+        with self._lock:
+            return dict(self._conn.execute("SELECT id, url FROM posts"))
+
+    def links_map(self) -> dict:
+        """{記事ID: 本文中のリンク数 {正規化URL: 回数}}"""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, links FROM posts").fetchall()
+        return {post_id: json.loads(links) for post_id, links in rows}
+
+    def iter_posts(self):
+        """保存済みの全記事を ID 順に {"id", "url", "modified", "content"} で返す"""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, url, modified, content FROM posts ORDER BY id").fetchall()
+        for post_id, url, modified, content in rows:
+            yield {"id": post_id, "url": url, "modified": modified, "content": content}
+
+    def stale_articles(self, articles) -> list:
+        """未保存、または articles.json の modified が保存済みと違う (か不明な) 記事"""
+        stored = self.modified_map()
+        return [a for a in articles
+                if a["id"] not in stored or not a.get("modified") or stored[a["id"]] != a["modified"]]
+
+    def upsert_many(self, posts):
+        """posts: [{"id", "url", "modified", "content", "links"}, ...] を1トランザクションで保存する"""
+        now = time.time()
+        rows = [(str(p["id"]), p["url"], p["modified"], p["content"],
+                 json.dumps(p["links"], ensure_ascii=False, separators=(",", ":")), now) for p in posts]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO posts (id, url, modified, content, links, synced) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def mark_stale(self, post_id: str):
+        """WordPress 側を更新した記事の更新日時を消し、次回の同期で取り直させる"""
+        with self._lock:
+            self._conn.execute("UPDATE posts SET modified = '' WHERE id = ?", (str(post_id),))
+            self._conn.commit()
+
+    def prune(self, live_ids) -> int:
+        """articles.json から消えた記事を削除し、削除件数を返す"""
+        live_ids = set(live_ids)
+        with self._lock:
+            gone = [pid for (pid,) in self._conn.execute("SELECT id FROM posts") if pid not in live_ids]
+            self._conn.executemany("DELETE FROM posts WHERE id = ?", [(pid,) for pid in gone])
+            self._conn.commit()
+        return len(gone)
+
+
+def fetch_corpus_batch(session, wp_url: str, auth_headers: dict, batch: list) -> list:
+    """
+    REST API の include で最大 SYNC_BATCH_SIZE 件の本文 (raw / rendered) と更新日時をまとめて取得し、
+    CorpusStore.upsert_many() に渡せる形で返す。
+    """
+    params = {
+        "include": ",".join(a["id"] for a in batch),
+        "per_page": len(batch),
+        "context": "edit",
+        "_fields": SYNC_FIELDS,
+    }
+    resp = session.get(f"{wp_url}/wp-json/wp/v2/posts", headers=auth_headers, params=params)
+    if resp.status_code != 200:
+        print(f"[WARN] Batch of {len(batch)} posts returned HTTP {resp.status_code}")
+        return []
+    urls = {a["id"]: a["url"] for a in batch}
+    posts = []
+    for p in resp.json():
+        post_id = str(p.get("id"))
+        content = p.get("content", {})
+        url = urls.get(post_id) or p.get("link", "")
+        posts.append({
+            "id": post_id,
+            "url": url,
+            "modified": p.get("modified_gmt") or "",
+            "content": content.get("raw", ""),
+            "links": count_links(content.get("rendered", ""), base_url=url),
+        })
+    return posts
+
+
+def sync_corpus(store, articles, wp_url: str, auth_headers: dict,
+                workers=DEFAULT_WORKERS, rate=DEFAULT_RATE_PER_HOST, full=False) -> dict:
+    """
+    スナップショットを articles に合わせて更新する。
+    full でなければ、未保存か modified の変わった記事だけを取得する。
+    戻り値: {"total", "fetched", "failed", "pruned", "elapsed"}
+    """
+    started = time.perf_counter()
+    todo = list(articles) if full else store.stale_articles(articles)
+    batches = [todo[i:i + SYNC_BATCH_SIZE] for i in range(0, len(todo), SYNC_BATCH_SIZE)]
+    session = create_session(pool_size=max(1, workers))
+    limiter = HostRateLimiter(rate)
+
+    def fetch(batch):
+        limiter.wait(wp_url)
+        return fetch_corpus_batch(session, wp_url, auth_headers, batch)
+
+    fetched = 0
+    with ThreadPoolExecutor(max(1, workers), thread_name_prefix="corpus") as pool:
+        futures = [pool.submit(fetch, batch) for batch in batches]
+        for fut in as_completed(futures):
+            try:
+                posts = fut.result()
+            except Exception as e:
+                print(f"[ERROR] Corpus batch failed: {e}")
+                continue
+            store.upsert_many(posts)
+            fetched += len(posts)
+
+    pruned = store.prune(a["id"] for a in articles)
+    return {
+        "total": len(articles),
+        "fetched": fetched,
+        "failed": len(todo) - fetched,
+        "pruned": pruned,
+        "elapsed": time.perf_counter() - started,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="記事本文のローカルスナップショットを更新する")
+    parser.add_argument("--path", default=CORPUS_PATH, help="スナップショットの SQLite ファイル")
+    parser.add_argument("--full", action="store_true", help="差分ではなく全記事を取り直す")
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get("CORPUS_WORKERS", DEFAULT_WORKERS)),
+                        help="並行に取得するバッチ数")
+    parser.add_argument("--rate", type=float,
+                        default=float(os.environ.get("CORPUS_RATE", DEFAULT_RATE_PER_HOST)),
+                        help="WordPress への最大リクエスト数/秒 (0 で無制限)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    # insert_links は本モジュールを読み込むので、循環しないようここで読み込む
+    from insert_links import get_auth_headers, load_json
+
+    args = parse_args(argv)
+    wp_url = os.environ.get("WP_URL", "")
+    wp_username = os.environ.get("WP_USERNAME", "")
+    wp_password = os.environ.get("WP_PASSWORD", "")
+    if not (wp_url and wp_username and wp_password):
+        print("[ERROR] Missing WP credentials")
+        return
+
+    articles = load_json(ARTICLES_JSON)
+    if not articles:
+        print("[ERROR] articles.json is empty or missing")
+        return
+
+    with CorpusStore(args.path) as store:
+        stats = sync_corpus(store, articles, wp_url, get_auth_headers(wp_username, wp_password),
+                            workers=args.workers, rate=args.rate, full=args.full)
+        print(f"[INFO] Corpus synced: {len(store)} posts in {args.path} "
+              f"(fetched={stats['fetched']}, failed={stats['failed']}, pruned={stats['pruned']}, "
+              f"unchanged={stats['total'] - stats['fetched'] - stats['failed']}) in {stats['elapsed']:.1f}s")
+    print_metrics_summary()
+    return stats
+
+
+if __name__ == "__main__":
+    main()
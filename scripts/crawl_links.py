@@ -2,10 +2,17 @@
 # -*- coding: utf-8 -*-
 
 import os
+import sys
+import argparse
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util import Retry  # ← リトライ機能を使うために追加
+
+from http_client import DEFAULT_POOL_SIZE, RETRY_STATUS_CODES, create_session, print_metrics_summary
+from json_store import atomic_write_json
+from run_metrics import count, instrument_run, timed
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
@@ -13,86 +20,159 @@ HEADERS = {
 }
 
 ARTICLES_JSON_PATH = os.path.join("data", "articles.json")
+CRAWL_STATE_JSON_PATH = os.path.join("data", "crawlState.json")
 API_URL = "https://good-apps.jp/wp-json/wp/v2/posts"
 
+DEFAULT_PER_PAGE = 100             # WP REST API の上限
+DEFAULT_FIELDS = "id,link,title,modified_gmt"  # articles.json の生成に必要なフィールドだけ取得
+ID_ONLY_FIELDS = "id"              # 削除・非公開化の検出用 (IDだけの軽量な全件スイープ)
+CURSOR_OVERLAP = timedelta(days=1) # modified_after はサイトのローカル時刻で比較されるため余裕を持たせる
+WP_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+DEFAULT_WORKERS = 4
+MAX_PAGES = 100                    # 念のための上限 (超えた場合は警告を出す)
+
+def load_json(path: str, default):
+    """JSONを読み込む。ファイルが無ければ default を返す"""
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
 def save_json(data, path: str):
-    """JSONを指定パスに保存する"""
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    """JSONを指定パスに保存する (一時ファイルに書いてから置き換える)"""
+    atomic_write_json(data, path)
 
 def create_session_with_retries(
     total_retries=3,
     backoff_factor=1.0,
-    status_forcelist=(500, 502, 503, 504),
+    status_forcelist=RETRY_STATUS_CODES,
     read_timeout=30,
+    pool_size=DEFAULT_POOL_SIZE,
 ):
     """
     requests用セッションを生成し、リトライとタイムアウトを設定する。
+    (実体は http_client.create_session。Retry-After の尊重やメトリクス記録もそちらで行う)
     """
-    # リトライポリシーを定義
-    retries = Retry(
-        total=total_retries,
+    return create_session(
+        pool_size=pool_size,
+        total_retries=total_retries,
         backoff_factor=backoff_factor,
         status_forcelist=status_forcelist,
-        raise_on_status=False
-    )
-    # セッションを作成
-    session = requests.Session()
-    # HTTP(S)アダプタにリトライをセット
-    adapter = HTTPAdapter(max_retries=retries)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    # タイムアウトを指定するためのラッパを定義
-    # 例: session.get(url, timeout=(接続タイムアウト, 読み込みタイムアウト))
-    session.request = lambda *args, **kwargs: requests.Session.request(
-        session, *args, timeout=(5, read_timeout), **kwargs
+        endpoint_timeouts=(),
+        default_timeout=(5, read_timeout),
     )
-    return session
 
-def fetch_all_wp_posts(base_url: str, per_page=50, max_pages=10):
+def fetch_wp_page(session, base_url: str, page: int, per_page=DEFAULT_PER_PAGE, fields=DEFAULT_FIELDS,
+                  extra_params=None):
+    """
+    1ページ分の投稿を取得する。extra_params は modified_after 等の追加クエリ。
+    戻り値: (投稿リスト, X-WP-TotalPages) / 取得失敗なら (None, None)
+    400 / 404 は「ページなし」として ([], None) を返す。
+    """
+    params = {
+        "per_page": per_page,
+        "page": page
+    }
+    if fields:
+        # 必要なフィールドだけ返させて転送量を減らす
+        params["_fields"] = fields
+    if extra_params:
+        params.update(extra_params)
+
+    try:
+        with timed("fetch"):
+            resp = session.get(base_url, headers=HEADERS, params=params)
+    except requests.exceptions.RequestException as e:
+        print(f"[ERROR] Exception occurred while fetching page={page}: {e}")
+        return None, None
+
+    if resp.status_code in (400, 404):
+        # 400や404は「ページなし」と解釈
+        print(f"[INFO] page={page} returns {resp.status_code}. Probably no more posts.")
+        return [], None
+    if resp.status_code != 200:
+        print(f"[ERROR] Failed to fetch page={page}. HTTP {resp.status_code}")
+        return None, None
+
+    total_pages = resp.headers.get("X-WP-TotalPages")
+    with timed("parse"):
+        posts = resp.json()
+    return posts, int(total_pages) if total_pages else None
+
+def fetch_all_wp_posts(base_url: str, per_page=DEFAULT_PER_PAGE, max_pages=MAX_PAGES,
+                       workers=DEFAULT_WORKERS, fields=DEFAULT_FIELDS, extra_params=None,
+                       failed_pages=None):
+    """
+    1ページ目のレスポンスヘッダ X-WP-TotalPages で総ページ数を知り、
+    残りのページを workers 本のスレッドで並行取得する。
+    総ページ数が max_pages を超える場合は打ち切り、その旨を [WARN] で報告する。
+    ヘッダが無いサーバでは空ページが返るまで1ページずつ取得する。
+    failed_pages にリストを渡すと、取得できなかった (打ち切りを含む) ページ番号が追加される。
+    """
+    if failed_pages is None:
+        failed_pages = []
     session = create_session_with_retries(
         total_retries=3,
         backoff_factor=1.0,
-        status_forcelist=(500, 502, 503, 504),
-        read_timeout=30
+        read_timeout=30,
+        pool_size=workers,
     )
-    
-    all_posts = []
-    page = 1
-    while page <= max_pages:
-        params = {
-            "per_page": per_page,
-            "page": page
-        }
-
-        try:
-            resp = session.get(base_url, headers=HEADERS, params=params)
-            # 200 OK なら投稿を取得
-            if resp.status_code == 200:
-                data = resp.json()
-                if not data:
-                    print(f"[INFO] page={page} is empty. Stop fetching.")
-                    break
-                all_posts.extend(data)
-            elif resp.status_code in (400, 404):
-                # 400や404は「ページなし」と解釈してループ打ち切り
-                print(f"[INFO] page={page} returns {resp.status_code}. Probably no more posts.")
-                break
-            else:
-                print(f"[ERROR] Failed to fetch page={page}. HTTP {resp.status_code}")
+
+    first, total_pages = fetch_wp_page(session, base_url, 1, per_page, fields, extra_params)
+    if first is None:
+        failed_pages.append(1)
+    if not first:
+        return []
+    all_posts = list(first)
+
+    if total_pages is None:
+        # X-WP-TotalPages が無い場合は従来どおり逐次取得
+        page = 2
+        while page <= max_pages:
+            data, _ = fetch_wp_page(session, base_url, page, per_page, fields, extra_params)
+            if data is None:
+                failed_pages.append(page)
+            if not data:
                 break
-        except requests.exceptions.RequestException as e:
-            print(f"[ERROR] Exception occurred while fetching page={page}: {e}")
-            break
+            all_posts.extend(data)
+            page += 1
+        else:
+            print(f"[WARN] Reached max_pages={max_pages} without an empty page. "
+                  f"Posts beyond {max_pages * per_page} may be missing.")
+            failed_pages.append(max_pages + 1)
+        return all_posts
 
-        page += 1
+    if total_pages > max_pages:
+        print(f"[WARN] WordPress reports {total_pages} pages but max_pages={max_pages}. "
+              f"Only the first {max_pages} pages (up to {max_pages * per_page} posts) will be fetched.")
+        failed_pages.extend(range(max_pages + 1, total_pages + 1))
+    last_page = min(total_pages, max_pages)
 
+    pages = {}
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch_wp_page, session, base_url, page, per_page, fields, extra_params): page
+                   for page in range(2, last_page + 1)}
+        for fut in as_completed(futures):
+            page = futures[fut]
+            data, _ = fut.result()
+            if data is None:
+                failed.append(page)
+            else:
+                pages[page] = data
+
+    # ページ順に並べて結合
+    for page in sorted(pages):
+        all_posts.extend(pages[page])
+    if failed:
+        failed_pages.extend(sorted(failed))
+        print(f"[ERROR] Failed to fetch pages {sorted(failed)} of {last_page}. The post list is incomplete.")
     return all_posts
 
 def extract_column_articles(posts: list):
     """
     投稿リスト(posts)から、`link` に '/media/column/' を含むものだけ抽出し
-    {'id': str, 'title': str, 'url': str} のリストに整形して返す。
+    {'id': str, 'title': str, 'url': str, 'modified': str} のリストに整形して返す。
     """
     extracted = []
     for p in posts:
@@ -101,27 +181,166 @@ def extract_column_articles(posts: list):
         title_text = title_obj.get("rendered", "")
         # '/media/column/' を含む投稿のみ対象
         if "/media/column/" in link:
-            extracted.append({
+            article = {
                 "id": str(p.get("id", "")),
                 "title": title_text,
                 "url": link
-            })
+            }
+            if p.get("modified_gmt"):
+                article["modified"] = p["modified_gmt"]
+            extracted.append(article)
     return extracted
 
-def main():
-    print("=== Start fetching WordPress posts via REST API ===")
-    
-    # 1) WordPress REST APIから投稿をすべて取得
-    all_posts = fetch_all_wp_posts(API_URL, per_page=50, max_pages=10)
-    print(f"Fetched {len(all_posts)} posts in total.")
+def latest_modified(posts: list, current=""):
+    """投稿の modified_gmt の最大値 (ISO8601 文字列なので文字列比較でよい)"""
+    for p in posts:
+        modified = p.get("modified_gmt") or ""
+        if modified > current:
+            current = modified
+    return current
+
+def merge_changed_posts(articles: list, changed_posts: list, live_ids=None):
+    """
+    既存の articles に、modified_after で取得した changed_posts を反映する。
+    - '/media/column/' の記事は追加・更新 (新しい記事は先頭へ)
+    - URL が '/media/column/' でなくなった記事は削除
+    - live_ids (公開中の全ID) を渡すと、そこに無い記事 (削除・非公開化) も削除
+    戻り値: (新しい articles, {"added": n, "updated": n, "removed": n})
+    """
+    counts = {"added": 0, "updated": 0, "removed": 0}
+    by_id = {a["id"]: a for a in articles}
+    changed_ids = set()
+    added = []
+
+    for p in changed_posts:
+        art_id = str(p.get("id", ""))
+        changed_ids.add(art_id)
+        column = extract_column_articles([p])
+        if not column:
+            continue
+        if art_id in by_id:
+            if by_id[art_id] != column[0]:
+                by_id[art_id] = column[0]
+                counts["updated"] += 1
+        else:
+            by_id[art_id] = column[0]
+            added.append(column[0])
+            counts["added"] += 1
 
-    # 2) '/media/column/' を含む投稿のみ抽出
-    column_posts = extract_column_articles(all_posts)
+    column_ids = {a["id"] for a in extract_column_articles(changed_posts)}
+    merged = list(added)
+    for a in articles:
+        art_id = a["id"]
+        if art_id in changed_ids and art_id not in column_ids:
+            counts["removed"] += 1
+            continue
+        if live_ids is not None and art_id not in live_ids:
+            counts["removed"] += 1
+            continue
+        merged.append(by_id[art_id])
+    return merged, counts
+
+def merge_partial_articles(articles: list, partial: list) -> list:
+    """
+    不完全な全件取得の結果 partial を既存の articles に id でマージする。
+    取得できなかったページの記事を消さないよう、削除は行わない (新しい記事は先頭へ)。
+    """
+    by_id = {a["id"]: a for a in partial}
+    known = {a["id"] for a in articles}
+    added = [a for a in partial if a["id"] not in known]
+    return added + [by_id.get(a["id"], a) for a in articles]
+
+def crawl_full(base_url, state, max_pages=MAX_PAGES, workers=DEFAULT_WORKERS):
+    """全件を取得して articles.json を作り直す。戻り値: (articles, 取得が完全だったか)"""
+    failed_pages = []
+    all_posts = fetch_all_wp_posts(base_url, per_page=DEFAULT_PER_PAGE, max_pages=max_pages,
+                                   workers=workers, failed_pages=failed_pages)
+    print(f"Fetched {len(all_posts)} posts in total.")
+    count("fetched_posts", len(all_posts))
+    count("failed_pages", len(failed_pages))
+    with timed("extract"):
+        column_posts = extract_column_articles(all_posts)
     print(f"Extracted {len(column_posts)} posts that match '/media/column/'.")
+    if not failed_pages:
+        state["modified_cursor"] = latest_modified(all_posts, state.get("modified_cursor", ""))
+        state["last_full_crawl"] = datetime.now(timezone.utc).strftime(WP_DATETIME_FORMAT)
+    return column_posts, not failed_pages
+
+def crawl_incremental(base_url, articles, state, max_pages=MAX_PAGES, workers=DEFAULT_WORKERS):
+    """
+    前回の modified_cursor 以降に更新された投稿だけを取得して articles にマージし、
+    IDだけの全件スイープで削除・非公開化された記事を取り除く。
+    戻り値: (articles, 取得が完全だったか)
+    """
+    cursor = state["modified_cursor"]
+    since = datetime.strptime(cursor, WP_DATETIME_FORMAT) - CURSOR_OVERLAP
+    failed_pages = []
+    changed_posts = fetch_all_wp_posts(base_url, per_page=DEFAULT_PER_PAGE, max_pages=max_pages,
+                                       workers=workers, failed_pages=failed_pages,
+                                       extra_params={"modified_after": since.strftime(WP_DATETIME_FORMAT)})
+    print(f"Fetched {len(changed_posts)} posts modified after {since.strftime(WP_DATETIME_FORMAT)}.")
+
+    sweep_failed = []
+    live_posts = fetch_all_wp_posts(base_url, per_page=DEFAULT_PER_PAGE, max_pages=max_pages,
+                                    workers=workers, fields=ID_ONLY_FIELDS, failed_pages=sweep_failed)
+    # スイープが不完全なときに削除すると記事が消えてしまうので、削除判定は行わない
+    live_ids = None if sweep_failed else {str(p.get("id", "")) for p in live_posts}
+    if sweep_failed:
+        print("[WARN] ID sweep was incomplete. Skipping deletion check.")
+
+    count("fetched_posts", len(changed_posts))
+    count("failed_pages", len(failed_pages) + len(sweep_failed))
+    with timed("extract"):
+        merged, counts = merge_changed_posts(articles, changed_posts, live_ids)
+    print(f"Merged changes: added={counts['added']}, updated={counts['updated']}, removed={counts['removed']}")
+    for key in ("added", "updated", "removed"):
+        count(key, counts[key])
+    if not failed_pages:
+        state["modified_cursor"] = latest_modified(changed_posts, cursor)
+    return merged, not failed_pages
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="WordPress の記事一覧を取得して articles.json を生成する")
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get("CRAWL_WORKERS", DEFAULT_WORKERS)),
+                        help="ページを並行取得するスレッド数")
+    parser.add_argument("--max-pages", type=int, default=MAX_PAGES,
+                        help=f"取得するページ数の上限 (1ページ {DEFAULT_PER_PAGE} 件)")
+    parser.add_argument("--full", action="store_true",
+                        help="前回のカーソルを無視して全件を取得し直す")
+    return parser.parse_args(argv)
+
+@instrument_run("crawl_links")
+def main(argv=None):
+    args = parse_args(argv)
+    print("=== Start fetching WordPress posts via REST API ===")
+
+    state = load_json(CRAWL_STATE_JSON_PATH, {})
+    articles = load_json(ARTICLES_JSON_PATH, [])
+
+    # 1) カーソルがあれば差分取得、無ければ (または --full なら) 全件取得
+    if args.full or not state.get("modified_cursor") or not articles:
+        column_posts, complete = crawl_full(API_URL, state, args.max_pages, args.workers)
+        if not complete and articles:
+            column_posts = merge_partial_articles(articles, column_posts)
+            print(f"[WARN] Full crawl was incomplete. Merged the fetched posts into the previous {ARTICLES_JSON_PATH}.")
+    else:
+        column_posts, complete = crawl_incremental(API_URL, articles, state, args.max_pages, args.workers)
 
-    # 3) data/articles.json に上書き保存
-    save_json(column_posts, ARTICLES_JSON_PATH)
+    # 2) data/articles.json に保存し、取得が完全だった場合だけカーソルを進める
+    #    (不完全なら終了コード 1 で終わり、ワークフローがコミットしないようにする)
+    with timed("save"):
+        save_json(column_posts, ARTICLES_JSON_PATH)
+    count("articles", len(column_posts))
     print(f"Saved {len(column_posts)} posts into {ARTICLES_JSON_PATH}.")
+    if complete:
+        save_json(state, CRAWL_STATE_JSON_PATH)
+        print(f"Saved crawl cursor modified_cursor={state.get('modified_cursor', '')} into {CRAWL_STATE_JSON_PATH}.")
+    else:
+        print("[ERROR] Crawl was incomplete. The cursor was not advanced.")
+    print_metrics_summary()
+    if not complete:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -2,13 +2,34 @@
 # -*- coding: utf-8 -*-
 
 import os
+import argparse
 import json
-import requests
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from corpus_store import CORPUS_PATH, CorpusStore
+from http_client import create_session, print_metrics_summary
+from insert_links import get_auth_headers
+from link_urls import build_url_index, count_links
+from page_cache import PAGE_CACHE_PATH, PageCache
+from run_metrics import count, instrument_run, timed
+from usage_store import save_link_usage
+from wp_pipeline import DEFAULT_RATE_PER_HOST, HostRateLimiter
 
 # データファイルのパス
 LINK_MAPPING_JSON = os.path.join("data", "linkMapping.json")
 LINK_USAGE_JSON = os.path.join("data", "linkUsage.json")
 ARTICLES_JSON = os.path.join("data", "articles.json")
+JOURNAL_PATH = os.path.join(".cache", "detectJournal.jsonl")
+
+DEFAULT_WORKERS = 8
+JOURNAL_MAX_AGE = 24 * 60 * 60  # これより古いジャーナルからは再開しない (秒)
+JOURNAL_VERSION = 2             # 記録するリンク数の形式 (正規化URL) を変えたら上げる
+
+SOURCE_PAGE = "page"            # 公開ページの HTML を取得 (テーマのナビゲーションリンクも数える)
+SOURCE_REST = "rest"            # REST API で本文 (content.raw) を取得 (記事本文のリンクだけ数える)
+SOURCE_CORPUS = "corpus"        # ローカルスナップショット (corpus_store.py) の本文のリンクを使う (通信なし)
+REST_BATCH_SIZE = 100           # /wp/v2/posts の per_page の上限
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
@@ -25,10 +46,6 @@ def load_json(path):
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
-def save_json(data, path):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
 def flatten_link_mapping(nested_map: dict) -> dict:
     """
     linkMapping.json が
@@ -45,46 +62,266 @@ def flatten_link_mapping(nested_map: dict) -> dict:
         flat_map.update(kw_dict)
     return flat_map
 
-def main():
-    # 1) JSONファイル読み込み
-    articles = load_json(ARTICLES_JSON)         # 公開済み記事一覧
-    link_mapping_nested = load_json(LINK_MAPPING_JSON)  # カテゴリ階層つきキーワード→URL
-    link_mapping = flatten_link_mapping(link_mapping_nested)
+def fetch_href_counts(session, url: str, cache=None):
+    """
+    記事ページを取得し、ページ内の <a href> を正規化した {URL: 回数} を返す。取得失敗時は None。
+    cache があれば条件付き GET を行い、304 なら前回の結果を再利用する。
+    """
+    headers = cache.conditional_headers(url) if cache else {}
+    with timed("fetch"):
+        resp = session.get(url, headers=headers)
+    if resp.status_code == 304 and cache:
+        hrefs = cache.hit(url)
+        if hrefs is not None:
+            count("not_modified")
+            return hrefs
+        # キャッシュに無いのに 304 が返った場合は条件なしで取り直す
+        with timed("fetch"):
+            resp = session.get(url)
+    if resp.status_code != 200:
+        print(f"[WARN] {url} returned HTTP {resp.status_code}")
+        return None
+    with timed("parse"):
+        hrefs = count_links(resp.text, base_url=url)
+    if cache:
+        cache.store(url, resp, hrefs)
+    return hrefs
+
+def fetch_raw_link_counts(session, wp_url: str, auth_headers: dict, batch: list) -> dict:
+    """
+    REST API の /wp/v2/posts?include=... で最大 REST_BATCH_SIZE 件の content.raw をまとめて取得し、
+    記事本文の中だけの <a href> を数えた {記事ID: {正規化URL: 回数}} を返す。
+    (テーマのヘッダ・サイドバー・フッタのナビゲーションリンクは含まれない)
+    """
+    params = {
+        "include": ",".join(a["id"] for a in batch),
+        "per_page": len(batch),
+        "context": "edit",
+        # content.rendered を返させないよう raw だけに絞る (WP 5.3 以降のネスト指定)
+        "_fields": "id,content.raw",
+    }
+    with timed("fetch"):
+        resp = session.get(f"{wp_url}/wp-json/wp/v2/posts", headers=auth_headers, params=params)
+    if resp.status_code != 200:
+        print(f"[WARN] Batch of {len(batch)} posts returned HTTP {resp.status_code}")
+        return {}
+    raw_by_id = {str(p.get("id")): p.get("content", {}).get("raw", "") for p in resp.json()}
+    found = {}
+    for a in batch:
+        if a["id"] in raw_by_id:
+            with timed("parse"):
+                found[a["id"]] = count_links(raw_by_id[a["id"]], base_url=a["url"])
+    return found
+
+def load_journal(path: str, source: str) -> dict:
+    """
+    中断された前回の実行のジャーナル (JSON Lines) を読み、{記事ID: {正規化URL: 回数}} を返す。
+    1行目のヘッダが読めない・形式や取得元が違う・古い (JOURNAL_MAX_AGE 超) 場合は最初からやり直し ({} を返す)。
+    2行目以降の壊れた行 (書き込み途中の最終行や id / hrefs の無い行) は飛ばす。
+    """
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        header = _parse_journal_line(f.readline())
+        if header is None or header.get("version") != JOURNAL_VERSION or header.get("source") != source:
+            print(f"[INFO] Journal {path} has a missing header, a different format or source. Starting over.")
+            return {}
+        started = header.get("started")
+        if not isinstance(started, (int, float)) or time.time() - started > JOURNAL_MAX_AGE:
+            print(f"[INFO] Journal {path} is too old. Starting over.")
+            return {}
+        for line in f:
+            rec = _parse_journal_line(line)
+            if rec is None or not isinstance(rec.get("id"), str) or not isinstance(rec.get("hrefs"), dict):
+                continue
+            done[rec["id"]] = rec["hrefs"]
+    return done
 
-    # 新しい linkUsage を作成する
+def _parse_journal_line(line: str):
+    """ジャーナルの1行を dict にする (空行・壊れた JSON・dict 以外は None)"""
+    try:
+        rec = json.loads(line)
+    except ValueError:
+        return None
+    return rec if isinstance(rec, dict) else None
+
+def crawl_articles(articles, fetch_batch, batch_size=1, workers=DEFAULT_WORKERS,
+                   journal_path=JOURNAL_PATH, source=SOURCE_PAGE):
+    """
+    articles を batch_size 件ずつ fetch_batch(batch) -> {記事ID: {正規化URL: 回数}} で
+    workers 本のスレッドから並行取得し、{記事ID: {正規化URL: 回数}} を返す。
+    結果は取得できた順にジャーナルへ1行ずつ追記するため、途中で止まっても
+    次回はジャーナルにある記事を飛ばして続きから再開できる。
+    """
+    results = load_journal(journal_path, source)
+    if results:
+        print(f"[INFO] Resuming from journal: {len(results)} articles already crawled.")
+    todo = [art for art in articles if art["id"] not in results]
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+
+    directory = os.path.dirname(journal_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    new_journal = not results
+    with open(journal_path, "w" if new_journal else "a", encoding="utf-8") as journal, \
+            ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="detect") as pool:
+        if new_journal:
+            header = {"version": JOURNAL_VERSION, "source": source, "started": time.time()}
+            journal.write(json.dumps(header) + "\n")
+            journal.flush()
+        futures = {pool.submit(fetch_batch, batch): batch for batch in batches}
+        for fut in as_completed(futures):
+            batch = futures[fut]
+            try:
+                found = fut.result()
+            except Exception as e:
+                print(f"[ERROR] Failed to fetch {[a['id'] for a in batch]}: {e}")
+                continue
+            for art in batch:
+                hrefs = found.get(art["id"])
+                if hrefs is None:
+                    print(f"[WARN] Article {art['id']} could not be fetched")
+                    continue
+                results[art["id"]] = hrefs
+                journal.write(json.dumps({"id": art["id"], "hrefs": hrefs}, ensure_ascii=False) + "\n")
+            journal.flush()
+    return results
+
+def aggregate_usage(articles, crawled: dict, link_mapping: dict) -> dict:
+    """
+    crawled ({記事ID: {正規化URL: 回数}}) を 正規化URL → キーワード の索引で引いて、新しい linkUsage を作る。
+    (ページ内のリンク数だけ dict を引くので、キーワード数が増えても1ページの処理量は変わらない)
+    (articles.json の順に並べて、出力の順序を実行ごとに揃える)
+    """
     new_usage = {}
     for kw, url in link_mapping.items():
         new_usage[kw] = {
             "url": url,
             "articles_used_in": {}
         }
-
-    # 2) 各記事URLをクロール
+    url_index = build_url_index(link_mapping)
     for art in articles:
-        art_id = art["id"]
-        art_url = art["url"]
-        try:
-            resp = requests.get(art_url, headers=HEADERS, timeout=15)
-            if resp.status_code == 200:
-                html = resp.text
-            else:
-                print(f"[WARN] Article {art_id} returned HTTP {resp.status_code}")
-                continue
-        except Exception as e:
-            print(f"[ERROR] Failed to fetch {art_id}: {e}")
+        hrefs = crawled.get(art["id"])
+        if hrefs is None:
             continue
+        for url, link_count in hrefs.items():
+            for kw in url_index.get(url, ()):
+                new_usage[kw]["articles_used_in"][art["id"]] = link_count
+    return new_usage
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="記事ページをクロールして linkUsage.json を更新する")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="条件付き GET のキャッシュを使わずに全ページを取得する")
+    parser.add_argument("--cache-path", default=PAGE_CACHE_PATH,
+                        help="ETag / Last-Modified とリンク数を保存するキャッシュファイル")
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get("DETECT_WORKERS", DEFAULT_WORKERS)),
+                        help="記事ページを並行取得するスレッド数")
+    parser.add_argument("--rate", type=float,
+                        default=float(os.environ.get("DETECT_RATE", DEFAULT_RATE_PER_HOST)),
+                        help="1ホストあたりの最大リクエスト数/秒 (0 で無制限)")
+    parser.add_argument("--journal-path", default=JOURNAL_PATH,
+                        help="途中経過を追記するジャーナル (中断後の再開に使う)")
+    parser.add_argument("--fresh", action="store_true",
+                        help="ジャーナルを破棄して最初からクロールする")
+    parser.add_argument("--source", choices=(SOURCE_PAGE, SOURCE_REST, SOURCE_CORPUS),
+                        default=os.environ.get("DETECT_SOURCE", SOURCE_PAGE),
+                        help="page: 公開ページの HTML を取得 / rest: REST API で本文 (content.raw) を"
+                             f"{REST_BATCH_SIZE}件ずつ取得 (WP_URL / WP_USERNAME / WP_PASSWORD が必要) / "
+                             "corpus: ローカルスナップショットの本文を使う")
+    parser.add_argument("--corpus-path", default=CORPUS_PATH,
+                        help="--source corpus で読むスナップショット")
+    parser.add_argument("--usage-path", default=os.environ.get("LINK_USAGE_PATH", LINK_USAGE_JSON),
+                        help="結果の保存先 (.json なら JSON、.bin なら usage_store.py のバイナリ形式)")
+    return parser.parse_args(argv)
+
+@instrument_run("detect_link_usage")
+def main(argv=None):
+    args = parse_args(argv)
+
+    # 1) JSONファイル読み込み
+    articles = load_json(ARTICLES_JSON)         # 公開済み記事一覧
+    link_mapping_nested = load_json(LINK_MAPPING_JSON)  # カテゴリ階層つきキーワード→URL
+    link_mapping = flatten_link_mapping(link_mapping_nested)
+
+    # 2) 各記事を並行クロールし、結果はジャーナルへ逐次追記
+    if args.fresh and os.path.exists(args.journal_path):
+        os.remove(args.journal_path)
+    limiter = HostRateLimiter(args.rate)
+    cache = None
+    if args.source == SOURCE_REST:
+        # REST API から本文 (content.raw) を100件ずつ取得し、記事本文の中のリンクだけを数える
+        wp_url = os.environ.get("WP_URL", "")
+        wp_username = os.environ.get("WP_USERNAME", "")
+        wp_password = os.environ.get("WP_PASSWORD", "")
+        if not (wp_url and wp_username and wp_password):
+            print("[ERROR] Missing WP credentials for --source rest")
+            return
+        session = create_session(pool_size=max(1, args.workers))
+        auth_headers = get_auth_headers(wp_username, wp_password)
+
+        def fetch_batch(batch):
+            limiter.wait(wp_url)
+            return fetch_raw_link_counts(session, wp_url, auth_headers, batch)
+
+        batch_size = REST_BATCH_SIZE
+    elif args.source == SOURCE_CORPUS:
+        # スナップショットに保存済みのリンク数を読むだけ (更新日時が articles.json と違う記事は数えない)
+        corpus = CorpusStore(args.corpus_path)
+
+        def fetch_batch(batch):
+            found = {}
+            for art in batch:
+                with timed("fetch"):
+                    hrefs = corpus.get_links(art["id"], art.get("modified", ""))
+                if hrefs is not None:
+                    found[art["id"]] = hrefs
+            return found
+
+        batch_size = REST_BATCH_SIZE
+    else:
+        # 公開ページを1件ずつ取得 (未更新のページは 304 で済ませる)
+        session = create_session(pool_size=max(1, args.workers), endpoint_timeouts=(),
+                                 default_timeout=(5, 15), headers=HEADERS)
+        cache = None if args.no_cache else PageCache(args.cache_path)
+
+        def fetch_batch(batch):
+            found = {}
+            for art in batch:
+                limiter.wait(art["url"])
+                hrefs = fetch_href_counts(session, art["url"], cache)
+                if hrefs is not None:
+                    found[art["id"]] = hrefs
+            return found
+
+        batch_size = 1
+
+    crawled = crawl_articles(articles, fetch_batch, batch_size=batch_size, workers=args.workers,
+                             journal_path=args.journal_path, source=args.source)
+    if cache:
+        # ジャーナルから再開した記事のキャッシュも残す
+        for art in articles:
+            if art["id"] in crawled:
+                cache.keep(art["url"])
+
+    # 3) ページ内のリンクをキーワードごとに集計
+    with timed("match"):
+        new_usage = aggregate_usage(articles, crawled, link_mapping)
+    count("articles", len(articles))
+    count("scanned", len(crawled))
+    count("failed", len(articles) - len(crawled))
 
-        # 3) HTML内に <a href="(リンクマッピングのURL)"> が何回登場するかをカウント
-        #    ※href='...' や追加パラメータ付きなど厳密化したい場合は正規表現を利用
-        for kw, usage_info in new_usage.items():
-            target_url = usage_info["url"]
-            count = html.count(f'href="{target_url}"')
-            if count > 0:
-                usage_info["articles_used_in"][art_id] = count
-
-    # 4) 結果を保存
-    save_json(new_usage, LINK_USAGE_JSON)
-    print(f"[INFO] linkUsage.json updated with {len(articles)} articles scanned.")
+    # 4) 結果を保存し、完了したのでジャーナルを消す
+    with timed("save"):
+        save_link_usage(new_usage, args.usage_path)
+    print(f"[INFO] {args.usage_path} updated with {len(crawled)}/{len(articles)} articles scanned.")
+    if cache:
+        cache.save()
+        print(cache.summary())
+    if os.path.exists(args.journal_path):
+        os.remove(args.journal_path)
+    print_metrics_summary()
 
 
 if __name__ == "__main__":
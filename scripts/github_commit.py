@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+複数ファイルの変更を GitHub の Git Data API (blobs / trees / commits / refs) で1コミットにまとめて保存する。
+
+contents API (GET で SHA を取って PUT) はファイルごとに2往復・1コミットになり、
+大きなファイルはサイズ上限にも掛かる。ここでは
+
+    1. ブランチの先頭コミットとそのツリーを取得 (2往復)
+    2. 手元のファイルの blob SHA (git hash-object と同じ計算) をツリーの SHA と比べ、変わったファイルだけ blob を並行に作成
+    3. 変更分だけのツリー → コミットを作成し、ブランチの ref を早送りで更新
+
+とし、ref の更新が競合した (他のコミットが先に入った) 場合は 1. からやり直す。作成済みの blob は再利用する。
+
+    committer = GitHubCommitter(owner, repo, branch, token)
+    committer.stage("data/linkMapping.json", json_str)
+    committer.stage("data/linkUsage.json", json_str2)
+    result = committer.commit("Update data from Streamlit")
+"""
+
+import base64
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from http_client import get_session
+
+GITHUB_API_URL = "https://api.github.com"
+MAX_REF_RETRIES = 3        # ref 更新が競合したときのやり直し回数
+REF_RETRY_WAIT = 1.0       # やり直し前の待ち時間 (秒)
+BLOB_WORKERS = 4           # 並行に作成する blob の数
+FILE_MODE = "100644"
+
+
+class GitHubCommitError(Exception):
+    """GitHub API がエラーを返した・ref の競合が解消しなかった"""
+
+
+def git_blob_sha(data: bytes) -> str:
+    """git hash-object と同じ blob の SHA-1"""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+class GitHubCommitter:
+    def __init__(self, owner: str, repo: str, branch: str, token: str,
+                 api_url: str = GITHUB_API_URL, session=None):
+        self.branch = branch
+        self.repo_url = f"{api_url.rstrip('/')}/repos/{owner}/{repo}"
+        self.headers = {
+            "Authorization": f"token {token}",
+            "Accept": "application/vnd.github+json",
+        }
+        self.session = session or get_session()
+        self.staged = {}      # パス -> bytes
+        self._blobs = set()   # このインスタンスで作成済みの blob SHA
+
+    def stage(self, path: str, content):
+        """コミットするファイルを追加する (同じパスは後のもので上書き)"""
+        self.staged[path] = content.encode("utf-8") if isinstance(content, str) else content
+
+    def _request(self, method: str, path: str, ok=(200, 201), **kwargs):
+        resp = self.session.request(method, f"{self.repo_url}{path}", headers=self.headers, **kwargs)
+        if resp.status_code not in ok:
+            raise GitHubCommitError(f"{method} {path}: HTTP {resp.status_code} {resp.text[:200]}")
+        return resp
+
+    def _head(self):
+        """ブランチ先頭の (コミット SHA, ツリー SHA, {パス: blob SHA})"""
+        ref = self._request("GET", f"/git/ref/heads/{self.branch}").json()
+        commit_sha = ref["object"]["sha"]
+        # trees API はコミット SHA も受け付ける (そのコミットのツリーが返る) ので、コミットの取得を省ける
+        tree = self._request("GET", f"/git/trees/{commit_sha}", params={"recursive": "1"}).json()
+        if tree.get("truncated"):
+            # 巨大なリポジトリで一覧が切り詰められた場合は比較せず全ファイルを送る
+            return commit_sha, tree["sha"], {}
+        files = {e["path"]: e["sha"] for e in tree.get("tree", []) if e.get("type") == "blob"}
+        return commit_sha, tree["sha"], files
+
+    def _create_blob(self, data: bytes, sha: str):
+        if sha in self._blobs:
+            return
+        payload = {"content": base64.b64encode(data).decode("ascii"), "encoding": "base64"}
+        created = self._request("POST", "/git/blobs", json=payload).json()
+        if created.get("sha") != sha:
+            raise GitHubCommitError(f"Blob SHA mismatch: expected {sha}, got {created.get('sha')}")
+        self._blobs.add(sha)
+
+    def commit(self, message: str, max_retries=MAX_REF_RETRIES) -> dict:
+        """
+        ステージしたファイルを1コミットでブランチに反映する。
+        戻り値: {"commit": 新しいコミット SHA (変更が無ければ None), "changed": [パス], "skipped": [パス],
+                 "attempts": ref 更新を試みた回数}
+        """
+        local = {path: (data, git_blob_sha(data)) for path, data in self.staged.items()}
+        for attempt in range(1, max_retries + 2):
+            head_sha, tree_sha, remote = self._head()
+            changed = sorted(path for path, (_, sha) in local.items() if remote.get(path) != sha)
+            skipped = sorted(set(local) - set(changed))
+            if not changed:
+                return {"commit": None, "changed": [], "skipped": skipped, "attempts": attempt}
+
+            # blob 同士は独立しているので並行に作る
+            with ThreadPoolExecutor(min(BLOB_WORKERS, len(changed)), thread_name_prefix="blob") as pool:
+                list(pool.map(lambda path: self._create_blob(*local[path]), changed))
+            tree = self._request("POST", "/git/trees", json={
+                "base_tree": tree_sha,
+                "tree": [{"path": path, "mode": FILE_MODE, "type": "blob", "sha": local[path][1]}
+                         for path in changed],
+            }).json()
+            new_commit = self._request("POST", "/git/commits", json={
+                "message": message,
+                "tree": tree["sha"],
+                "parents": [head_sha],
+            }).json()
+
+            # force=False なので、先頭が動いていれば (早送りできなければ) 422 が返る
+            resp = self.session.patch(f"{self.repo_url}/git/refs/heads/{self.branch}", headers=self.headers,
+                                      json={"sha": new_commit["sha"], "force": False})
+            if resp.status_code == 200:
+                self.staged.clear()
+                return {"commit": new_commit["sha"], "changed": changed, "skipped": skipped, "attempts": attempt}
+            if resp.status_code not in (409, 422):
+                raise GitHubCommitError(f"PATCH ref: HTTP {resp.status_code} {resp.text[:200]}")
+            print(f"[WARN] Branch {self.branch} moved while committing (attempt {attempt}). Retrying.")
+            time.sleep(REF_RETRY_WAIT)
+        raise GitHubCommitError(f"Could not update {self.branch} after {max_retries + 1} attempts")
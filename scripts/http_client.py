@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+全スクリプト共通の HTTP クライアント。
+
+- keep-alive のコネクションプール (並行ワーカー数に合わせてサイズ指定)
+- 宛先ごとのタイムアウト (WordPress REST / GitHub API / 公開ページ)
+- 指数バックオフ付きリトライ (429/503 などの Retry-After ヘッダを尊重)
+- リクエスト単位のメトリクス (レイテンシのヒストグラム・リトライ回数・転送バイト数)
+
+    session = create_session(pool_size=16)
+    resp = session.get(url)          # timeout は宛先に応じて自動設定
+    print_metrics_summary()          # 実行の最後に集計を出力
+"""
+
+import bisect
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = (5, 30)  # (接続タイムアウト, 読み込みタイムアウト)
+
+# URL に含まれる文字列 → タイムアウト (先に一致したものを使う)
+DEFAULT_ENDPOINT_TIMEOUTS = (
+    ("/wp-json/", (5, 60)),        # 記事の更新は保存処理で時間がかかることがある
+    ("api.github.com", (5, 30)),
+)
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# レイテンシのヒストグラムの上限値 (秒)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf"))
+
+
+class RequestMetrics:
+    """リクエスト単位の計測値を集計する (スレッドセーフ)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.errors = 0
+            self.retries = 0
+            self.bytes_received = 0
+            self.latency_sum = 0.0
+            self.latency_max = 0.0
+            self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+            self.status_counts = {}
+
+    def record(self, latency, status=None, nbytes=0, retries=0, error=False):
+        with self._lock:
+            self.requests += 1
+            self.retries += retries
+            self.bytes_received += nbytes
+            self.latency_sum += latency
+            self.latency_max = max(self.latency_max, latency)
+            self.latency_buckets[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+            if error:
+                self.errors += 1
+            else:
+                self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+    def quantile(self, q):
+        """ヒストグラムから q 分位点の上限値を推定する"""
+        with self._lock:
+            total = sum(self.latency_buckets)
+            if not total:
+                return 0.0
+            threshold = q * total
+            seen = 0
+            for upper, count in zip(LATENCY_BUCKETS, self.latency_buckets):
+                seen += count
+                if seen >= threshold:
+                    return min(upper, self.latency_max)
+            return self.latency_max
+
+    def summary(self) -> dict:
+        p50 = self.quantile(0.5)
+        p95 = self.quantile(0.95)
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "retries": self.retries,
+                "bytes_received": self.bytes_received,
+                "latency_avg": self.latency_sum / self.requests if self.requests else 0.0,
+                "latency_p50": p50,
+                "latency_p95": p95,
+                "latency_max": self.latency_max,
+                "latency_buckets": {
+                    ("+Inf" if b == float("inf") else str(b)): c
+                    for b, c in zip(LATENCY_BUCKETS, self.latency_buckets)
+                },
+                "status_counts": {str(k): v for k, v in sorted(self.status_counts.items(), key=str)},
+            }
+
+
+# 全セッション共通のメトリクス
+METRICS = RequestMetrics()
+
+
+class PooledSession(requests.Session):
+    """宛先ごとのタイムアウトを既定値として付与し、メトリクスを記録するセッション"""
+
+    def __init__(self, endpoint_timeouts=DEFAULT_ENDPOINT_TIMEOUTS, default_timeout=DEFAULT_TIMEOUT,
+                 metrics=None):
+        super().__init__()
+        self.endpoint_timeouts = tuple(endpoint_timeouts)
+        self.default_timeout = default_timeout
+        self.metrics = metrics if metrics is not None else METRICS
+
+    def timeout_for(self, url: str):
+        for pattern, timeout in self.endpoint_timeouts:
+            if pattern in url:
+                return timeout
+        return self.default_timeout
+
+    def request(self, method, url, *args, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout_for(str(url))
+        started = time.perf_counter()
+        try:
+            resp = super().request(method, url, *args, **kwargs)
+        except requests.exceptions.RequestException:
+            self.metrics.record(time.perf_counter() - started, error=True)
+            raise
+        retry_state = getattr(resp.raw, "retries", None)
+        retries = len(retry_state.history) if retry_state is not None else 0
+        nbytes = 0 if kwargs.get("stream") else len(resp.content)
+        self.metrics.record(time.perf_counter() - started, resp.status_code, nbytes, retries)
+        return resp
+
+
+def create_session(
+    pool_size=DEFAULT_POOL_SIZE,
+    total_retries=3,
+    backoff_factor=1.0,
+    status_forcelist=RETRY_STATUS_CODES,
+    retry_post=False,
+    endpoint_timeouts=DEFAULT_ENDPOINT_TIMEOUTS,
+    default_timeout=DEFAULT_TIMEOUT,
+    headers=None,
+):
+    """
+    keep-alive プールとリトライを設定したセッションを生成する。
+
+    - pool_size: 1ホストあたりに保持するコネクション数 (並行ワーカー数以上にする)
+    - backoff_factor: リトライ間隔 = backoff_factor * 2^(回数-1) 秒。Retry-After があればそちらを優先
+    - retry_post: POST もリトライ対象にする (WordPress の本文更新のように冪等な POST のみ)
+    """
+    allowed_methods = set(Retry.DEFAULT_ALLOWED_METHODS)
+    if retry_post:
+        allowed_methods.add("POST")
+    retries = Retry(
+        total=total_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=status_forcelist,
+        allowed_methods=frozenset(allowed_methods),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    session = PooledSession(endpoint_timeouts=endpoint_timeouts, default_timeout=default_timeout)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+_default_session = None
+_default_session_lock = threading.Lock()
+
+
+def get_session():
+    """プロセス内で共有する既定のセッションを返す"""
+    global _default_session
+    with _default_session_lock:
+        if _default_session is None:
+            _default_session = create_session()
+        return _default_session
+
+
+def format_metrics_summary(metrics=None) -> str:
+    s = (metrics or METRICS).summary()
+    return (
+        f"[HTTP] requests={s['requests']} errors={s['errors']} retries={s['retries']} "
+        f"bytes={s['bytes_received']} latency avg={s['latency_avg'] * 1000:.0f}ms "
+        f"p50<={s['latency_p50'] * 1000:.0f}ms p95<={s['latency_p95'] * 1000:.0f}ms "
+        f"max={s['latency_max'] * 1000:.0f}ms status={s['status_counts']}"
+    )
+
+
+def print_metrics_summary(metrics=None):
+    print(format_metrics_summary(metrics))
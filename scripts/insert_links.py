@@ -2,11 +2,22 @@
 # -*- coding: utf-8 -*-
 
 import os
+import argparse
 import json
-import requests
-import re
 import base64
 
+from content_tokenizer import build_linked_content
+from corpus_store import CORPUS_PATH, CorpusStore
+from http_client import create_session, get_session, print_metrics_summary
+from insert_state import INSERT_STATE_PATH, InsertState, content_hash, effective_map_hash, mapping_hash
+from keyword_matcher import KeywordMatcher
+from link_engine import LinkEngine, chain
+from link_preview import (PREVIEW_HTML_PATH, PREVIEW_JSON_PATH, format_summary, run_preview,
+                          write_html_report, write_json_report)
+from link_transform import MAX_LINKS_PER_POST, plan_link_once, plan_links_to_content
+from run_metrics import count, instrument_run, observe
+from wp_pipeline import DEFAULT_RATE_PER_HOST, DEFAULT_WORKERS, HostRateLimiter, run_pipeline
+
 LINK_MAPPING_JSON = "data/linkMapping.json"
 ARTICLES_JSON     = "data/articles.json"
 
@@ -31,103 +42,234 @@ def flatten_link_mapping(nested_map: dict) -> dict:
         flat_map.update(category_dict)
     return flat_map
 
-def get_post_raw_content(post_id, wp_url, wp_username, wp_password):
+def get_post_raw_content(post_id, wp_url, wp_username, wp_password, session=None):
     headers = get_auth_headers(wp_username, wp_password)
     url = f"{wp_url}/wp-json/wp/v2/posts/{post_id}?context=edit"
-    resp = requests.get(url, headers=headers)
+    resp = (session or get_session()).get(url, headers=headers)
     print(f"get_post_raw_content(post_id={post_id}): status={resp.status_code}")
     if resp.status_code != 200:
         return ""
     data = resp.json()
     return data.get("content", {}).get("raw", "")
 
-def update_post_content(post_id, new_content, wp_url, wp_username, wp_password):
+def update_post_content(post_id, new_content, wp_url, wp_username, wp_password, session=None):
     headers = get_auth_headers(wp_username, wp_password)
     payload = {"content": new_content}
-    resp = requests.post(f"{wp_url}/wp-json/wp/v2/posts/{post_id}", json=payload, headers=headers)
+    resp = (session or get_session()).post(f"{wp_url}/wp-json/wp/v2/posts/{post_id}", json=payload, headers=headers)
     print(f"update_post_content(post_id={post_id}): status={resp.status_code}")
     return resp.status_code, resp.text
 
-def insert_link_once(content: str, link_mapping: dict, article_url: str) -> str:
+def insert_link_once(content: str, link_mapping, article_url: str) -> str:
     """
     記事本文中で最初に登場したキーワード1つだけをリンク化する。
+    同じ位置に複数のキーワードがある場合は最長のものを優先する。
+    link_mapping には {キーワード: URL} またはコンパイル済み KeywordMatcher を渡す。
     以下の場合はリンク化しない:
       - link_mapping にあるURL が article_url と同じ (A = B の場合)
       - 既に <a> タグ内にあるテキスト
+      - HTMLタグ・ショートコード・Gutenberg ブロックコメントの中
+    """
+    return build_linked_content(content, plan_link_once(content, link_mapping, article_url))
+
+def article_url_of(article):
+    # articles.json の記事URLは "url" キー (旧形式の "link" にも対応)
+    return article.get("url") or article.get("link", "")
+
+def read_from_corpus(corpus, article):
+    """スナップショットに articles.json と同じ更新日時の本文があれば返す (無ければ None)"""
+    if corpus is None:
+        return None
+    return corpus.get_content(article["id"], article.get("modified", ""))
+
+def process_articles(articles_data, matcher, wp_url, wp_username, wp_password,
+                     workers=DEFAULT_WORKERS, rate=DEFAULT_RATE_PER_HOST, state=None, corpus=None,
+                     processes=1, kw_maps=None, max_links_per_post=MAX_LINKS_PER_POST):
+    """
+    articles_data の各記事を 取得 → insert_link_once → 更新 のパイプラインで処理する。
+    取得・更新は workers 本のスレッドで並行実行し、リクエストは rate 件/秒 までに抑える。
+    processes が 2 以上 (None なら CPU 数) なら、変換は link_engine.LinkEngine のプロセスプールで並列に行う。
+    state (InsertState) を渡すと、前回から本文もキーワードマップも変わっていない記事は
+    取得・変換を飛ばし、処理結果を state に記録する。
+    corpus (CorpusStore) を渡すと、更新日時が articles.json と一致する記事は本文をスナップショットから読む。
+    kw_maps ({記事ID: {キーワード: URL}}。link_planner.py の計画) を渡すと、その記事だけを対象に
+    一括挿入 (plan_links_to_content) と同じ挿入 (最大 max_links_per_post 個) を行う。
+    戻り値: run_pipeline() の集計 dict (+ skipped_unfetched / skipped_unchanged)
+    """
+    # 取得用と更新用のスレッドが同時にコネクションを使うため workers * 2 本を確保
+    # 本文更新の POST は同じ内容を再送しても結果が変わらないのでリトライ対象にする
+    session = create_session(pool_size=workers * 2, retry_post=True)
+    limiter = HostRateLimiter(rate)
+
+    def label(article):
+        return f"post {article['id']} ({article.get('title','')})"
+
+    if kw_maps is not None:
+        # 計画の実行: 記事ごとのキーワードマップがそのまま適用されるマップ
+        articles_data = [a for a in articles_data if a["id"] in kw_maps]
+        map_hashes = {a["id"]: mapping_hash(kw_maps[a["id"]]) for a in articles_data}
+    else:
+        global_map_hash = mapping_hash(matcher.link_mapping)
+        map_hashes = {a["id"]: effective_map_hash(global_map_hash, article_url_of(a)) for a in articles_data}
+    skipped = {"skipped_unfetched": 0, "skipped_unchanged": 0}
+
+    # 記事の更新日時もキーワードマップも前回と同じ記事は取得しない
+    if state is not None:
+        targets = []
+        for article in articles_data:
+            if state.can_skip_fetch(article["id"], article.get("modified", ""), map_hashes[article["id"]]):
+                skipped["skipped_unfetched"] += 1
+            else:
+                targets.append(article)
+    else:
+        targets = articles_data
+
+    def fetch(article):
+        raw_content = read_from_corpus(corpus, article)
+        if raw_content:
+            return raw_content
+        limiter.wait(wp_url)
+        raw_content = get_post_raw_content(article["id"], wp_url, wp_username, wp_password, session=session)
+        if not raw_content:
+            print(f"[WARN] No content for {label(article)}")
+            return None
+        return raw_content
+
+    def transform(article, raw_content):
+        post_id = article["id"]
+        raw_hash = content_hash(raw_content)
+        if state is not None and state.can_skip_transform(post_id, raw_hash, map_hashes[post_id]):
+            # 前回処理した本文のままなので変換しない (次回は取得も飛ばせるよう更新日時だけ進める)
+            state.touch(post_id, article.get("modified", ""))
+            skipped["skipped_unchanged"] += 1
+            return None
+        if engine is not None:
+            future = engine.submit(post_id, raw_content, article_url_of(article))
+            return chain(future, lambda result: finish_engine(article, raw_hash, result))
+        if kw_maps is not None:
+            links = plan_links_to_content(raw_content, kw_maps[post_id], max_links_per_post,
+                                          base_url=article_url_of(article))
+            return finish(article, raw_hash, build_linked_content(raw_content, links) if links else None)
+        updated_content = insert_link_once(raw_content, matcher, article_url_of(article))
+        return finish(article, raw_hash, None if updated_content == raw_content else updated_content)
+
+    def finish_engine(article, raw_hash, result):
+        # ワーカープロセスでの変換時間を match として記録する
+        observe("match", result.seconds)
+        return finish(article, raw_hash, result.content)
+
+    def finish(article, raw_hash, updated_content):
+        # updated_content: 変換後の本文 (変更が無ければ None)
+        if updated_content is None:
+            print(f"[INFO] No changes for {label(article)}")
+            if state is not None:
+                state.record(article["id"], raw_hash, raw_hash, map_hashes[article["id"]], article.get("modified", ""))
+            return None
+        return raw_hash, updated_content
+
+    def write(article, transformed):
+        raw_hash, updated_content = transformed
+        print(f"[INFO] Updating {label(article)}...")
+        limiter.wait(wp_url)
+        status, _ = update_post_content(article["id"], updated_content, wp_url, wp_username, wp_password, session=session)
+        print(f"    -> post {article['id']} status={status}")
+        if status != 200:
+            return False
+        if state is not None:
+            state.record(article["id"], raw_hash, content_hash(updated_content),
+                         map_hashes[article["id"]], article.get("modified", ""))
+        if corpus is not None:
+            # スナップショットの本文は古くなったので次回の同期で取り直す
+            corpus.mark_stale(article["id"])
+        return True
+
+    # ワーカープロセスは取得スレッドが動き出す前に起動する
+    # (計画の実行は記事ごとのキーワードが数個なので、同じプロセス内で変換する)
+    use_engine = kw_maps is None and (processes is None or processes > 1)
+    engine = LinkEngine(matcher, processes) if use_engine else None
+    try:
+        stats = run_pipeline(targets, fetch, transform, write, workers=workers, label=label)
+    finally:
+        if engine is not None:
+            engine.close()
+    stats["unchanged"] -= skipped["skipped_unchanged"]
+    stats.update(skipped)
+    stats["total"] = len(articles_data)
+    return stats
+
+def preview_articles(articles_data, link_mapping, wp_url, wp_username, wp_password,
+                     workers=DEFAULT_WORKERS, rate=DEFAULT_RATE_PER_HOST, processes=None, corpus=None,
+                     kw_maps=None, max_links_per_post=MAX_LINKS_PER_POST):
+    """
+    process_articles() のドライラン。本文を取得して insert_link_once と同じ挿入計画を求めるだけで、
+    WordPress への更新も InsertState の記録も行わない。
+    kw_maps (link_planner.py の計画) を渡すと、計画の記事だけを一括挿入 (plan_links_to_content) と同じ挿入
+    (最大 max_links_per_post 個。process_articles() と同じ値を渡す) で計算する。
+    corpus を渡すと本文はスナップショットから読み、無い記事だけを WordPress から取得する。
+    戻り値: link_preview.run_preview() のレポート dict
     """
-    original_content = content
-
-    # --- ショートコードを一時退避 ---
-    shortcode_pattern = r"(\[.*?\])"
-    shortcodes = []
-    def shortcode_replacer(m):
-        shortcodes.append(m.group(0))
-        return f"__SHORTCODE_{len(shortcodes)-1}__"
-    content = re.sub(shortcode_pattern, shortcode_replacer, content)
-
-    # --- <a> タグ部分を一時退避 ---
-    #    （既存リンクは置換しないため、検索から除外しておく）
-    anchor_pattern = r"(<a[^>]*>.*?</a>)"
-    anchors = []
-    def anchor_replacer(m):
-        anchors.append(m.group(0))
-        return f"__ANCHOR_{len(anchors)-1}__"
-    content = re.sub(anchor_pattern, anchor_replacer, content, flags=re.IGNORECASE|re.DOTALL)
-
-    # ここから「最も上に出現するキーワード」を探し、見つかったら1回だけリンク化する
-    # link_mapping: { "キーワード": "URL", ... }
-    # まず全文を走査して最初に登場するキーワードを特定
-    first_match_index = None
-    first_match_kw = None
-    first_match_url = None
-
-    for i in range(len(content)):
-        # この時点でショートコードや既存リンクは除外済み（プレースホルダになっている）ので、
-        # テキストをそのまま検索すればOK
-        for kw, url in link_mapping.items():
-            # A=B の場合はスキップ
-            if url == article_url:
-                continue
-            # そこから先が kw かどうか
-            if content[i:i+len(kw)] == kw:
-                first_match_index = i
-                first_match_kw = kw
-                first_match_url = url
-                break
-        if first_match_kw is not None:
-            break
-
-    if first_match_kw is not None:
-        # キーワードをリンクに置き換える
-        # 先頭～キーワード部分 + <a> タグ + 末尾 を組み合わせる
-        before = content[:first_match_index]
-        matched = content[first_match_index:first_match_index+len(first_match_kw)]
-        after = content[first_match_index+len(first_match_kw):]
-        new_matched = f'<a href="{first_match_url}">{matched}</a>'
-        content = before + new_matched + after
-
-    # --- 一時退避した <a> タグを元に戻す ---
-    def anchor_restorer(m):
-        idx = int(m.group(1))
-        return anchors[idx]
-    content = re.sub(r"__ANCHOR_(\d+)__", anchor_restorer, content)
-
-    # --- ショートコードを元に戻す ---
-    def shortcode_restorer(m):
-        idx = int(m.group(1))
-        return shortcodes[idx]
-    content = re.sub(r"__SHORTCODE_(\d+)__", shortcode_restorer, content)
-
-    # 変更が無ければそのまま返す
-    return content
-
-def main():
+    session = create_session(pool_size=workers)
+    limiter = HostRateLimiter(rate)
+
+    def fetch(article):
+        raw_content = read_from_corpus(corpus, article)
+        if raw_content:
+            return raw_content
+        if not wp_url:
+            print(f"[WARN] Post {article['id']} is missing or outdated in the corpus")
+            return None
+        limiter.wait(wp_url)
+        raw_content = get_post_raw_content(article["id"], wp_url, wp_username, wp_password, session=session)
+        if not raw_content:
+            print(f"[WARN] No content for post {article['id']} ({article.get('title','')})")
+            return None
+        return raw_content
+
+    if kw_maps is not None:
+        return run_preview(articles_data, fetch, kw_maps=kw_maps, workers=workers, processes=processes,
+                           max_links_per_post=max_links_per_post)
+    return run_preview(articles_data, fetch, link_mapping=link_mapping,
+                       workers=workers, processes=processes)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="WordPress 記事へ内部リンクを挿入する")
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get("INSERT_LINKS_WORKERS", DEFAULT_WORKERS)),
+                        help="記事の取得・更新を並行実行するスレッド数")
+    parser.add_argument("--rate", type=float,
+                        default=float(os.environ.get("INSERT_LINKS_RATE", DEFAULT_RATE_PER_HOST)),
+                        help="WordPress への最大リクエスト数/秒 (0 で無制限)")
+    parser.add_argument("--state-path", default=INSERT_STATE_PATH,
+                        help="前回処理した本文・キーワードマップのハッシュを保存するファイル")
+    parser.add_argument("--no-skip", action="store_true",
+                        help="前回の状態を使わずに全記事を取得・変換する")
+    parser.add_argument("--corpus", nargs="?", const=CORPUS_PATH, default=None,
+                        help="本文をローカルスナップショット (corpus_store.py で同期) から読む "
+                             f"(パス省略時は {CORPUS_PATH})")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="WordPress を更新せず、挿入されるリンクのレポートだけを書き出す")
+    parser.add_argument("--processes", type=int,
+                        default=int(os.environ.get("INSERT_LINKS_PROCESSES", 0)) or None,
+                        help="リンク挿入 (ドライランでは挿入計画) を計算するプロセス数 (既定: CPU 数)")
+    parser.add_argument("--plan", nargs="?", const="reports/linkPlan.json", default=None,
+                        help="link_planner.py の計画 (記事ごとのキーワード) を実行する "
+                             "(パス省略時は reports/linkPlan.json)")
+    parser.add_argument("--report-path", default=PREVIEW_JSON_PATH,
+                        help="ドライランのレポート (JSON) の出力先")
+    parser.add_argument("--html-path", default=PREVIEW_HTML_PATH,
+                        help="ドライランの差分サマリー (HTML) の出力先")
+    return parser.parse_args(argv)
+
+@instrument_run("insert_links")
+def main(argv=None):
+    args = parse_args(argv)
+
     # 環境変数でWPのURL・認証情報を取得
     wp_url = os.environ.get("WP_URL", "")
     wp_username = os.environ.get("WP_USERNAME", "")
     wp_password = os.environ.get("WP_PASSWORD", "")
 
-    if not (wp_url and wp_username and wp_password):
+    # スナップショットからのドライランは WordPress に接続しないので認証情報が無くてもよい
+    if not (wp_url and wp_username and wp_password) and not (args.dry_run and args.corpus):
         print("[ERROR] Missing WP credentials")
         return
 
@@ -139,28 +281,60 @@ def main():
         print("[ERROR] articles.json is empty or missing")
         return
 
-    # 2) linkMapping をフラット化
+    # 2) linkMapping をフラット化し、キーワードオートマトンを一度だけ構築
     flat_map = flatten_link_mapping(mapping_data)
+    matcher = KeywordMatcher(flat_map)
 
-    # 3) 全記事をループし、該当URLだけ処理
-    for article in articles_data:
-        post_id = article["id"]
-        # ここでは記事のURLを仮に article["link"] として取得する例
-        article_link = article.get("link", "")
+    kw_maps, max_links_per_post = None, MAX_LINKS_PER_POST
+    if args.plan:
+        # link_planner は keyword_index 経由でこのモジュールを読むので、ここで読み込む
+        from link_planner import load_plan
+        if not os.path.exists(args.plan):
+            print(f"[ERROR] Plan {args.plan} not found. Run scripts/link_planner.py first.")
+            return
+        plan = load_plan(args.plan)
+        kw_maps = plan["posts"]
+        max_links_per_post = plan.get("params", {}).get("max_links_per_post", MAX_LINKS_PER_POST)
+        print(f"[INFO] Executing plan {args.plan}: {len(kw_maps)} posts, "
+              f"{sum(len(m) for m in kw_maps.values())} links")
 
-        raw_content = get_post_raw_content(post_id, wp_url, wp_username, wp_password)
-        if not raw_content:
-            print(f"[WARN] No content for post {post_id} ({article.get('title','')})")
-            continue
+    corpus = CorpusStore(args.corpus) if args.corpus else None
 
-        updated_content = insert_link_once(raw_content, flat_map, article_link)
+    if args.dry_run:
+        # ドライラン: 取得と挿入計画の計算だけを行い、レポートを書き出す
+        report = preview_articles(articles_data, flat_map, wp_url, wp_username, wp_password,
+                                  workers=args.workers, rate=args.rate, processes=args.processes,
+                                  corpus=corpus, kw_maps=kw_maps, max_links_per_post=max_links_per_post)
+        write_json_report(report, args.report_path)
+        write_html_report(report, args.html_path)
+        print(format_summary(report))
+        for key in ("changed_posts", "links", "fetch_failed", "failed"):
+            count(key, report["summary"][key])
+        print(f"[INFO] Wrote {args.report_path} and {args.html_path}")
+        print_metrics_summary()
+        return report
 
-        if updated_content != raw_content:
-            print(f"[INFO] Updating post {post_id} ({article.get('title','')})...")
-            status, _ = update_post_content(post_id, updated_content, wp_url, wp_username, wp_password)
-            print(f"    -> status={status}")
-        else:
-            print(f"[INFO] No changes for post {post_id} ({article.get('title','')})")
+    # 3) 全記事を 取得 → リンク挿入 → 更新 のパイプラインで並行処理
+    #    (前回から本文もキーワードマップも変わっていない記事は飛ばす)
+    state = InsertState(args.state_path)
+    stats = process_articles(articles_data, matcher, wp_url, wp_username, wp_password,
+                             workers=args.workers, rate=args.rate,
+                             state=None if args.no_skip else state, corpus=corpus,
+                             processes=args.processes, kw_maps=kw_maps,
+                             max_links_per_post=max_links_per_post)
+    if not args.no_skip:
+        state.save()
+    for key in ("updated", "unchanged", "fetch_failed", "transform_failed", "write_failed",
+                "skipped_unfetched", "skipped_unchanged"):
+        count(key, stats.get(key, 0))
+    processed = stats["total"] - stats["skipped_unfetched"] - stats["skipped_unchanged"]
+    print(f"[INFO] Done: {stats['total']} posts in {stats['elapsed']:.1f}s "
+          f"(skipped={stats['skipped_unfetched'] + stats['skipped_unchanged']} "
+          f"[unfetched={stats['skipped_unfetched']}, unchanged={stats['skipped_unchanged']}], "
+          f"processed={processed}, updated={stats['updated']}, no_changes={stats['unchanged']}, "
+          f"fetch_failed={stats['fetch_failed']}, write_failed={stats['write_failed']})")
+    print_metrics_summary()
+    return stats
 
 if __name__ == "__main__":
     main()
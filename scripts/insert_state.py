@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+insert_links.py の前回実行の状態 (記事ごとのハッシュ) を保存し、変化の無い記事を飛ばす。
+
+記事ID → {
+    "content_hash": 取得した本文のハッシュ,
+    "output_hash":  リンク挿入後 (WordPress に書き込んだ/書き込む必要が無かった) 本文のハッシュ,
+    "map_hash":     その記事に適用したキーワードマップのハッシュ,
+    "modified":     articles.json の更新日時,
+}
+
+- articles.json の modified と map_hash が前回と同じなら、取得もしない
+- 取得した本文が前回の入力か出力と同じで map_hash も同じなら、変換もしない
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+from json_store import atomic_write_bytes
+
+INSERT_STATE_PATH = os.path.join(".cache", "insertState.json")
+# insert_link_once の挙動を変えたら上げる (全記事を処理し直す)
+TRANSFORM_VERSION = 1
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def mapping_hash(link_mapping: dict) -> str:
+    """キーワードマップ全体のハッシュ (キーの順序には依存しない)"""
+    payload = json.dumps(sorted(link_mapping.items()), ensure_ascii=False)
+    return content_hash(f"{TRANSFORM_VERSION}\n{payload}")
+
+
+def effective_map_hash(global_map_hash: str, article_url: str) -> str:
+    """記事に適用されるキーワードマップ (自記事へのリンクを除いたもの) のハッシュ"""
+    return content_hash(f"{global_map_hash}\n{article_url}")
+
+
+class InsertState:
+    def __init__(self, path=INSERT_STATE_PATH):
+        self.path = path
+        self.posts = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.posts = json.load(f).get("posts", {})
+            except (OSError, ValueError) as e:
+                print(f"[WARN] Ignoring broken insert state {path}: {e}")
+
+    def can_skip_fetch(self, post_id: str, modified: str, map_hash: str) -> bool:
+        """記事の更新日時もキーワードマップも前回と同じなら取得不要"""
+        if not modified:
+            return False
+        with self._lock:
+            entry = self.posts.get(post_id)
+        return bool(entry) and entry.get("modified") == modified and entry.get("map_hash") == map_hash
+
+    def can_skip_transform(self, post_id: str, raw_hash: str, map_hash: str) -> bool:
+        """本文が前回の入力か出力のままで、キーワードマップも同じなら変換不要"""
+        with self._lock:
+            entry = self.posts.get(post_id)
+        return (bool(entry) and entry.get("map_hash") == map_hash
+                and raw_hash in (entry.get("content_hash"), entry.get("output_hash")))
+
+    def record(self, post_id: str, raw_hash: str, output_hash: str, map_hash: str, modified: str):
+        with self._lock:
+            self.posts[post_id] = {
+                "content_hash": raw_hash,
+                "output_hash": output_hash,
+                "map_hash": map_hash,
+                "modified": modified or "",
+            }
+
+    def touch(self, post_id: str, modified: str):
+        """変換を飛ばした記事の更新日時だけを進め、次回は取得も飛ばせるようにする"""
+        with self._lock:
+            if post_id in self.posts and modified:
+                self.posts[post_id]["modified"] = modified
+
+    def save(self):
+        """一時ファイルに書いてから置き換える (json_store.atomic_write_bytes)"""
+        with self._lock:
+            data = {"posts": dict(self.posts)}
+        atomic_write_bytes(json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), self.path)
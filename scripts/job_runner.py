@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Streamlit から起動する時間のかかる処理 (一括リンク挿入・記事一覧取得・リンク使用状況の調査) を
+スクリプトのスレッドとは別のワーカースレッドで実行するジョブ管理。
+
+- ジョブの状態は .cache/jobs/<ジョブID>.json に保存し、ブラウザを再読み込みしても
+  画面から進捗 (完了数/総数・処理速度・エラー) を読み直せる
+- 一括挿入ジョブは処理し終えた記事を .cache/jobs/<ジョブID>.items.jsonl に追記し、
+  キャンセル・失敗・サーバ再起動の後は「再開」で残りの記事だけを処理する
+- 記事一覧取得・使用状況調査は既存スクリプト (crawl_links.py / detect_link_usage.py) を
+  子プロセスで実行する。キャンセルで子プロセスを止め、再開は同じコマンドを再実行する
+  (detect_link_usage.py はジャーナルから、crawl_links.py は差分取得カーソルから続きを処理する)
+
+WordPress の認証情報は状態ファイルに保存せず、実行時に環境変数から読む。
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from content_tokenizer import build_linked_content, build_unlinked_content
+from http_client import create_session
+from insert_links import get_post_raw_content, update_post_content
+from json_store import atomic_write_bytes
+from link_transform import normalize_unlink_urls, plan_links_to_content, plan_unlinks
+from wp_pipeline import DEFAULT_RATE_PER_HOST, DEFAULT_WORKERS, HostRateLimiter, run_pipeline
+
+JOBS_DIR = os.path.join(".cache", "jobs")
+JOB_WORKERS = 2           # 同時に実行するジョブ数
+SAVE_INTERVAL = 0.5       # 進捗を状態ファイルへ書き出す最短間隔 (秒)
+POLL_INTERVAL = 1.0       # 子プロセスの進捗を確認する間隔 (秒)
+MAX_ERRORS_KEPT = 20      # 状態ファイルに残す直近のエラーメッセージ数
+
+KIND_INSERT = "insert"    # linkUsage に基づく一括リンク挿入
+KIND_CRAWL = "crawl"      # crawl_links.py
+KIND_DETECT = "detect"    # detect_link_usage.py
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+INTERRUPTED = "interrupted"  # 実行中にプロセスが終了した (再開できる)
+FINISHED_STATUSES = (DONE, FAILED, CANCELLED, INTERRUPTED)
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_JOBS = {
+    KIND_CRAWL: os.path.join(SCRIPTS_DIR, "crawl_links.py"),
+    KIND_DETECT: os.path.join(SCRIPTS_DIR, "detect_link_usage.py"),
+}
+
+
+def _write_json(data, path):
+    """一時ファイルに書いてから置き換える (json_store.atomic_write_bytes)"""
+    atomic_write_bytes(json.dumps(data, ensure_ascii=False).encode("utf-8"), path)
+
+
+class JobContext:
+    """ジョブの処理関数に渡す進捗報告用のオブジェクト (複数スレッドから呼んでよい)"""
+
+    def __init__(self, runner, state, cancel_event):
+        self.runner = runner
+        self.state = state
+        self.params = state["params"]
+        self.kind = state["kind"]
+        self.log_path = runner.path_for(state["id"], ".log")
+        self._cancel = cancel_event
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        self._items_path = runner.path_for(state["id"], ".items.jsonl")
+        self._done_items = set()
+        if os.path.exists(self._items_path):
+            with open(self._items_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue
+                    if rec.get("ok"):
+                        self._done_items.add(rec["id"])
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def is_done(self, item_id) -> bool:
+        """前回までの実行で処理済みの項目か"""
+        return item_id in self._done_items
+
+    def start_progress(self, done: int, total: int):
+        """実行開始時の進捗 (再開時は処理済みの件数) を設定する。処理速度はここから数える"""
+        with self._lock:
+            self.state.update(done=done, total=total, run_done_start=done)
+        self._save(force=True)
+
+    def set_progress(self, done: int, total: int = None):
+        """項目ごとに報告できないジョブ (子プロセス) の進捗"""
+        with self._lock:
+            self.state["done"] = done
+            if total is not None:
+                self.state["total"] = total
+        self._save()
+
+    def item_done(self, item_id, ok=True, error=None, skipped=False):
+        """1項目の処理結果を記録する。ok の項目は再開時に飛ばす"""
+        with self._lock:
+            self.state["done"] += 1
+            if skipped:
+                self.state["skipped"] += 1
+            if not ok:
+                self.state["failed"] += 1
+                self._add_error(f"{item_id}: {error}")
+            with open(self._items_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"id": item_id, "ok": ok}, ensure_ascii=False) + "\n")
+            if ok:
+                self._done_items.add(item_id)
+        self._save()
+
+    def _add_error(self, message):
+        errors = self.state["errors"]
+        errors.append(message)
+        del errors[:-MAX_ERRORS_KEPT]
+
+    def _save(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_save < SAVE_INTERVAL:
+                return
+            self._last_save = now
+            self.state["updated"] = time.time()
+            snapshot = json.loads(json.dumps(self.state))
+        self.runner.save_state(snapshot)
+
+
+class JobRunner:
+    """ジョブをワーカースレッドで実行し、状態をファイルに保存する"""
+
+    def __init__(self, jobs_dir=JOBS_DIR, workers=JOB_WORKERS):
+        self.jobs_dir = jobs_dir
+        self._pool = ThreadPoolExecutor(max(1, workers), thread_name_prefix="job")
+        self._active = {}  # ジョブID -> キャンセル用 Event (このプロセスで実行中・待機中のもの)
+        self._lock = threading.Lock()
+
+    def path_for(self, job_id: str, suffix: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}{suffix}")
+
+    def save_state(self, state: dict):
+        _write_json(state, self.path_for(state["id"], ".json"))
+
+    def submit(self, kind: str, params: dict, label: str = "") -> str:
+        """ジョブを登録してワーカーに渡し、ジョブIDを返す"""
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        state = {
+            "id": job_id,
+            "kind": kind,
+            "label": label or kind,
+            "params": params,
+            "status": QUEUED,
+            "total": 0,
+            "done": 0,
+            "failed": 0,
+            "skipped": 0,
+            "errors": [],
+            "message": "",
+            "runs": 0,
+            "created": time.time(),
+            "started": None,
+            "run_started": None,
+            "run_done_start": 0,
+            "updated": time.time(),
+            "finished": None,
+        }
+        self.save_state(state)
+        self._start(job_id)
+        return job_id
+
+    def _start(self, job_id: str):
+        event = threading.Event()
+        with self._lock:
+            self._active[job_id] = event
+        self._pool.submit(self._run, job_id, event)
+
+    def _run(self, job_id: str, event: threading.Event):
+        state = self._load(job_id)
+        try:
+            if event.is_set():
+                state["status"] = CANCELLED
+                return
+            now = time.time()
+            state.update(status=RUNNING, runs=state["runs"] + 1, run_started=now,
+                         run_done_start=state["done"], failed=0, finished=None, message="")
+            state["started"] = state["started"] or now
+            self.save_state(state)
+
+            ctx = JobContext(self, state, event)
+            JOB_HANDLERS[state["kind"]](ctx)
+            state["status"] = CANCELLED if event.is_set() else DONE
+        except Exception as e:
+            state["status"] = FAILED
+            state["message"] = str(e)
+            print(f"[ERROR] Job {job_id} failed: {e}")
+        finally:
+            state["finished"] = state["updated"] = time.time()
+            self.save_state(state)
+            with self._lock:
+                self._active.pop(job_id, None)
+
+    def _load(self, job_id: str) -> dict:
+        with open(self.path_for(job_id, ".json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def is_active(self, job_id: str) -> bool:
+        with self._lock:
+            return job_id in self._active
+
+    def get(self, job_id: str) -> dict:
+        """
+        ジョブの状態を返す。実行中のはずなのにこのプロセスで動いていないジョブ
+        (サーバの再起動などで止まったもの) は interrupted として保存し直す。
+        """
+        state = self._load(job_id)
+        if state["status"] in (QUEUED, RUNNING) and not self.is_active(job_id):
+            state["status"] = INTERRUPTED
+            state["finished"] = state["finished"] or time.time()
+            self.save_state(state)
+        return state
+
+    def list_jobs(self, limit=20) -> list:
+        """新しい順にジョブの状態を返す"""
+        if not os.path.isdir(self.jobs_dir):
+            return []
+        ids = sorted((name[:-5] for name in os.listdir(self.jobs_dir) if name.endswith(".json")), reverse=True)
+        jobs = []
+        for job_id in ids[:limit]:
+            try:
+                jobs.append(self.get(job_id))
+            except (OSError, ValueError):
+                continue
+        return jobs
+
+    def cancel(self, job_id: str) -> bool:
+        with self._lock:
+            event = self._active.get(job_id)
+        if event is None:
+            return False
+        event.set()
+        return True
+
+    def resume(self, job_id: str) -> bool:
+        """終了したジョブを再実行する (一括挿入は処理済みの記事を飛ばす)"""
+        state = self.get(job_id)
+        if state["status"] not in (FAILED, CANCELLED, INTERRUPTED) or self.is_active(job_id):
+            return False
+        state["status"] = QUEUED
+        self.save_state(state)
+        self._start(job_id)
+        return True
+
+
+def throughput(state: dict) -> float:
+    """今回の実行での処理速度 (項目/秒)"""
+    if not state.get("run_started"):
+        return 0.0
+    end = state["finished"] or state["updated"]
+    elapsed = max(end - state["run_started"], 1e-6)
+    return (state["done"] - state.get("run_done_start", 0)) / elapsed
+
+
+# ===================================
+# ジョブの処理関数
+# ===================================
+def run_insert_job(ctx: JobContext):
+    """
+    params:
+      kw_maps: {記事ID: {キーワード: URL}} (linkUsage で ON になっているもの)
+      unlink_maps: {記事ID: [URL, ...]} 既存リンクを外すリンク先 (OFF にしたキーワードの URL)
+      article_urls: {記事ID: 記事URL} (unlink_maps の相対リンクの解決用)
+      workers / rate: 並行数と WordPress への最大リクエスト数/秒
+      use_index: True ならキーワード索引で本文にキーワードが無い記事を飛ばす
+      modified: {記事ID: articles.json の更新日時} (索引の鮮度の確認用)
+
+    リンクの削除と挿入は記事ごとに1回の取得・1回の更新でまとめて行う
+    (先に unlink_maps のリンクを外し、その本文へ kw_maps のリンクを挿入する)。
+    """
+    wp_url = os.environ.get("WP_URL", "")
+    wp_username = os.environ.get("WP_USERNAME", "")
+    wp_password = os.environ.get("WP_PASSWORD", "")
+    if not (wp_url and wp_username and wp_password):
+        raise RuntimeError("WP_URL / WP_USERNAME / WP_PASSWORD が未設定です")
+
+    kw_maps = ctx.params["kw_maps"]
+    unlink_targets = {art_id: normalize_unlink_urls(urls)
+                      for art_id, urls in ctx.params.get("unlink_maps", {}).items() if urls}
+    article_urls = ctx.params.get("article_urls", {})
+    workers = ctx.params.get("workers", DEFAULT_WORKERS)
+    article_ids = list(kw_maps) + [art_id for art_id in unlink_targets if art_id not in kw_maps]
+    items = [art_id for art_id in article_ids if not ctx.is_done(art_id)]
+    ctx.start_progress(len(article_ids) - len(items), len(article_ids))
+
+    if ctx.params.get("use_index"):
+        # Streamlit と循環しないよう、使うときだけ読み込む
+        from keyword_index import KEYWORD_INDEX_PATH, KeywordIndex
+        if os.path.exists(KEYWORD_INDEX_PATH):
+            modified = ctx.params.get("modified", {})
+            with KeywordIndex(KEYWORD_INDEX_PATH) as index:
+                remaining = []
+                for art_id in items:
+                    # 外すリンクがある記事は、キーワードの有無にかかわらず取得する
+                    if art_id not in unlink_targets and \
+                            index.contains_any(art_id, kw_maps[art_id], modified.get(art_id, "")) is False:
+                        ctx.item_done(art_id, skipped=True)
+                    else:
+                        remaining.append(art_id)
+                items = remaining
+
+    session = create_session(pool_size=workers * 2, retry_post=True)
+    limiter = HostRateLimiter(ctx.params.get("rate", DEFAULT_RATE_PER_HOST))
+
+    def recorded(stage):
+        # 段の例外もその記事の失敗として記録する (例外は run_pipeline の集計のためそのまま送る)
+        def call(art_id, *args):
+            try:
+                return stage(art_id, *args)
+            except Exception as e:
+                ctx.item_done(art_id, ok=False, error=str(e))
+                raise
+        return call
+
+    def fetch(art_id):
+        if ctx.cancelled:
+            return None
+        limiter.wait(wp_url)
+        raw_content = get_post_raw_content(int(art_id), wp_url, wp_username, wp_password, session=session)
+        if not raw_content:
+            ctx.item_done(art_id, ok=False, error="本文を取得できませんでした")
+            return None
+        return raw_content
+
+    def transform(art_id, raw_content):
+        content = raw_content
+        base_url = article_urls.get(art_id) or wp_url
+        if art_id in unlink_targets:
+            anchors = plan_unlinks(content, unlink_targets[art_id], base_url)
+            content = build_unlinked_content(content, anchors)
+        links = plan_links_to_content(content, kw_maps[art_id], base_url=base_url) if kw_maps.get(art_id) else []
+        content = build_linked_content(content, links)
+        if content == raw_content:
+            ctx.item_done(art_id)
+            return None
+        return content
+
+    def write(art_id, updated_content):
+        if ctx.cancelled:
+            return False
+        limiter.wait(wp_url)
+        status, _ = update_post_content(int(art_id), updated_content, wp_url, wp_username, wp_password,
+                                        session=session)
+        ok = status == 200
+        ctx.item_done(art_id, ok=ok, error=None if ok else f"HTTP {status}")
+        return ok
+
+    run_pipeline(items, recorded(fetch), recorded(transform), recorded(write), workers=workers,
+                 label=lambda art_id: f"post {art_id}")
+
+    # キャンセルで取得・更新を飛ばした記事は記録しない (再開時に処理し直す)。
+    # 未処理の件数をジョブの状態に残し、キャンセル以外で残った場合は失敗にする
+    unfinished = ctx.state["total"] - ctx.state["done"]
+    if unfinished > 0:
+        if ctx.cancelled:
+            ctx.state["message"] = f"キャンセルしました (未処理 {unfinished} 件)"
+        else:
+            raise RuntimeError(f"{unfinished} 件の記事の処理結果が記録されていません")
+
+
+def _count_journal_lines(path: str) -> int:
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb") as f:
+        return max(0, sum(1 for _ in f) - 1)  # 1行目はヘッダ
+
+
+def run_script_job(ctx: JobContext):
+    """
+    既存スクリプトを子プロセスで実行する。出力は .cache/jobs/<ジョブID>.log へ。
+    params:
+      args: スクリプトに渡す引数のリスト
+      total: 進捗の総数 (detect は articles.json の記事数)
+    """
+    cmd = [sys.executable, SCRIPT_JOBS[ctx.kind]] + list(ctx.params.get("args", []))
+    total = ctx.params.get("total", 0)
+    ctx.start_progress(0, total)
+    journal_path = None
+    if ctx.kind == KIND_DETECT:
+        from detect_link_usage import JOURNAL_PATH
+        journal_path = JOURNAL_PATH
+
+    with open(ctx.log_path, "a", encoding="utf-8") as log:
+        log.write(f"$ {' '.join(cmd)}\n")
+        log.flush()
+        proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+        while proc.poll() is None:
+            if ctx.cancelled:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+                return
+            if journal_path:
+                ctx.set_progress(min(_count_journal_lines(journal_path), total))
+            time.sleep(POLL_INTERVAL)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{os.path.basename(cmd[1])} exited with code {proc.returncode}")
+    ctx.set_progress(total, total)
+
+
+JOB_HANDLERS = {
+    KIND_INSERT: run_insert_job,
+    KIND_CRAWL: run_script_job,
+    KIND_DETECT: run_script_job,
+}
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner() -> JobRunner:
+    """プロセス内で共有する JobRunner (Streamlit の再実行をまたいで同じものを返す)"""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner()
+        return _runner
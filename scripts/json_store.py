@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+data/ の JSON ファイルの安全な保存と、Streamlit での編集のまとめ書き。
+
+- atomic_write_json(): 同じディレクトリの一時ファイルに書いて fsync し、os.replace で置き換える。
+  途中でプロセスが落ちても、元のファイルか新しいファイルのどちらかが必ず残る。
+- JsonDraft: ファイル1つ分の編集中のコピー。編集はメモリ上に溜めて (mark_edited)、
+  flush() でまとめて1回だけ書き出す。refresh() は mtime とサイズが変わったときだけファイルを読み、
+  内容のハッシュが同じならパースし直さない。
+
+    draft = JsonDraft("data/linkMapping.json", dict)
+    draft.refresh()
+    draft.data["カテゴリ"]["キーワード"] = "https://..."
+    draft.mark_edited()
+    if draft.due(AUTOSAVE_DELAY):
+        draft.flush()
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+# JsonDraft.refresh() の戻り値
+UNCHANGED = "unchanged"
+RELOADED = "reloaded"
+CONFLICT = "conflict"   # 未保存の編集があるのにファイルが外部で書き換えられた
+
+
+def dump_json_bytes(data) -> bytes:
+    """data/ の JSON と同じ書式 (ensure_ascii=False, indent=2) の UTF-8 バイト列"""
+    return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def stat_signature(path: str):
+    """(mtime_ns, サイズ)。ファイルが無ければ None"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def atomic_write_bytes(payload: bytes, path: str):
+    """一時ファイルに書いて fsync してから置き換える (既存ファイルのパーミッションは引き継ぐ)"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    if hasattr(os, "O_DIRECTORY"):
+        # 置き換え (ディレクトリエントリの更新) 自体もディスクに書き出す
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def atomic_write_json(data, path: str) -> str:
+    """JSON を原子的に保存し、書いた内容の SHA-1 を返す"""
+    payload = dump_json_bytes(data)
+    atomic_write_bytes(payload, path)
+    return hashlib.sha1(payload).hexdigest()
+
+
+class JsonDraft:
+    """
+    JSON ファイル1つの編集中のコピー。
+    data を直接書き換えて mark_edited() を呼び、flush() でまとめて保存する。
+    """
+
+    def __init__(self, path: str, default_factory=dict):
+        self.path = path
+        self.default_factory = default_factory
+        self.data = default_factory()
+        self.signature = None   # 最後に読んだ・書いたときの (mtime_ns, サイズ)
+        self.digest = None      # その内容の SHA-1
+        self.pending = 0        # 未保存の編集の数
+        self.last_edit = 0.0
+        self.writes = 0
+        self._load()
+
+    def _read(self):
+        """(シグネチャ, ハッシュ, バイト列)。ファイルが無ければ (None, None, None)"""
+        signature = stat_signature(self.path)
+        if signature is None:
+            return None, None, None
+        with open(self.path, "rb") as f:
+            payload = f.read()
+        return signature, hashlib.sha1(payload).hexdigest(), payload
+
+    def _load(self):
+        self.signature, self.digest, payload = self._read()
+        self.data = json.loads(payload) if payload else self.default_factory()
+        self.pending = 0
+
+    def refresh(self) -> str:
+        """
+        ファイルが外部で変わっていれば読み直す。
+        mtime とサイズが前回と同じなら読まず、読んでも内容のハッシュが同じならパースしない。
+        未保存の編集がある場合は読み直さずに CONFLICT を返す。
+        """
+        if stat_signature(self.path) == self.signature:
+            return UNCHANGED
+        signature, digest, payload = self._read()
+        if digest == self.digest:
+            self.signature = signature
+            return UNCHANGED
+        if self.pending:
+            return CONFLICT
+        self.signature, self.digest = signature, digest
+        self.data = json.loads(payload) if payload else self.default_factory()
+        return RELOADED
+
+    def mark_edited(self):
+        self.pending += 1
+        self.last_edit = time.monotonic()
+
+    def due(self, delay: float) -> bool:
+        """未保存の編集があり、最後の編集から delay 秒経った"""
+        return bool(self.pending) and time.monotonic() - self.last_edit >= delay
+
+    def flush(self) -> bool:
+        """未保存の編集をまとめて保存する。保存したら True"""
+        if not self.pending:
+            return False
+        self.digest = atomic_write_json(self.data, self.path)
+        self.signature = stat_signature(self.path)
+        self.pending = 0
+        self.writes += 1
+        return True
+
+    def discard(self):
+        """未保存の編集を捨て、ファイルの内容を読み直す"""
+        self._load()
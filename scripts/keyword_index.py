@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+キーワード → 記事 の転置索引 (SQLite)。
+
+本文のスナップショット (corpus_store.py) を KeywordMatcher で走査し、linkMapping の各キーワードが
+どの記事の地の文 (リンク化できる箇所) に何回・最初にどの位置で出現するかを保存する。
+Streamlit の「全記事リンク管理」で、キーワードを ON にする前にリンクを入れられる記事を
+ミリ秒で絞り込むために使う。
+
+更新は差分のみ:
+- スナップショットの更新日時が変わった記事 (と新しい記事) だけを全キーワードで走査し直す
+- linkMapping に追加されたキーワードは、そのキーワードだけのオートマトンで残りの記事を走査する
+- 削除されたキーワード・記事の行は消す
+
+    python scripts/keyword_index.py                 # 索引を更新
+    python scripts/keyword_index.py --query 格安SIM  # キーワードを含む記事を表示
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+
+from content_tokenizer import iter_text_spans
+from corpus_store import CORPUS_PATH, CorpusStore
+from insert_links import flatten_link_mapping, load_json
+from keyword_matcher import KeywordMatcher
+
+KEYWORD_INDEX_PATH = os.path.join(".cache", "keywordIndex.sqlite3")
+LINK_MAPPING_JSON = os.path.join("data", "linkMapping.json")
+SCHEMA_VERSION = 1  # テーブル構成・走査ルールを変えたら上げる (索引を作り直す)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS indexed_posts (
+    post_id  TEXT PRIMARY KEY,
+    modified TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS indexed_keywords (
+    keyword TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS hits (
+    keyword      TEXT NOT NULL,
+    post_id      TEXT NOT NULL,
+    count        INTEGER NOT NULL,
+    first_offset INTEGER NOT NULL,
+    PRIMARY KEY (keyword, post_id)
+);
+CREATE INDEX IF NOT EXISTS hits_by_post ON hits (post_id);
+"""
+
+
+def scan_keywords(content: str, matcher) -> dict:
+    """本文の地の文に出現するキーワードごとに {キーワード: [回数, 最初の位置]} を返す"""
+    found = {}
+    for start, end in iter_text_spans(content):
+        for pos, kw in matcher.iter_matches(content, start, end):
+            entry = found.get(kw)
+            if entry is None:
+                found[kw] = [1, pos]
+            else:
+                entry[0] += 1
+                if pos < entry[1]:
+                    entry[1] = pos
+    return found
+
+
+class KeywordIndex:
+    def __init__(self, path=KEYWORD_INDEX_PATH):
+        self.path = path
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self._conn.executescript(
+                "DROP TABLE IF EXISTS hits; DROP TABLE IF EXISTS indexed_posts; "
+                "DROP TABLE IF EXISTS indexed_keywords;")
+            self._conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---- 更新 ----
+
+    def _replace_hits(self, post_id: str, found: dict):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO hits (keyword, post_id, count, first_offset) VALUES (?, ?, ?, ?)",
+            [(kw, post_id, count, first) for kw, (count, first) in found.items()])
+
+    def update(self, corpus, link_mapping: dict) -> dict:
+        """
+        corpus (CorpusStore) と {キーワード: URL} に合わせて索引を差分更新する。
+        戻り値: {"posts", "rescanned", "new_keywords", "removed_keywords", "removed_posts", "elapsed"}
+        """
+        started = time.perf_counter()
+        conn = self._conn
+        keywords = {kw for kw in link_mapping if kw}
+        old_keywords = {kw for (kw,) in conn.execute("SELECT keyword FROM indexed_keywords")}
+        indexed = dict(conn.execute("SELECT post_id, modified FROM indexed_posts"))
+        current = corpus.modified_map()
+
+        removed_keywords = old_keywords - keywords
+        new_keywords = keywords - old_keywords
+        removed_posts = set(indexed) - set(current)
+
+        conn.executemany("DELETE FROM hits WHERE keyword = ?", [(kw,) for kw in removed_keywords])
+        conn.executemany("DELETE FROM indexed_keywords WHERE keyword = ?", [(kw,) for kw in removed_keywords])
+        conn.executemany("DELETE FROM hits WHERE post_id = ?", [(pid,) for pid in removed_posts])
+        conn.executemany("DELETE FROM indexed_posts WHERE post_id = ?", [(pid,) for pid in removed_posts])
+
+        full_matcher = KeywordMatcher({kw: "" for kw in keywords})
+        new_matcher = KeywordMatcher({kw: "" for kw in new_keywords}) if new_keywords else None
+        rescanned = 0
+        for post in corpus.iter_posts():
+            post_id = post["id"]
+            if indexed.get(post_id) != post["modified"]:
+                # 本文が変わった (か未索引の) 記事は全キーワードで走査し直す
+                conn.execute("DELETE FROM hits WHERE post_id = ?", (post_id,))
+                self._replace_hits(post_id, scan_keywords(post["content"], full_matcher))
+                conn.execute("INSERT OR REPLACE INTO indexed_posts (post_id, modified) VALUES (?, ?)",
+                             (post_id, post["modified"]))
+                rescanned += 1
+            elif new_matcher is not None:
+                # 本文はそのままなので、追加されたキーワードだけを探す
+                self._replace_hits(post_id, scan_keywords(post["content"], new_matcher))
+
+        conn.executemany("INSERT OR IGNORE INTO indexed_keywords (keyword) VALUES (?)",
+                         [(kw,) for kw in new_keywords])
+        conn.commit()
+        return {
+            "posts": len(current),
+            "rescanned": rescanned,
+            "new_keywords": len(new_keywords),
+            "removed_keywords": len(removed_keywords),
+            "removed_posts": len(removed_posts),
+            "elapsed": time.perf_counter() - started,
+        }
+
+    # ---- 参照 ----
+
+    def articles_for(self, keyword: str) -> list:
+        """キーワードを含む記事を出現回数の多い順に [{"id", "count", "first_offset"}, ...] で返す"""
+        rows = self._conn.execute(
+            "SELECT post_id, count, first_offset FROM hits WHERE keyword = ? "
+            "ORDER BY count DESC, post_id", (keyword,))
+        return [{"id": pid, "count": count, "first_offset": first} for pid, count, first in rows]
+
+    def keywords_for(self, post_id: str) -> dict:
+        """記事に出現するキーワード {キーワード: (回数, 最初の位置)}"""
+        rows = self._conn.execute(
+            "SELECT keyword, count, first_offset FROM hits WHERE post_id = ?", (str(post_id),))
+        return {kw: (count, first) for kw, count, first in rows}
+
+    def candidate_counts(self) -> dict:
+        """{キーワード: そのキーワードを含む記事数} (索引済みで出現の無いキーワードは 0)"""
+        counts = {kw: 0 for (kw,) in self._conn.execute("SELECT keyword FROM indexed_keywords")}
+        counts.update(self._conn.execute("SELECT keyword, COUNT(*) FROM hits GROUP BY keyword"))
+        return counts
+
+    def iter_hits(self):
+        """索引の全行を (キーワード, 記事ID, 回数, 最初の位置) で返す (link_planner.py の出現行列)"""
+        return iter(self._conn.execute("SELECT keyword, post_id, count, first_offset FROM hits").fetchall())
+
+    def indexed_modified(self, post_id: str):
+        """記事を索引したときのスナップショットの更新日時 (未索引なら None)"""
+        row = self._conn.execute(
+            "SELECT modified FROM indexed_posts WHERE post_id = ?", (str(post_id),)).fetchone()
+        return row[0] if row else None
+
+    def contains_any(self, post_id: str, keywords, modified: str):
+        """
+        記事の本文に keywords のいずれかが出現するか。
+        索引が articles.json の更新日時 (modified) と一致しない・未索引のキーワードがあるなど、
+        判断できない場合は None を返す (呼び出し側は従来どおり取得して確かめる)。
+        """
+        if not modified or self.indexed_modified(post_id) != modified:
+            return None
+        keywords = list(keywords)
+        if not keywords:
+            return False
+        marks = ",".join("?" * len(keywords))
+        known = self._conn.execute(
+            f"SELECT COUNT(*) FROM indexed_keywords WHERE keyword IN ({marks})", keywords).fetchone()[0]
+        if known != len(set(keywords)):
+            return None
+        hit = self._conn.execute(
+            f"SELECT 1 FROM hits WHERE post_id = ? AND keyword IN ({marks}) LIMIT 1",
+            [str(post_id)] + keywords).fetchone()
+        return hit is not None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="キーワード → 記事 の転置索引を更新・検索する")
+    parser.add_argument("--path", default=KEYWORD_INDEX_PATH, help="索引の SQLite ファイル")
+    parser.add_argument("--corpus-path", default=CORPUS_PATH, help="本文のスナップショット")
+    parser.add_argument("--query", help="索引を更新した後、このキーワードを含む記事を表示する")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.exists(args.corpus_path):
+        print(f"[ERROR] Corpus {args.corpus_path} not found. Run scripts/corpus_store.py first.")
+        return
+    link_mapping = flatten_link_mapping(load_json(LINK_MAPPING_JSON))
+
+    with CorpusStore(args.corpus_path) as corpus, KeywordIndex(args.path) as index:
+        stats = index.update(corpus, link_mapping)
+        print(f"[INFO] Keyword index updated: {stats['posts']} posts, {len(link_mapping)} keywords "
+              f"(rescanned={stats['rescanned']}, new_keywords={stats['new_keywords']}, "
+              f"removed_keywords={stats['removed_keywords']}, removed_posts={stats['removed_posts']}) "
+              f"in {stats['elapsed']:.2f}s")
+        if args.query:
+            hits = index.articles_for(args.query)
+            print(f"[INFO] '{args.query}' appears in {len(hits)} posts")
+            for hit in hits:
+                print(f"    post {hit['id']}: count={hit['count']} first_offset={hit['first_offset']}")
+    return stats
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+linkMapping のキーワード検索用 Aho-Corasick オートマトン。
+
+flatten_link_mapping() の結果 {キーワード: URL} から一度だけ構築し、
+insert_links.py / manage_link_mapping.py の双方で使い回す。
+本文を 1 回走査するだけで全キーワードの出現位置が分かるため、
+キーワード数が増えても 1 記事あたりの処理時間はほぼ本文長に比例する。
+"""
+
+from collections import deque
+
+
+class KeywordMatcher:
+    """
+    {キーワード: URL} からコンパイルしたキーワードオートマトン。
+
+    - find_first(): 最も手前に出現するキーワード (同じ位置なら最長のもの) を返す
+    - iter_matches(): 全出現位置 (重なりも含む) を本文の先頭から順に返す
+    """
+
+    def __init__(self, link_mapping: dict):
+        # 空キーワードはどこにでもマッチしてしまうので除外
+        self.link_mapping = {kw: url for kw, url in link_mapping.items() if kw}
+        self.max_len = max((len(kw) for kw in self.link_mapping), default=0)
+
+        # 状態ごとの遷移 / 失敗リンク / 出力 (その状態で終わるキーワード)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        for kw in self.link_mapping:
+            node = 0
+            for ch in kw:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append(kw)
+
+        # 幅優先で失敗リンクを張り、出力を失敗先から引き継ぐ
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+        # 同じ終端位置では長いキーワードを先に評価する
+        for out in self._out:
+            out.sort(key=len, reverse=True)
+
+    def __len__(self):
+        return len(self.link_mapping)
+
+    def _step(self, node, ch):
+        goto = self._goto
+        fail = self._fail
+        while node and ch not in goto[node]:
+            node = fail[node]
+        return goto[node].get(ch, 0)
+
+    def iter_matches(self, text: str, start: int = 0, end: int = None):
+        """
+        text[start:end] に含まれるキーワードの出現を (開始位置, キーワード) で返す。
+        終端位置の昇順に返すため、開始位置の順序は保証しない。
+        """
+        if not self.link_mapping:
+            return
+        if end is None:
+            end = len(text)
+        out = self._out
+        node = 0
+        for i in range(start, end):
+            node = self._step(node, text[i])
+            for kw in out[node]:
+                yield i - len(kw) + 1, kw
+
+    def find_first(self, text: str, start: int = 0, end: int = None, exclude_urls=()):
+        """
+        text[start:end] で最も手前に出現するキーワードを探す。
+        同じ開始位置に複数マッチする場合は最長のキーワードを優先する。
+        URL が exclude_urls に含まれるキーワード (自己リンク等) は無視する。
+
+        戻り値: (開始位置, キーワード, URL) / 見つからなければ None
+        """
+        if not self.link_mapping:
+            return None
+        if end is None:
+            end = len(text)
+        mapping = self.link_mapping
+        out = self._out
+        best = None
+        node = 0
+        for i in range(start, end):
+            node = self._step(node, text[i])
+            for kw in out[node]:
+                if mapping[kw] in exclude_urls:
+                    continue
+                pos = i - len(kw) + 1
+                if best is None or pos < best[0] or (pos == best[0] and len(kw) > len(best[1])):
+                    best = (pos, kw)
+            # これ以降に終わるマッチは best より手前から始まり得ない
+            if best is not None and i >= best[0] + self.max_len - 1:
+                break
+        if best is None:
+            return None
+        return best[0], best[1], mapping[best[1]]
+
+
+def ensure_matcher(link_mapping) -> KeywordMatcher:
+    """{キーワード: URL} の dict でもコンパイル済み KeywordMatcher でも受け付ける"""
+    if isinstance(link_mapping, KeywordMatcher):
+        return link_mapping
+    return KeywordMatcher(link_mapping)
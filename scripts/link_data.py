@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+articles.json / linkMapping.json / linkUsage.json をまとめて読み込み、参照用の索引を作る。
+
+    data = load_link_data()
+    data.articles_by_id["6030"]          # 記事ID → 記事
+    data.article_id_for_url(url)         # 記事URL (正規化して比較) → 記事ID
+    data.articles_for("格安SIM")          # キーワード → {記事ID: 回数}
+    data.keywords_for("6030")            # 記事ID → {キーワード: 回数}
+    data.link_usage                      # 編集用の linkUsage の dict (初めて参照したときに作る)
+
+linkUsage は usage_store.UsageMatrix (キーワード × 記事 の疎行列) のまま持ち、上の参照は配列のスライスで行う。
+dict の dict (data.link_usage) は ON/OFF の反映で書き換えるときだけ作る。
+
+Streamlit 側では file_signature() (各ファイルの mtime) をキーに st.cache_data でキャッシュし、
+再描画のたびに JSON を読み直したり集計し直したりしないようにする。
+"""
+
+import json
+import os
+
+from insert_links import flatten_link_mapping
+from link_urls import normalize_url
+from usage_store import UsageMatrix, load_usage_matrix
+
+ARTICLES_JSON = os.path.join("data", "articles.json")
+LINK_MAPPING_JSON = os.path.join("data", "linkMapping.json")
+LINK_USAGE_JSON = os.path.join("data", "linkUsage.json")
+
+# query_articles() の並び順
+SORT_LINKS_DESC = "links_desc"
+SORT_LINKS_ASC = "links_asc"
+SORT_ID_ASC = "id_asc"
+SORT_ID_DESC = "id_desc"
+
+
+def _load(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def file_signature(*paths) -> tuple:
+    """ファイルごとの (パス, mtime_ns, サイズ)。キャッシュのキーに使う (無いファイルは (パス, 0, 0))"""
+    sig = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            sig.append((path, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            sig.append((path, 0, 0))
+    return tuple(sig)
+
+
+def sync_link_usage(link_usage: dict, link_mapping: dict) -> dict:
+    """linkMapping にあって linkUsage に無いキーワードを追加し、URL の変更を反映する"""
+    for kw, url in link_mapping.items():
+        usage_info = link_usage.setdefault(kw, {"url": url, "articles_used_in": {}})
+        usage_info.setdefault("articles_used_in", {})
+        if usage_info.get("url") != url:
+            usage_info["url"] = url
+    return link_usage
+
+
+class LinkData:
+    """3つの JSON と、それらから作った索引"""
+
+    def __init__(self, articles: list, nested_mapping: dict, link_usage):
+        """link_usage: usage_store.UsageMatrix、または linkUsage.json と同じ形の dict"""
+        self.articles = articles
+        if nested_mapping and not all(isinstance(v, dict) for v in nested_mapping.values()):
+            # 旧来のフラット構造 (Streamlit のリンクマッピング管理で Uncategorized に移行される)
+            nested_mapping = {"Uncategorized": nested_mapping}
+        self.nested_mapping = nested_mapping
+        self.link_mapping = flatten_link_mapping(nested_mapping)
+        self.usage = link_usage if isinstance(link_usage, UsageMatrix) else UsageMatrix.from_dict(link_usage)
+        self._link_usage = None
+
+        self.articles_by_id = {a["id"]: a for a in articles}
+        self.article_ids_by_url = {normalize_url(a["url"]): a["id"] for a in articles if a.get("url")}
+        totals = self.usage.article_totals()
+        self.article_link_totals = {a["id"]: totals.get(a["id"], 0) for a in articles}
+
+    @property
+    def link_usage(self) -> dict:
+        """linkMapping と同期した linkUsage の dict (ON/OFF の反映で書き換えて save_link_usage() に渡す)"""
+        if self._link_usage is None:
+            self._link_usage = sync_link_usage(self.usage.to_dict(), self.link_mapping)
+        return self._link_usage
+
+    def keyword_url(self, keyword: str) -> str:
+        """キーワードのリンク先 (linkMapping を優先)"""
+        return self.link_mapping.get(keyword) or self.usage.keyword_url(keyword) or ""
+
+    def articles_for(self, keyword: str) -> dict:
+        """キーワードを使っている {記事ID: 回数}"""
+        return self.usage.articles_for(keyword)
+
+    def keywords_for(self, article_id) -> dict:
+        """記事で使われている {キーワード: 回数}"""
+        return self.usage.keywords_for(article_id)
+
+    def article_id_for_url(self, url: str):
+        return self.article_ids_by_url.get(normalize_url(url))
+
+    def query_articles(self, title="", keyword="", sort=SORT_LINKS_DESC, only_ids=None) -> list:
+        """
+        記事IDを絞り込み・並べ替えて返す。
+        title: タイトルの部分一致 / keyword: リンク済みキーワードの部分一致 (大文字小文字を区別しない)
+        only_ids: 指定した記事IDだけに絞る (None なら全記事)
+        """
+        title = title.lower()
+        keyword = keyword.lower()
+        keyword_ids = None
+        if keyword:
+            # 部分一致するキーワードを使っている記事 (キーワードごとの行を合わせるだけで、記事は走査しない)
+            keyword_ids = set()
+            for kw in self.usage.keywords:
+                if keyword in kw.lower():
+                    keyword_ids.update(self.usage.articles_for(kw))
+        ids = []
+        for art in self.articles:
+            art_id = art["id"]
+            if only_ids is not None and art_id not in only_ids:
+                continue
+            if title and title not in art["title"].lower():
+                continue
+            if keyword_ids is not None and art_id not in keyword_ids:
+                continue
+            ids.append(art_id)
+
+        totals = self.article_link_totals
+        if sort == SORT_LINKS_DESC:
+            ids.sort(key=lambda i: totals[i], reverse=True)
+        elif sort == SORT_LINKS_ASC:
+            ids.sort(key=lambda i: totals[i])
+        elif sort == SORT_ID_ASC:
+            ids.sort(key=int)
+        else:
+            ids.sort(key=int, reverse=True)
+        return ids
+
+    def article_kw_maps(self) -> dict:
+        """linkUsage で ON になっている 記事ID → {キーワード: URL} (一括挿入の対象)"""
+        urls = [self.keyword_url(kw) for kw in self.usage.keywords]
+        keywords = self.usage.keywords
+        return {art_id: {keywords[k]: urls[k] for k in kw_ids}
+                for art_id, kw_ids in self.usage.iter_article_keywords() if kw_ids}
+
+
+def load_link_data(articles_path=ARTICLES_JSON, mapping_path=LINK_MAPPING_JSON,
+                   usage_path=LINK_USAGE_JSON) -> LinkData:
+    # usage_path は .json でも usage_store.py のバイナリ形式 (.bin) でもよい
+    return LinkData(_load(articles_path, []), _load(mapping_path, {}), load_usage_matrix(usage_path))
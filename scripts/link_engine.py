@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+記事本文へのリンク挿入 (insert_link_once と同じ変換) をプロセスプールで並列に行うバッチ API。
+
+キーワード探索と本文の組み立ては CPU だけを使う処理なので、HTTP と同じスレッドで1記事ずつ
+行うと、マッピングが大きいときに1コアで頭打ちになる。ここでは
+
+- コンパイル済みの KeywordMatcher をワーカーの起動時に1回だけ渡し (タスクごとには送らない)
+- 記事を batch_size 件ずつまとめて1タスクにし (プロセス間通信の回数を減らす)
+- 投入済みのタスクを processes * MAX_PENDING_PER_PROCESS 件までに抑えて、
+  終わったものから順に結果を返す (コーパス全体をメモリに載せない)
+
+    with LinkEngine(matcher, processes=8) as engine:
+        for result in engine.map((post_id, content, article_url) for ...):
+            if result.content is not None:
+                ...  # result.content が変換後の本文 (変更が無ければ None)
+
+insert_links.py は submit() で1記事ずつ投入し、wp_pipeline の取得・更新と並行に変換する。
+"""
+
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+
+from content_tokenizer import build_linked_content
+from keyword_matcher import ensure_matcher
+from link_transform import plan_link_once
+
+DEFAULT_BATCH_SIZE = 16          # 1タスクにまとめる記事数
+MAX_PENDING_PER_PROCESS = 4      # プロセスあたりの投入済み・未完了タスク数の上限
+
+# post_id / 変換後の本文 (変更が無ければ None) / 挿入したリンク数 / ワーカーでの変換の所要時間 (秒)
+LinkResult = namedtuple("LinkResult", ["post_id", "content", "links", "seconds"], defaults=(0.0,))
+
+# プロセスプールの各ワーカーが持つキーワードオートマトン (_init_worker で受け取る)
+_worker_matcher = None
+
+
+def _init_worker(matcher):
+    global _worker_matcher
+    _worker_matcher = ensure_matcher(matcher)
+
+
+def link_post(post_id, content: str, article_url: str) -> LinkResult:
+    """ワーカーで実行する1記事分の変換 (insert_link_once と同じ結果)"""
+    started = time.perf_counter()
+    links = plan_link_once(content, _worker_matcher, article_url)
+    if not links:
+        return LinkResult(post_id, None, 0, time.perf_counter() - started)
+    updated = build_linked_content(content, links)
+    return LinkResult(post_id, updated, len(links), time.perf_counter() - started)
+
+
+def _link_batch(batch) -> list:
+    return [link_post(post_id, content, article_url) for post_id, content, article_url in batch]
+
+
+def default_processes() -> int:
+    return os.cpu_count() or 1
+
+
+class InlineExecutor:
+    """processes <= 1 のとき用。ProcessPoolExecutor と同じ submit() をその場で実行する"""
+
+    def __init__(self, initializer, initargs):
+        initializer(*initargs)
+
+    def submit(self, fn, *args):
+        fut = Future()
+        try:
+            fut.set_result(fn(*args))
+        except Exception as e:
+            fut.set_exception(e)
+        return fut
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def create_executor(processes, initializer, initargs):
+    """
+    processes > 1 ならワーカーを起動済みの ProcessPoolExecutor、それ以外は InlineExecutor。
+    fork はスレッドを持つプロセスから行うと危ないので、取得スレッドを動かす前に呼ぶこと。
+    """
+    if processes is None:
+        processes = default_processes()
+    if processes <= 1:
+        return InlineExecutor(initializer, initargs)
+    executor = ProcessPoolExecutor(processes, initializer=initializer, initargs=initargs)
+    # 全ワーカーをここで起動しておく (以降のタスク投入でプロセスが増えないように)
+    for fut in [executor.submit(int) for _ in range(processes)]:
+        fut.result()
+    return executor
+
+
+def chain(future: Future, fn) -> Future:
+    """future の結果に fn を適用した結果を返す Future (fn は future を完了させたスレッドで実行される)"""
+    out = Future()
+
+    def _done(f):
+        try:
+            out.set_result(fn(f.result()))
+        except Exception as e:
+            out.set_exception(e)
+
+    future.add_done_callback(_done)
+    return out
+
+
+class LinkEngine:
+    def __init__(self, matcher, processes=None):
+        self.processes = default_processes() if processes is None else max(1, int(processes))
+        self._executor = create_executor(self.processes, _init_worker, (matcher,))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, post_id, content: str, article_url: str) -> Future:
+        """1記事を投入し、LinkResult の Future を返す"""
+        return self._executor.submit(link_post, post_id, content, article_url)
+
+    def map(self, items, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        items: (post_id, 本文, 記事URL) のイテラブル。
+        LinkResult を終わった順に返すジェネレータ (items は必要な分だけ先読みする)。
+        """
+        item_iter = iter(items)
+        max_pending = self.processes * MAX_PENDING_PER_PROCESS
+        pending = set()
+
+        def submit_batch():
+            batch = []
+            for item in item_iter:
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    break
+            if batch:
+                pending.add(self._executor.submit(_link_batch, batch))
+            return bool(batch)
+
+        while len(pending) < max_pending and submit_batch():
+            pass
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                pending.discard(fut)
+                submit_batch()
+                yield from fut.result()
+
+
+def link_corpus(items, matcher, processes=None, batch_size=DEFAULT_BATCH_SIZE):
+    """LinkEngine を作って items をすべて変換するジェネレータ (終わったらプールを閉じる)"""
+    with LinkEngine(matcher, processes) as engine:
+        yield from engine.map(items, batch_size)
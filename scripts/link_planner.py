@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+コーパス全体を見て「どの記事に・どのキーワードで・どの記事へ」リンクを張るかを一度に決める。
+
+insert_link_once / 一括挿入 (plan_links_to_content) は記事ごとに前から順に選ぶだけなので、
+多くの記事に出てくるキーワードのリンク先にリンクが集中し、出現の少ないリンク先には1本も張られない。
+ここでは キーワード索引 (keyword_index.py) の 記事 × キーワード の出現行列から、
+
+- 1記事あたりのリンク数の上限 (max_links_per_post。既に張ってあるリンク先の数も含める)
+- リンク先1つあたりの被リンク数の上限 / 下限 (max_inbound / min_inbound。既存の被リンクも数える)
+- 自記事へのリンクは張らない・既にリンクしている記事からは同じリンク先へ張らない
+- 1記事内で選んだキーワードの最初の出現同士が重ならない
+
+を守る割り当てを求める。割り当ては被リンク数の少ないリンク先から1本ずつ配る
+(同数なら候補記事の少ないリンク先を先にする) ので、下限に届かないリンク先が先に埋まり、
+残りの枠は被リンク数が均等になるように配られる。計算量は 出現数 + 割り当て数 × log(リンク先数)。
+
+出力 (reports/linkPlan.json) の "posts" は {記事ID: {キーワード: URL}} で、
+insert_links.py --plan がそのまま (plan_links_to_content で) 実行する。
+
+    python scripts/link_planner.py                                  # 索引を更新して計画を作る
+    python scripts/link_planner.py --max-per-post 3 --max-inbound 30 --min-inbound 2
+    python scripts/insert_links.py --plan --corpus --dry-run        # 計画のプレビュー
+    python scripts/insert_links.py --plan --corpus                  # 計画を実行
+"""
+
+import argparse
+import heapq
+import json
+import os
+import time
+
+from corpus_store import CORPUS_PATH, CorpusStore
+from json_store import atomic_write_json
+from link_transform import MAX_LINKS_PER_POST
+from link_urls import normalize_url
+
+LINK_PLAN_PATH = os.path.join("reports", "linkPlan.json")
+LINK_MAPPING_JSON = os.path.join("data", "linkMapping.json")
+
+
+def plan_corpus_links(occurrences, link_mapping: dict, post_urls: dict, existing_links=None,
+                      max_links_per_post=MAX_LINKS_PER_POST, max_inbound=None, min_inbound=0) -> dict:
+    """
+    occurrences: (キーワード, 記事ID, 出現回数, 最初の位置) のイテラブル (KeywordIndex.iter_hits())
+    link_mapping: {キーワード: URL}。同じ URL の複数のキーワードは1つのリンク先として数える
+    post_urls: {記事ID: 記事URL} (ここに無い記事は対象外)
+    existing_links: {記事ID: {正規化URL: 回数}} (本文に既にあるリンク。無ければ既存リンクは無いものとする)
+    max_inbound: None か 0 以下なら上限なし
+
+    戻り値: {"posts": {記事ID: {キーワード: URL}}, "targets": {URL: {...}}, "under_min": [URL], "summary": {...}}
+    """
+    started = time.perf_counter()
+    if not max_inbound or max_inbound <= 0:
+        max_inbound = None
+    existing_links = existing_links or {}
+
+    # リンク先 (正規化URL) に連番を振る。URL の表記は linkMapping の最初のキーワードのものを使う
+    target_ids, target_urls, kw_target = {}, [], {}
+    for kw, url in link_mapping.items():
+        if not kw or not url:
+            continue
+        key = normalize_url(url)
+        if key not in target_ids:
+            target_ids[key] = len(target_urls)
+            target_urls.append(url)
+        kw_target[kw] = target_ids[key]
+    n_targets = len(target_urls)
+
+    # 記事ごとの 自記事のリンク先番号 / 既にリンクしているリンク先 / 残りの枠
+    post_ids = list(post_urls)
+    post_index = {post_id: p for p, post_id in enumerate(post_ids)}
+    self_target = [target_ids.get(normalize_url(post_urls[post_id])) if post_urls[post_id] else None
+                   for post_id in post_ids]
+    linked = [set() for _ in post_ids]
+    inbound = [0] * n_targets
+    for post_id, links in existing_links.items():
+        p = post_index.get(post_id)
+        if p is None:
+            continue
+        for url_key in links:
+            t = target_ids.get(url_key)
+            if t is not None and t != self_target[p]:
+                linked[p].add(t)
+                inbound[t] += 1
+    existing_inbound = list(inbound)
+    capacity = [max(0, max_links_per_post - len(t_set)) for t_set in linked]
+
+    # 出現行列を (記事, リンク先) ごとの最良の候補に畳む: 出現回数が多く、最初の出現が前のキーワード
+    best = {}
+    n_occurrences = 0
+    for kw, post_id, count, first_offset in occurrences:
+        n_occurrences += 1
+        t = kw_target.get(kw)
+        p = post_index.get(post_id)
+        if t is None or p is None or t == self_target[p] or t in linked[p] or not capacity[p]:
+            continue
+        key = p * n_targets + t
+        cand = (-count, first_offset, kw)
+        prev = best.get(key)
+        if prev is None or cand < prev:
+            best[key] = cand
+
+    candidates = [[] for _ in range(n_targets)]
+    for key, (neg_count, first_offset, kw) in best.items():
+        p, t = divmod(key, n_targets)
+        candidates[t].append((neg_count, first_offset, p, kw))
+    for cands in candidates:
+        cands.sort()
+
+    # 被リンク数の少ないリンク先から1本ずつ配る
+    cursor = [0] * n_targets
+    chosen = [[] for _ in post_ids]     # 記事ごとの [(最初の位置, 終わり, キーワード, リンク先)]
+    heap = [(inbound[t], len(candidates[t]), t) for t in range(n_targets)
+            if candidates[t] and (max_inbound is None or inbound[t] < max_inbound)]
+    heapq.heapify(heap)
+    assigned = 0
+    while heap:
+        _, _, t = heapq.heappop(heap)
+        cands = candidates[t]
+        i = cursor[t]
+        while i < len(cands):
+            _, start, p, kw = cands[i]
+            i += 1
+            picks = chosen[p]
+            if len(picks) >= capacity[p]:
+                continue
+            end = start + len(kw)
+            if any(start < e and s < end for s, e, _, _ in picks):
+                continue
+            picks.append((start, end, kw, t))
+            inbound[t] += 1
+            assigned += 1
+            break
+        else:
+            cursor[t] = i
+            continue
+        cursor[t] = i
+        if i < len(cands) and (max_inbound is None or inbound[t] < max_inbound):
+            heapq.heappush(heap, (inbound[t], len(cands) - i, t))
+
+    posts = {}
+    for p, picks in enumerate(chosen):
+        if picks:
+            picks.sort()
+            posts[post_ids[p]] = {kw: target_urls[t] for _, _, kw, t in picks}
+    targets = {target_urls[t]: {"existing": existing_inbound[t], "planned": inbound[t] - existing_inbound[t],
+                                "candidates": len(candidates[t])}
+               for t in range(n_targets)}
+    under_min = [target_urls[t] for t in range(n_targets) if inbound[t] < min_inbound]
+    return {
+        "posts": posts,
+        "targets": targets,
+        "under_min": under_min,
+        "summary": {
+            "posts": len(post_ids),
+            "targets": n_targets,
+            "occurrences": n_occurrences,
+            "candidates": len(best),
+            "planned_posts": len(posts),
+            "links": assigned,
+            "targets_linked": sum(1 for t in range(n_targets) if inbound[t] > existing_inbound[t]),
+            "under_min": len(under_min),
+            "elapsed": time.perf_counter() - started,
+        },
+    }
+
+
+def load_plan(path=LINK_PLAN_PATH) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="コーパス全体のリンク割り当て計画を作る")
+    parser.add_argument("--max-per-post", type=int,
+                        default=int(os.environ.get("LINK_PLAN_MAX_PER_POST", MAX_LINKS_PER_POST)),
+                        help="1記事あたりのリンク数の上限 (既存のリンク先を含む)")
+    parser.add_argument("--max-inbound", type=int,
+                        default=int(os.environ.get("LINK_PLAN_MAX_INBOUND", 0)),
+                        help="リンク先1つあたりの被リンク数の上限 (既存を含む。0 で無制限)")
+    parser.add_argument("--min-inbound", type=int,
+                        default=int(os.environ.get("LINK_PLAN_MIN_INBOUND", 0)),
+                        help="リンク先1つあたりの被リンク数の目標下限 (届かないリンク先は under_min に出す)")
+    parser.add_argument("--corpus-path", default=CORPUS_PATH, help="本文のスナップショット")
+    parser.add_argument("--index-path", default=None,
+                        help="キーワード索引 (既定: keyword_index.py と同じ .cache/keywordIndex.sqlite3)")
+    parser.add_argument("--output", default=os.environ.get("LINK_PLAN_PATH", LINK_PLAN_PATH),
+                        help="計画 (JSON) の出力先")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.exists(args.corpus_path):
+        print(f"[ERROR] Corpus {args.corpus_path} not found. Run scripts/corpus_store.py first.")
+        return
+    # insert_links.py が --plan でこのモジュールを読むので、循環しないよう使うときだけ読み込む
+    from insert_links import flatten_link_mapping, load_json
+    from keyword_index import KEYWORD_INDEX_PATH, KeywordIndex
+    link_mapping = flatten_link_mapping(load_json(LINK_MAPPING_JSON))
+
+    with CorpusStore(args.corpus_path) as corpus, KeywordIndex(args.index_path or KEYWORD_INDEX_PATH) as index:
+        stats = index.update(corpus, link_mapping)
+        print(f"[INFO] Keyword index updated (rescanned={stats['rescanned']}) in {stats['elapsed']:.2f}s")
+        plan = plan_corpus_links(index.iter_hits(), link_mapping, corpus.url_map(),
+                                 existing_links=corpus.links_map(),
+                                 max_links_per_post=args.max_per_post,
+                                 max_inbound=args.max_inbound, min_inbound=args.min_inbound)
+
+    plan["generated_at"] = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+    plan["params"] = {"max_links_per_post": args.max_per_post, "max_inbound": args.max_inbound,
+                      "min_inbound": args.min_inbound}
+    atomic_write_json(plan, args.output)
+    summary = plan["summary"]
+    print(f"[INFO] Planned {summary['links']} links in {summary['planned_posts']} posts "
+          f"to {summary['targets_linked']}/{summary['targets']} targets "
+          f"({summary['candidates']} candidates, under_min={summary['under_min']}) "
+          f"in {summary['elapsed']:.2f}s -> {args.output}")
+    return plan
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+リンク挿入のドライラン (WordPress へは書き込まない)。
+
+記事本文を取得し、実際の挿入と同じルール (link_transform.py) でリンク挿入計画を求め、
+「どの記事の・どの位置に・どのキーワードのリンクが入るか」をレポートにまとめる。
+
+- 取得は wp_pipeline.run_pipeline() のスレッドで並行実行
+- 挿入計画の計算はプロセスプールで並列実行 (キーワードオートマトンは
+  ワーカーの起動時に1回だけ構築する)
+- レポートは JSON (機械可読) と HTML (差分サマリー) の2形式で書き出す
+
+insert_links.py --dry-run と、Streamlit 管理画面のプレビューボタンから使う。
+"""
+
+import html
+import json
+import os
+import re
+import time
+
+from json_store import atomic_write_bytes
+from keyword_matcher import KeywordMatcher
+from link_engine import create_executor
+from link_transform import MAX_LINKS_PER_POST, plan_link_once, plan_links_to_content
+from wp_pipeline import DEFAULT_WORKERS, run_pipeline
+
+PREVIEW_JSON_PATH = os.path.join("reports", "linkPreview.json")
+PREVIEW_HTML_PATH = os.path.join("reports", "linkPreview.html")
+CONTEXT_CHARS = 40  # 前後に表示する文字数
+
+MODE_ONCE = "once"  # insert_links.py: 1記事に最初の1キーワードだけ
+MODE_BULK = "bulk"  # Streamlit 一括挿入: linkUsage で ON の記事に最大3キーワード
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# プロセスプールの各ワーカーが持つキーワードオートマトン (_init_worker で構築)
+_worker_matcher = None
+
+
+def _init_worker(link_mapping):
+    global _worker_matcher
+    _worker_matcher = KeywordMatcher(link_mapping) if link_mapping is not None else None
+
+
+def _squash(text: str) -> str:
+    return _WHITESPACE_RE.sub(" ", text)
+
+
+def describe_links(content: str, links, context_chars=CONTEXT_CHARS) -> list:
+    """
+    挿入計画 [(開始位置, 終了位置, URL), ...] をレポート用の dict のリストにする。
+    offset は UTF-8 でのバイト位置、char_offset は文字位置。
+    """
+    changes = []
+    for start, end, url in sorted(links):
+        keyword = content[start:end]
+        before = _squash(content[max(0, start - context_chars):start])
+        after = _squash(content[end:end + context_chars])
+        changes.append({
+            "keyword": keyword,
+            "url": url,
+            "offset": len(content[:start].encode("utf-8")),
+            "char_offset": start,
+            "context": f"{before}[{keyword}]{after}",
+            "before": before,
+            "after": after,
+        })
+    return changes
+
+
+def plan_post(content: str, article_url: str, kw_map=None, context_chars=CONTEXT_CHARS,
+              max_links_per_post=MAX_LINKS_PER_POST) -> list:
+    """
+    ワーカープロセスで実行する1記事分の計算。
+    kw_map が None なら insert_link_once と同じ計画 (ワーカーのオートマトンを使う)、
+    {キーワード: URL} なら一括挿入 (plan_links_to_content、最大 max_links_per_post 個) と同じ計画を求める。
+    """
+    if kw_map is None:
+        links = plan_link_once(content, _worker_matcher, article_url)
+    else:
+        links = plan_links_to_content(content, kw_map, max_links_per_post, base_url=article_url)
+    return describe_links(content, links, context_chars)
+
+
+def run_preview(articles, fetch, link_mapping=None, kw_maps=None,
+                workers=DEFAULT_WORKERS, processes=None, context_chars=CONTEXT_CHARS,
+                max_links_per_post=MAX_LINKS_PER_POST):
+    """
+    articles の各記事について fetch(article) で本文を取得し、挿入計画をレポートにまとめる。
+
+    - link_mapping ({キーワード: URL}) を渡すと MODE_ONCE (insert_links.py と同じ挿入)
+    - kw_maps ({記事ID: {キーワード: URL}}) を渡すと MODE_BULK (Streamlit 一括挿入と同じ挿入)。
+      kw_maps に無い記事は対象外。1記事あたりの上限は max_links_per_post (link_planner の計画の値を渡す)
+    - processes: 計画を計算するプロセス数 (None で CPU 数、1 以下で同じプロセス内)
+
+    戻り値: レポート dict (write_json_report / write_html_report に渡す)
+    """
+    mode = MODE_BULK if kw_maps is not None else MODE_ONCE
+    if mode == MODE_BULK:
+        articles = [a for a in articles if a["id"] in kw_maps]
+    # 取得スレッドが動き出す前にワーカープロセスを起動しておく
+    executor = create_executor(processes, _init_worker, (link_mapping if mode == MODE_ONCE else None,))
+
+    posts = {}
+
+    def label(article):
+        return f"post {article['id']} ({article.get('title','')})"
+
+    def plan(article, raw_content):
+        # 計算はワーカープロセスに任せる (run_pipeline が Future の完了を待って collect に渡す)
+        kw_map = kw_maps[article["id"]] if mode == MODE_BULK else None
+        return executor.submit(plan_post, raw_content, article.get("url") or article.get("link", ""),
+                               kw_map, context_chars, max_links_per_post)
+
+    def collect(article, changes):
+        posts[article["id"]] = {
+            "id": article["id"],
+            "title": article.get("title", ""),
+            "url": article.get("url") or article.get("link", ""),
+            "links": changes,
+        }
+        return True
+
+    try:
+        stats = run_pipeline(articles, fetch, plan, collect, workers=workers, label=label)
+    finally:
+        executor.shutdown(wait=True)
+
+    ordered = [posts[a["id"]] for a in articles if a["id"] in posts]
+    changed = [p for p in ordered if p["links"]]
+    return {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "mode": mode,
+        "summary": {
+            "total": len(articles),
+            "planned": len(ordered),
+            "changed_posts": len(changed),
+            "links": sum(len(p["links"]) for p in changed),
+            "fetch_failed": stats["fetch_failed"],
+            "failed": stats["transform_failed"] + stats["write_failed"],
+            "elapsed": round(stats["elapsed"], 3),
+        },
+        "posts": changed,
+    }
+
+
+def iter_report_rows(report):
+    """レポートを1リンク1行のフラットな dict にする (表示・CSV 用)"""
+    for post in report["posts"]:
+        for change in post["links"]:
+            yield {
+                "post_id": post["id"],
+                "title": post["title"],
+                "keyword": change["keyword"],
+                "url": change["url"],
+                "offset": change["offset"],
+                "context": change["context"],
+            }
+
+
+def render_json_report(report) -> str:
+    return json.dumps(report, ensure_ascii=False, indent=2)
+
+
+def render_html_report(report) -> str:
+    """リンクが入る箇所を 変更前 (-) / 変更後 (+) の2行で並べた HTML の差分サマリー"""
+    s = report["summary"]
+    esc = html.escape
+    out = [
+        "<!DOCTYPE html>",
+        '<html lang="ja"><head><meta charset="utf-8"><title>内部リンク挿入プレビュー</title>',
+        "<style>body{font-family:sans-serif;margin:2em}"
+        "pre{background:#f6f8fa;padding:.5em;white-space:pre-wrap}"
+        ".del{color:#b31d28;background:#ffeef0;display:block}"
+        ".add{color:#22863a;background:#f0fff4;display:block}"
+        "ins{background:#acf2bd;text-decoration:none}"
+        "table{border-collapse:collapse}td,th{border:1px solid #ddd;padding:.2em .6em}</style>",
+        "</head><body>",
+        "<h1>内部リンク挿入プレビュー (ドライラン)</h1>",
+        f"<p>生成日時: {esc(report['generated_at'])} / モード: {esc(report['mode'])}</p>",
+        "<table>",
+        f"<tr><th>対象記事</th><td>{s['total']}</td></tr>",
+        f"<tr><th>変更される記事</th><td>{s['changed_posts']}</td></tr>",
+        f"<tr><th>挿入されるリンク</th><td>{s['links']}</td></tr>",
+        f"<tr><th>取得失敗</th><td>{s['fetch_failed']}</td></tr>",
+        f"<tr><th>計算失敗</th><td>{s['failed']}</td></tr>",
+        "</table>",
+    ]
+    for post in report["posts"]:
+        out.append(f'<h2>ID={esc(post["id"])} <a href="{esc(post["url"])}">{esc(post["title"])}</a></h2>')
+        for change in post["links"]:
+            before, after, kw = esc(change["before"]), esc(change["after"]), esc(change["keyword"])
+            anchor_open = esc(f'<a href="{change["url"]}">')
+            out.append(f"<p>キーワード: <b>{kw}</b> → {esc(change['url'])} (offset={change['offset']})</p>")
+            out.append("<pre>"
+                       f'<span class="del">- …{before}{kw}{after}…</span>'
+                       f'<span class="add">+ …{before}<ins>{anchor_open}</ins>{kw}'
+                       f"<ins>{esc('</a>')}</ins>{after}…</span>"
+                       "</pre>")
+    if not report["posts"]:
+        out.append("<p>リンクが挿入される記事はありません。</p>")
+    out.append("</body></html>")
+    return "\n".join(out)
+
+
+def write_json_report(report, path=PREVIEW_JSON_PATH):
+    atomic_write_bytes(render_json_report(report).encode("utf-8"), path)
+
+
+def write_html_report(report, path=PREVIEW_HTML_PATH):
+    atomic_write_bytes(render_html_report(report).encode("utf-8"), path)
+
+
+def format_summary(report) -> str:
+    s = report["summary"]
+    return (f"[PREVIEW] mode={report['mode']} total={s['total']} changed_posts={s['changed_posts']} "
+            f"links={s['links']} fetch_failed={s['fetch_failed']} failed={s['failed']} "
+            f"elapsed={s['elapsed']:.1f}s")
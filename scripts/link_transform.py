@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+本文のどこにどのリンクを入れるか (リンク挿入計画) を求める関数。
+
+計画は [(開始位置, 終了位置, URL), ...] で表し、本文への反映は
+content_tokenizer.build_linked_content() で行う。
+insert_links.py (1記事1リンク) と manage_link_mapping.py (1記事最大3リンク) の
+両方の挿入ルールをここに置き、ドライランのプレビューやプロセスプールのワーカーからは
+Streamlit を読み込まずに同じルールを使えるようにしている。
+
+リンクを外すとき (OFF にしたキーワード) の計画 plan_unlinks() は [(開始位置, 終了位置), ...] で表し、
+content_tokenizer.build_unlinked_content() で反映する。
+"""
+
+from content_tokenizer import ANCHOR, TEXT, iter_segments, iter_text_spans
+from keyword_matcher import ensure_matcher
+from link_urls import ANCHOR_TAG_RE, iter_anchor_hrefs, normalize_url
+
+MAX_LINKS_PER_POST = 3
+
+
+def plan_link_once(content: str, link_mapping, article_url: str) -> list:
+    """
+    insert_link_once() の挿入計画。
+    本文中で最初に登場したキーワード1つだけ (同じ位置なら最長のもの) をリンク化する。
+    article_url と同じ URL のキーワード、地の文 (TEXT) 以外の箇所は対象外。
+    """
+    matcher = ensure_matcher(link_mapping)
+    for start, end in iter_text_spans(content):
+        first_match = matcher.find_first(content, start, end, exclude_urls={article_url})
+        if first_match is not None:
+            pos, kw, url = first_match
+            return [(pos, pos + len(kw), url)]
+    return []
+
+
+def plan_links_to_content(content: str, link_mapping, max_links_per_post=MAX_LINKS_PER_POST,
+                          base_url: str = None) -> list:
+    """
+    Streamlit の一括挿入 (job_runner.run_insert_job) の挿入計画。
+    linkMapping の順に、各キーワードの最初の (他のリンクと重ならない) 出現を1回だけ、
+    最大 max_links_per_post 個までリンク化する。
+    本文に既にリンクがある URL のキーワードは飛ばし、そのリンクも max_links_per_post に数える
+    (何度実行しても1回目と同じ本文になる)。既存リンクの href は base_url (記事の URL) を基準に正規化して比べる。
+    """
+    matcher = ensure_matcher(link_mapping)
+
+    # 本文を1回走査し、地の文 (TEXT) のキーワードの出現位置と、既存リンク (ANCHOR) のリンク先を集める
+    positions = {}
+    linked = set()
+    for kind, start, end in iter_segments(content):
+        if kind == TEXT:
+            for pos, kw in matcher.iter_matches(content, start, end):
+                positions.setdefault(kw, []).append(pos)
+        elif kind == ANCHOR:
+            linked.update(_anchor_urls(content, start, end, base_url))
+
+    # 既存リンクがある記事だけ、linkMapping 側の URL をまとめて正規化して上限に数える
+    targets = {}
+    if linked:
+        targets = {kw: normalize_url(url, base_url) for kw, url in matcher.link_mapping.items()}
+    capacity = max_links_per_post - len(linked.intersection(targets.values()))
+
+    chosen = []
+    for kw, url in matcher.link_mapping.items():
+        if len(chosen) >= capacity:
+            break
+        if kw not in positions:
+            continue
+        target = targets.get(kw) or normalize_url(url, base_url)
+        if target in linked:
+            continue
+        for pos in positions[kw]:
+            end = pos + len(kw)
+            if any(pos < e and s < end for s, e, _ in chosen):
+                continue
+            chosen.append((pos, end, url))
+            linked.add(target)
+            break
+    return chosen
+
+
+def _anchor_urls(content: str, start: int, end: int, base_url: str = None) -> list:
+    """ANCHOR セグメント content[start:end] の href を正規化した URL (href が無ければ空)"""
+    tag = ANCHOR_TAG_RE.match(content, start, end)
+    if tag is None:
+        return []
+    return [normalize_url(href, base_url) for href in iter_anchor_hrefs(tag.group(0)) if href.strip()]
+
+
+def normalize_unlink_urls(urls) -> frozenset:
+    """plan_unlinks() に渡すリンク先の集合 (normalize_url で正規化済み)"""
+    return frozenset(normalize_url(url) for url in urls if url)
+
+
+def plan_unlinks(content: str, unlink_urls, base_url: str = None) -> list:
+    """
+    リンク削除の計画。本文を1回だけ走査し、href を正規化した URL が unlink_urls
+    (normalize_unlink_urls() の結果) のどれかに一致する既存リンク <a ...>...</a> の範囲を返す。
+    外すリンク先がいくつあっても、1リンクあたり集合の参照1回で判定する。
+    相対 URL の href は base_url (記事の URL) を基準に解決する。
+    """
+    if not unlink_urls:
+        return []
+    anchors = []
+    for kind, start, end in iter_segments(content):
+        if kind == ANCHOR and any(url in unlink_urls for url in _anchor_urls(content, start, end, base_url)):
+            anchors.append((start, end))
+    return anchors
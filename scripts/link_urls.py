@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+リンク URL の正規化と、正規化 URL → キーワード の索引。
+
+記事中の href は 'https://good-apps.jp/media/column/123/'、'/media/column/123'、
+"...?utm_source=x#top" のように書き方が揺れるため、比較の前に normalize_url() で
+同じ形に揃える。linkMapping.json 側も同じ関数で正規化して索引を作っておけば、
+ページ内のリンク1本あたり dict の参照1回でキーワードが分かる。
+"""
+
+import html
+import re
+from urllib.parse import parse_qsl, unquote, urlencode, urljoin, urlsplit, urlunsplit
+
+# 集計に関係しない計測用パラメータ
+TRACKING_PARAMS = {"fbclid", "gclid", "yclid", "msclkid", "mc_cid", "mc_eid", "_ga", "_gl"}
+TRACKING_PREFIXES = ("utm_",)
+
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+# <a ...> の開始タグと、その中の href 属性 (ダブル/シングルクォート・クォート無し)
+ANCHOR_TAG_RE = re.compile(r"<a\s[^>]*>", re.IGNORECASE)
+HREF_ATTR_RE = re.compile(r"""[\s"']href\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""", re.IGNORECASE)
+
+
+def normalize_url(url: str, base_url: str = None) -> str:
+    """
+    比較用に URL を正規化する。
+    - 相対 URL は base_url を基準に絶対 URL にする
+    - スキームは https に統一し、ホスト名は小文字、既定ポートは省略
+    - パスはパーセントエンコードを戻し、末尾のスラッシュを除く
+    - フラグメントと計測用パラメータ (utm_* など) を除き、残りのクエリはキー順に並べる
+    """
+    url = html.unescape(url.strip())
+    if base_url:
+        url = urljoin(base_url, url)
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https", ""):
+        # mailto: や javascript: などはそのまま
+        return url
+
+    host = (parts.hostname or "").lower()
+    if parts.port and str(parts.port) != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+
+    path = unquote(parts.path)
+    if path.endswith("/") and path != "/":
+        path = path.rstrip("/")
+    if not path and host:
+        path = "/"
+
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if k.lower() not in TRACKING_PARAMS and not k.lower().startswith(TRACKING_PREFIXES)]
+    query.sort()
+
+    if host:
+        scheme = "https"
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def iter_anchor_hrefs(page: str):
+    """HTML 内の <a> タグの href 属性値を出現順に返す"""
+    for tag in ANCHOR_TAG_RE.finditer(page):
+        m = HREF_ATTR_RE.search(tag.group(0))
+        if m:
+            yield m.group(1) if m.group(1) is not None else (m.group(2) if m.group(2) is not None else m.group(3))
+
+
+def count_links(page: str, base_url: str = None) -> dict:
+    """HTML 内の <a href> を正規化し、{正規化URL: 回数} を返す"""
+    counts = {}
+    for href in iter_anchor_hrefs(page):
+        if not href.strip() or href.lstrip().startswith("#"):
+            continue
+        key = normalize_url(href, base_url)
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def build_url_index(link_mapping: dict) -> dict:
+    """{キーワード: URL} から {正規化URL: [キーワード, ...]} を作る"""
+    index = {}
+    for kw, url in link_mapping.items():
+        if url:
+            index.setdefault(normalize_url(url), []).append(kw)
+    return index
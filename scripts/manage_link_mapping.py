@@ -2,20 +2,62 @@ import streamlit as st
 import json
 import os
 import base64
-import requests
-import re
+from contextlib import ExitStack
+
+from corpus_store import CORPUS_PATH, CorpusStore
+from github_commit import GITHUB_API_URL, GitHubCommitError, GitHubCommitter
+from http_client import get_session
+from job_runner import (CANCELLED, DONE, FAILED, INTERRUPTED, KIND_CRAWL, KIND_DETECT, KIND_INSERT, QUEUED,
+                        RUNNING, get_runner, throughput)
+from json_store import CONFLICT, RELOADED, JsonDraft, atomic_write_json
+from keyword_index import KEYWORD_INDEX_PATH, KeywordIndex
+from link_data import (SORT_ID_ASC, SORT_ID_DESC, SORT_LINKS_ASC, SORT_LINKS_DESC, file_signature,
+                       load_link_data)
+from link_preview import iter_report_rows, render_html_report, render_json_report, run_preview
+from link_urls import normalize_url
+from usage_store import load_link_usage, save_link_usage
+from wp_pipeline import DEFAULT_RATE_PER_HOST, HostRateLimiter
 
 # ===================================
 # 設定・定数
 # ===================================
 LINK_MAPPING_FILE_PATH = "data/linkMapping.json"
-LINK_USAGE_FILE_PATH   = "data/linkUsage.json"
+# linkUsage の保存先。.bin にすると usage_store.py のバイナリ形式 (疎行列) で持つ
+# (GitHub へは常に JSON に書き出して LINK_USAGE_JSON_PATH としてコミットする)
+LINK_USAGE_FILE_PATH   = os.environ.get("LINK_USAGE_PATH", "data/linkUsage.json")
+LINK_USAGE_JSON_PATH   = "data/linkUsage.json"
 ARTICLES_FILE_PATH     = "data/articles.json"
 
 GITHUB_REPO_OWNER = "niki-nakamura"
 GITHUB_REPO_NAME  = "internal-link-auto-inserter"
 BRANCH            = "main"
 
+# 全記事リンク管理の表
+SORT_OPTIONS = {
+    "多い順": SORT_LINKS_DESC,
+    "少ない順": SORT_LINKS_ASC,
+    "記事ID昇順": SORT_ID_ASC,
+    "記事ID降順": SORT_ID_DESC,
+}
+PAGE_SIZE_OPTIONS = [25, 50, 100, 200]
+
+# リンクマッピングの編集は session_state に溜め、最後の編集からこの秒数後にまとめて保存する
+AUTOSAVE_DELAY_SECONDS = 3
+AUTOSAVE_POLL_SECONDS = 1
+
+# バックグラウンドジョブ
+JOB_POLL_SECONDS = 2
+# WordPress への最大リクエスト数/秒 (一括挿入ジョブとドライランの本文取得で共通。insert_links.py と同じ環境変数)
+INSERT_LINKS_RATE = float(os.environ.get("INSERT_LINKS_RATE", DEFAULT_RATE_PER_HOST))
+JOB_STATUS_LABELS = {
+    QUEUED: "待機中",
+    RUNNING: "実行中",
+    DONE: "完了",
+    FAILED: "失敗",
+    CANCELLED: "キャンセル",
+    INTERRUPTED: "中断",
+}
+
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
                   "(KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
@@ -35,14 +77,14 @@ def main():
 # ===================================
 def check_and_rerun_if_needed():
     """
-    セッションステートに rerun フラグが立っていれば、ここで experimental_rerun を呼ぶ。
+    セッションステートに rerun フラグが立っていれば、ここで st.rerun を呼ぶ。
     """
     if "need_rerun" not in st.session_state:
         st.session_state["need_rerun"] = False
 
     if st.session_state["need_rerun"]:
         st.session_state["need_rerun"] = False  # フラグをクリアしておく
-        st.experimental_rerun()
+        st.rerun()
 
 # ===================================
 # ヘルパー関数 (JSON読み書き, GitHubコミット等)
@@ -55,47 +97,91 @@ def load_json(path: str):
         return json.load(f)
 
 def save_json_locally(data, path: str):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    # 一時ファイル + fsync + rename で保存する (書き込み中に落ちてもファイルが壊れない)
+    atomic_write_json(data, path)
+    clear_link_data_cache()
 
-def commit_to_github(json_str: str, target_file_path: str, commit_message: str):
-    """GitHub上のファイルにコミットする"""
-    import os
+def clear_link_data_cache():
+    # 保存したので索引のキャッシュを捨てる
+    _cached_link_data.clear()
+    _cached_article_query.clear()
+
+def get_mapping_draft() -> JsonDraft:
+    """
+    linkMapping.json の編集中のコピー (セッションごと)。
+    ファイルの mtime が変わっていなければ読み直さない。
+    """
+    draft = st.session_state.get("mapping_draft")
+    if draft is None:
+        draft = st.session_state["mapping_draft"] = JsonDraft(LINK_MAPPING_FILE_PATH, dict)
+    else:
+        draft.refresh()
+    return draft
+
+def flush_mapping_draft(draft: JsonDraft):
+    if draft.flush():
+        clear_link_data_cache()
+
+@st.cache_data(show_spinner=False)
+def _cached_article_query(signature, title, keyword, sort, only_ids):
+    only = set(only_ids) if only_ids is not None else None
+    return _cached_link_data(signature).query_articles(title, keyword, sort, only)
+
+@st.cache_data(show_spinner=False)
+def _cached_link_data(signature):
+    # signature (各 JSON の mtime) が変わったときだけ読み込み・索引作成をやり直す
+    return load_link_data(ARTICLES_FILE_PATH, LINK_MAPPING_FILE_PATH, LINK_USAGE_FILE_PATH)
+
+def get_link_data():
+    """
+    articles.json / linkMapping.json / linkUsage.json と索引 (link_data.LinkData)。
+    st.cache_data は呼び出しごとにコピーを返すため、画面側で書き換えてもキャッシュは汚れない。
+    """
+    return _cached_link_data(file_signature(ARTICLES_FILE_PATH, LINK_MAPPING_FILE_PATH, LINK_USAGE_FILE_PATH))
+
+def commit_files_to_github(files: dict, commit_message: str):
+    """
+    {パス: JSON文字列} を GitHub に1コミットでまとめて反映する (github_commit.GitHubCommitter)。
+    GitHub 上と内容が同じファイルは送らず、すべて同じならコミットしない。
+    """
     token = os.environ.get("GITHUB_TOKEN", "")
     if not token:
         st.error("[ERROR] GITHUB_TOKEN が環境変数に設定されていません。GitHubへのコミットは実行できません。")
         return
 
-    url = f"https://api.github.com/repos/{GITHUB_REPO_OWNER}/{GITHUB_REPO_NAME}/contents/{target_file_path}?ref={BRANCH}"
-    headers = {
-        "Authorization": f"token {token}",
-        "Accept": "application/vnd.github.v3+json"
-    }
-
-    # 既存ファイルのSHA取得
-    get_res = requests.get(url, headers=headers)
-    if get_res.status_code == 200:
-        sha = get_res.json().get("sha")
-    elif get_res.status_code == 404:
-        sha = None
-    else:
-        st.error(f"[ERROR] Fetch file from GitHub: status={get_res.status_code}, msg={get_res.text}")
+    committer = GitHubCommitter(GITHUB_REPO_OWNER, GITHUB_REPO_NAME, BRANCH, token,
+                                api_url=os.environ.get("GITHUB_API_URL", GITHUB_API_URL))
+    for path, json_str in files.items():
+        committer.stage(path, json_str)
+    try:
+        result = committer.commit(commit_message)
+    except GitHubCommitError as e:
+        st.error(f"[ERROR] GitHubコミット失敗: {e}")
         return
 
-    content_b64 = base64.b64encode(json_str.encode("utf-8")).decode("utf-8")
-    put_data = {
-        "message": commit_message,
-        "content": content_b64,
-        "branch": BRANCH
-    }
-    if sha:
-        put_data["sha"] = sha
-
-    put_res = requests.put(url, headers=headers, json=put_data)
-    if put_res.status_code in [200, 201]:
-        st.success(f"GitHubへのコミット成功: {target_file_path}")
+    if result["commit"] is None:
+        st.info(f"GitHub上と同じ内容のためコミットしませんでした: {', '.join(result['skipped'])}")
     else:
-        st.error(f"[ERROR] GitHubコミット失敗: {put_res.status_code}, {put_res.text}")
+        st.success(f"GitHubへのコミット成功 ({result['commit'][:7]}): {', '.join(result['changed'])}")
+        if result["skipped"]:
+            st.caption(f"変更なし: {', '.join(result['skipped'])}")
+
+def commit_to_github(json_str: str, target_file_path: str, commit_message: str):
+    """GitHub上のファイルにコミットする"""
+    commit_files_to_github({target_file_path: json_str}, commit_message)
+
+def commit_data_files_to_github():
+    """data/ の3つの JSON (ローカルにあるもの) をまとめて1コミットにする"""
+    files = {}
+    for path in (LINK_MAPPING_FILE_PATH, ARTICLES_FILE_PATH):
+        if os.path.exists(path):
+            files[path] = json.dumps(load_json(path), ensure_ascii=False, indent=2)
+    if os.path.exists(LINK_USAGE_FILE_PATH):
+        files[LINK_USAGE_JSON_PATH] = json.dumps(load_link_usage(LINK_USAGE_FILE_PATH), ensure_ascii=False, indent=2)
+    if not files:
+        st.warning("コミットするファイルがありません。")
+        return
+    commit_files_to_github(files, "Update data files from Streamlit")
 
 def flatten_link_mapping(nested_map: dict) -> dict:
     """
@@ -129,7 +215,7 @@ def get_auth_headers(username, password):
 
 def get_post_raw_content(post_id, WP_URL, WP_USERNAME, WP_PASSWORD):
     headers = get_auth_headers(WP_USERNAME, WP_PASSWORD)
-    resp = requests.get(
+    resp = get_session().get(
         f"{WP_URL}/wp-json/wp/v2/posts/{post_id}?context=edit",
         headers=headers
     )
@@ -139,101 +225,61 @@ def get_post_raw_content(post_id, WP_URL, WP_USERNAME, WP_PASSWORD):
     data = resp.json()
     return data.get("content", {}).get("raw", "")
 
-def insert_links_to_content(content, link_mapping, max_links_per_post=3):
+def preview_insert_links(articles_data, kw_maps, WP_URL, WP_USERNAME, WP_PASSWORD):
     """
-    link_mapping: { キーワード: URL, ... }
-    キーワードが文章中に出現したら最初の1回だけアンカータグ化。
-    既にリンクがある箇所はスキップ。
-    ショートコード([...])は一時置換で回避。
+    一括挿入 (job_runner.run_insert_job) のドライラン。WordPress は更新せず、
+    挿入されるリンク (記事ID・キーワード・位置・前後の文) のレポートを返す。
+    本文のスナップショット (corpus_store.py) があれば、更新日時が一致する記事はそこから読む。
+    WordPress からの取得は INSERT_LINKS_RATE 件/秒 までに抑え、計画は Streamlit のプロセス内で計算する
+    (スレッドの多い Streamlit から子プロセスを fork しない)。
     """
-    links_added = 0
-
-    # ショートコード除外用
-    shortcode_pattern = r"(\[.*?\])"
-    shortcodes = []
-    def shortcode_replacer(m):
-        shortcodes.append(m.group(0))
-        return f"__SHORTCODE_{len(shortcodes)-1}__"
-
-    content = re.sub(shortcode_pattern, shortcode_replacer, content)
-
-    # キーワードごとに検索してリンク挿入
-    for kw, url in link_mapping.items():
-        if links_added >= max_links_per_post:
-            break
-        pattern = rf'(<a[^>]*>.*?</a>|{re.escape(kw)})'
-
-        def replacement(m):
-            nonlocal links_added
-            text = m.group(0)
-            # 既にリンクのタグ内ならそのまま
-            if text.lower().startswith("<a"):
-                return text
-            # ここでリンク化
-            links_added += 1
-            return f'<a href="{url}">{text}</a>'
-
-        updated = re.sub(pattern, replacement, content, count=1)
-        if updated != content:
-            content = updated
-
-    # ショートコード復元
-    def shortcode_restore(m):
-        idx = int(m.group(1).split("_")[-1])
-        return shortcodes[idx]
-
-    content = re.sub(r"__SHORTCODE_(\d+)__", shortcode_restore, content)
-    return content
-
-def update_post_content(post_id, new_content, WP_URL, WP_USERNAME, WP_PASSWORD):
-    headers = get_auth_headers(WP_USERNAME, WP_PASSWORD)
-    payload = {"content": new_content}
-    resp = requests.post(
-        f"{WP_URL}/wp-json/wp/v2/posts/{post_id}",
-        json=payload,
-        headers=headers
-    )
-    return resp.status_code, resp.text
-
-def run_insert_links(articles_data, link_usage, WP_URL, WP_USERNAME, WP_PASSWORD):
+    corpus = CorpusStore(CORPUS_PATH) if os.path.exists(CORPUS_PATH) else None
+    limiter = HostRateLimiter(INSERT_LINKS_RATE)
+
+    def fetch(article):
+        if corpus is not None:
+            raw_content = corpus.get_content(article["id"], article.get("modified", ""))
+            if raw_content:
+                return raw_content
+        limiter.wait(WP_URL)
+        return get_post_raw_content(int(article["id"]), WP_URL, WP_USERNAME, WP_PASSWORD) or None
+
+    try:
+        return run_preview(articles_data, fetch, kw_maps=kw_maps, processes=1)
+    finally:
+        if corpus is not None:
+            corpus.close()
+
+def build_unlink_maps(article_ids, off_kws, link_mapping_flat, kw_maps):
     """
-    link_usage:
-      {
-        "キーワードA": {
-          "url": "https://...",
-          "articles_used_in": {
-             "1234": 回数, "5678": 回数
-          }
-        },
-        ...
-      }
-
-    上記に基づき、(articles_used_in に1回以上設定されている)記事へリンク挿入。
+    OFF にしたキーワードのリンク先を、記事ごとの「外すリンク先」 {記事ID: [URL, ...]} にする。
+    同じ記事で ON のまま残るキーワードと同じリンク先は外さない。
     """
-    # 記事ID -> {キーワード:URL} の辞書を作る
-    article_to_kws = {}
-    for kw, usage_info in link_usage.items():
-        link_url = usage_info.get("url", "")
-        for art_id_str in usage_info.get("articles_used_in", {}):
-            article_to_kws.setdefault(art_id_str, {})[kw] = link_url
-
-    # 各記事に対してリンクを挿入
-    for art_id_str, kw_map in article_to_kws.items():
-        post_id = int(art_id_str)
-        found_article = next((a for a in articles_data if a["id"] == art_id_str), None)
-        art_title = found_article["title"] if found_article else "(不明)"
-
-        raw_content = get_post_raw_content(post_id, WP_URL, WP_USERNAME, WP_PASSWORD)
-        if not raw_content:
-            print(f"[WARN] No content for {post_id} ({art_title}), skip.")
-            continue
-
-        updated_content = insert_links_to_content(raw_content, kw_map, max_links_per_post=3)
-        if updated_content != raw_content:
-            status, txt = update_post_content(post_id, updated_content, WP_URL, WP_USERNAME, WP_PASSWORD)
-            print(f"Updated post {post_id} ({art_title}), status={status}")
-        else:
-            print(f"No changes for post {post_id} ({art_title}).")
+    off_urls = {normalize_url(link_mapping_flat[kw]): link_mapping_flat[kw]
+                for kw in off_kws if link_mapping_flat.get(kw)}
+    unlink_maps = {}
+    for art_id in article_ids:
+        keep = {normalize_url(url) for url in kw_maps.get(art_id, {}).values() if url}
+        urls = sorted(url for key, url in off_urls.items() if key not in keep)
+        if urls:
+            unlink_maps[art_id] = urls
+    return unlink_maps
+
+def submit_insert_job(data, use_index, label, kw_maps=None, unlink_maps=None):
+    """
+    リンク挿入をバックグラウンドジョブとして登録し、ジョブIDを返す。
+    kw_maps ({記事ID: {キーワード: URL}}) を省略すると linkUsage で ON の全記事が対象。
+    unlink_maps ({記事ID: [URL, ...]}) を渡すと、同じジョブで該当記事の既存リンクも外す。
+    """
+    params = {
+        "kw_maps": data.article_kw_maps() if kw_maps is None else kw_maps,
+        "unlink_maps": unlink_maps or {},
+        "article_urls": {a["id"]: a.get("url", "") for a in data.articles},
+        "use_index": use_index,
+        "modified": {a["id"]: a.get("modified", "") for a in data.articles},
+        "rate": INSERT_LINKS_RATE,
+    }
+    return get_runner().submit(KIND_INSERT, params, label=label)
 
 # ===================================
 # タブ1: リンクマッピング管理
@@ -241,16 +287,17 @@ def run_insert_links(articles_data, link_usage, WP_URL, WP_USERNAME, WP_PASSWORD
 def link_mapping_management():
     st.subheader("リンクマッピング管理 (linkMapping.json)")
 
-    link_mapping_data = load_json(LINK_MAPPING_FILE_PATH)
+    # 編集は draft.data (session_state) に溜め、mapping_save_status() がまとめて保存する
+    draft = get_mapping_draft()
+    link_mapping_data = draft.data
 
     # もし旧フラット形式ならUncategorizedへ移行する例
     if link_mapping_data and not all(isinstance(v, dict) for v in link_mapping_data.values()):
         st.warning("旧来のフラット構造を検出。'Uncategorized' カテゴリに移行します。")
-        link_mapping_data = {"Uncategorized": link_mapping_data}
-        save_json_locally(link_mapping_data, LINK_MAPPING_FILE_PATH)
+        link_mapping_data = draft.data = {"Uncategorized": link_mapping_data}
+        draft.mark_edited()
 
-    if not link_mapping_data:
-        link_mapping_data = {}
+    mapping_save_status(draft)
 
     # カテゴリ一覧の表示・編集
     st.write("## カテゴリ一覧")
@@ -271,18 +318,18 @@ def link_mapping_management():
                 ).strip()
                 if col2.button("削除", key=f"del_cat_{category_name}"):
                     del link_mapping_data[category_name]
-                    save_json_locally(link_mapping_data, LINK_MAPPING_FILE_PATH)
+                    draft.mark_edited()
                     st.success(f"カテゴリー '{category_name}' を削除しました。")
-                    st.experimental_rerun()
+                    st.rerun()
                 if new_cat_name and new_cat_name != category_name:
                     if new_cat_name in link_mapping_data:
                         st.error(f"既に同名カテゴリ '{new_cat_name}' が存在します。")
                     else:
                         link_mapping_data[new_cat_name] = cat_data
                         del link_mapping_data[category_name]
-                        save_json_locally(link_mapping_data, LINK_MAPPING_FILE_PATH)
+                        draft.mark_edited()
                         st.success(f"カテゴリー名を '{new_cat_name}' に変更しました。")
-                        st.experimental_rerun()
+                        st.rerun()
 
                 st.write("### キーワード/URL の一覧")
                 for kw, url in list(cat_data.items()):
@@ -292,9 +339,9 @@ def link_mapping_management():
                     # 削除ボタン
                     if c3.button("削除", key=f"del_{category_name}_{kw}"):
                         del cat_data[kw]
-                        save_json_locally(link_mapping_data, LINK_MAPPING_FILE_PATH)
+                        draft.mark_edited()
                         st.success(f"キーワード '{kw}' を削除しました。")
-                        st.experimental_rerun()
+                        st.rerun()
                     # 更新
                     if new_kw != kw:
                         if new_kw in cat_data:
@@ -302,14 +349,14 @@ def link_mapping_management():
                         else:
                             del cat_data[kw]
                             cat_data[new_kw] = new_url
-                            save_json_locally(link_mapping_data, LINK_MAPPING_FILE_PATH)
+                            draft.mark_edited()
                             st.success(f"キーワード名を '{new_kw}' に変更しました。")
-                            st.experimental_rerun()
+                            st.rerun()
                     elif new_url != url:
                         cat_data[kw] = new_url
-                        save_json_locally(link_mapping_data, LINK_MAPPING_FILE_PATH)
+                        draft.mark_edited()
                         st.success(f"URLを更新しました。(キーワード={kw})")
-                        st.experimental_rerun()
+                        st.rerun()
 
                 st.write("### 新規キーワード追加")
                 new_kw_add = st.text_input("キーワード", key=f"add_kw_{category_name}").strip()
@@ -320,9 +367,9 @@ def link_mapping_management():
                             st.warning(f"キーワード '{new_kw_add}' は既に存在します。")
                         else:
                             cat_data[new_kw_add] = new_url_add
-                            save_json_locally(link_mapping_data, LINK_MAPPING_FILE_PATH)
+                            draft.mark_edited()
                             st.success(f"新規キーワード '{new_kw_add}' を追加しました。")
-                            st.experimental_rerun()
+                            st.rerun()
                     else:
                         st.warning("キーワードとURLを入力してください。")
 
@@ -334,21 +381,57 @@ def link_mapping_management():
                 st.warning(f"カテゴリ '{new_cat}' は既に存在します。")
             else:
                 link_mapping_data[new_cat] = {}
-                save_json_locally(link_mapping_data, LINK_MAPPING_FILE_PATH)
+                draft.mark_edited()
                 st.success(f"新規カテゴリー '{new_cat}' を追加しました。")
-                st.experimental_rerun()
+                st.rerun()
         else:
             st.warning("カテゴリー名を入力してください。")
 
     # GitHubコミットボタン
     if st.button("linkMapping.json をGitHubへコミット"):
+        flush_mapping_draft(draft)
         js_str = json.dumps(link_mapping_data, ensure_ascii=False, indent=2)
         commit_to_github(js_str, LINK_MAPPING_FILE_PATH, "Update linkMapping.json from Streamlit")
 
+def mapping_save_status(draft: JsonDraft):
+    """未保存の編集の件数表示と自動保存 (最後の編集から AUTOSAVE_DELAY_SECONDS 秒後にまとめて書き出す)"""
+    @st.fragment(run_every=AUTOSAVE_POLL_SECONDS if draft.pending else None)
+    def _status():
+        status = draft.refresh()
+        if status == RELOADED:
+            st.rerun()
+        if status == CONFLICT:
+            st.warning("linkMapping.json が他で更新されました。未保存の編集をどうするか選んでください。")
+            c1, c2 = st.columns(2)
+            if c1.button("編集内容で上書き保存", key="mapping_overwrite"):
+                flush_mapping_draft(draft)
+                st.rerun()
+            if c2.button("編集を破棄して読み直す", key="mapping_discard"):
+                draft.discard()
+                st.rerun()
+            return
+        if draft.due(AUTOSAVE_DELAY_SECONDS):
+            flush_mapping_draft(draft)
+        if draft.pending:
+            c1, c2 = st.columns([4, 1])
+            c1.caption(f"未保存の変更 {draft.pending} 件 (最後の編集から{AUTOSAVE_DELAY_SECONDS}秒後に自動保存)")
+            if c2.button("今すぐ保存", key="mapping_save_now"):
+                flush_mapping_draft(draft)
+                st.rerun()
+        else:
+            st.caption("linkMapping.json に保存済み")
+
+    _status()
+
 # ===================================
 # タブ2: 全記事リンク管理 (使用状況とON/OFF一括設定)
 # ===================================
 def all_articles_link_management():
+    # キーワード索引 (SQLite) の接続はこのタブの描画中だけ開き、途中で return しても閉じる
+    with ExitStack() as resources:
+        _all_articles_link_management(resources)
+
+def _all_articles_link_management(resources):
     st.subheader("全記事リンク管理：使用状況の確認＆ON/OFF一括設定")
 
     # WordPress認証情報
@@ -356,13 +439,13 @@ def all_articles_link_management():
     WP_USERNAME = os.environ.get("WP_USERNAME", "")
     WP_PASSWORD = os.environ.get("WP_PASSWORD", "")
 
-    # データ読み込み
-    nested_mapping = load_json(LINK_MAPPING_FILE_PATH)
-    link_usage     = load_json(LINK_USAGE_FILE_PATH)
-    articles_data  = load_json(ARTICLES_FILE_PATH)
+    # データ読み込み (ファイルが保存されるまではキャッシュした索引を使う)
+    data = get_link_data()
+    articles_data = data.articles
+    link_mapping_flat = data.link_mapping
 
     # linkMappingが空の場合
-    if not nested_mapping:
+    if not data.nested_mapping:
         st.warning("linkMapping.json が空です。先に「リンクマッピング管理」でキーワードとURLを設定してください。")
         return
     # articlesが空の場合
@@ -370,56 +453,30 @@ def all_articles_link_management():
         st.warning("articles.json が空です。先に「WordPress記事一覧管理」で記事を取得してください。")
         return
 
-    # フラット化した {kw: url} を取得
-    link_mapping_flat = flatten_link_mapping(nested_mapping)
-
-    # linkUsage.json が未初期化の場合は、link_mapping_flat構造に応じて空テンプレを作る
-    if not link_usage:
-        link_usage = {}
-        for kw, url in link_mapping_flat.items():
-            link_usage[kw] = {
-                "url": url,
-                "articles_used_in": {}
-            }
-
-    # urlが変わっている可能性を同期
-    for kw, url in link_mapping_flat.items():
-        if kw not in link_usage:
-            link_usage[kw] = {"url": url, "articles_used_in": {}}
-        else:
-            if link_usage[kw].get("url") != url:
-                link_usage[kw]["url"] = url
-
     # ① 画面上部に「キーワードのリンクON/OFF設定」欄を表示
     st.write("### キーワードのリンクON/OFF（複数記事同時）")
 
-    # 先に「どのキーワードをON/OFFにするか」を決めるためにチェックを用意する
-    # （実際には記事が選択されてからON/OFFを反映）
-    # ただしUI的に、まだ記事を選択していない場合は全体のチェック状態が曖昧なので
-    # “仮チェック”として管理し、後段で実際のON/OFFに反映させる。
-    # → 今回は特に「全キーワードを一斉に」とはせず、キーワード欄はシンプルに表示だけしておきます
-    #    実際のON/OFF反映はボタン押下時に行う
-    st.info("下部でチェックした記事に対して、ここで選んだキーワードをON (挿入) or OFF (解除) にします。")
-
-    # キーワードの選択状態を保持
-    # ONにしたい: user wants to toggle them "on"
-    # OFFにしたい: user wants to toggle them "off"
-    # "No Change": 変更しない
-    # …など設計は自由ですが、ここではシンプルにON/OFFのcheckboxだけ用意します
-    # “ONにする”か“オフにする”を区別するために2種類のCheckboxを並べてもOK
-    # ここでは “ONにする” チェックで実装例:
-    on_kws = []
-    off_kws = []
-
-    st.write("#### → ONにしたいキーワード")
-    for kw in link_mapping_flat.keys():
-        if st.checkbox(kw, value=False, key=f"kw_on_{kw}"):
-            on_kws.append(kw)
-
-    st.write("#### → OFFにしたいキーワード")
-    for kw in link_mapping_flat.keys():
-        if st.checkbox(kw, value=False, key=f"kw_off_{kw}"):
-            off_kws.append(kw)
+    st.info("下部で選択した記事に対して、ここで選んだキーワードをON (挿入) or OFF (解除) にします。")
+
+    # キーワード → 記事 の索引 (本文のスナップショットから作成) があれば、候補記事数を表示する
+    keyword_index = None
+    if os.path.exists(KEYWORD_INDEX_PATH):
+        keyword_index = resources.enter_context(KeywordIndex(KEYWORD_INDEX_PATH))
+    if os.path.exists(CORPUS_PATH) and st.button("キーワード索引を更新 (本文スナップショットから)"):
+        with CorpusStore(CORPUS_PATH) as corpus:
+            keyword_index = keyword_index or resources.enter_context(KeywordIndex(KEYWORD_INDEX_PATH))
+            stats = keyword_index.update(corpus, link_mapping_flat)
+        st.success(f"索引を更新しました ({stats['posts']}記事, 再走査 {stats['rescanned']}記事, "
+                   f"追加キーワード {stats['new_keywords']}個, {stats['elapsed']:.2f}秒)")
+    candidate_counts = keyword_index.candidate_counts() if keyword_index else {}
+
+    def kw_label(kw):
+        return f"{kw} (本文に出現: {candidate_counts[kw]}記事)" if kw in candidate_counts else kw
+
+    # キーワードごとのチェックボックスは再描画が重いので multiselect にまとめる
+    kw_options = list(link_mapping_flat.keys())
+    on_kws = st.multiselect("→ ONにしたいキーワード", kw_options, format_func=kw_label, key="kw_on")
+    off_kws = st.multiselect("→ OFFにしたいキーワード", kw_options, key="kw_off")
 
     st.write("---")
 
@@ -428,81 +485,118 @@ def all_articles_link_management():
     col1, col2, col3 = st.columns([3,3,2])
     f_article = col1.text_input("記事タイトル検索(一部一致)", key="usage_search_title").strip()
     f_kw      = col2.text_input("キーワード検索(一部一致)", key="usage_search_kw").strip()
-    sort_opt  = col3.selectbox("ソート順", ["多い順", "少ない順", "記事ID昇順", "記事ID降順"], key="usage_sort")
+    sort_opt  = col3.selectbox("ソート順", list(SORT_OPTIONS), key="usage_sort")
+    only_candidates = False
+    if keyword_index and on_kws:
+        only_candidates = st.checkbox("ONにするキーワードが本文に出現する記事だけを表示", value=False,
+                                      key="usage_only_candidates")
 
     if st.button("【一括】すべての記事に内部リンクを挿入する"):
         if not (WP_URL and WP_USERNAME and WP_PASSWORD):
             st.error("WP_URL / WP_USERNAME / WP_PASSWORD が未設定のため、WP更新をスキップします。")
         else:
-            # 選択状況に関係なく、linkUsageに登録されている記事すべてへリンク挿入を実行
-            run_insert_links(articles_data, link_usage, WP_URL, WP_USERNAME, WP_PASSWORD)
-            st.success("すべての記事に対して内部リンクの一括挿入が完了しました。")
+            # 選択状況に関係なく、linkUsageに登録されている記事すべてへリンク挿入を実行 (バックグラウンド)
+            job_id = submit_insert_job(data, keyword_index is not None, "一括リンク挿入 (全記事)")
+            st.success(f"一括挿入をバックグラウンドで開始しました (ジョブID={job_id})。"
+                       "進捗は「バックグラウンドジョブ」タブで確認できます。")
+
+    if st.button("【ドライラン】一括挿入で入るリンクをプレビュー (WPは更新しない)"):
+        if not (WP_URL and WP_USERNAME and WP_PASSWORD):
+            st.error("WP_URL / WP_USERNAME / WP_PASSWORD が未設定のため、本文を取得できません。")
+        else:
+            st.session_state["insert_preview"] = preview_insert_links(
+                articles_data, data.article_kw_maps(), WP_URL, WP_USERNAME, WP_PASSWORD)
+
+    if st.session_state.get("insert_preview"):
+        report = st.session_state["insert_preview"]
+        summary = report["summary"]
+        st.info(f"プレビュー: 対象 {summary['total']}記事 → 変更 {summary['changed_posts']}記事 / "
+                f"リンク {summary['links']}本 (取得失敗 {summary['fetch_failed']}件)")
+        st.dataframe(list(iter_report_rows(report)), use_container_width=True)
+        col_json, col_html = st.columns(2)
+        col_json.download_button("レポート (JSON) をダウンロード", render_json_report(report),
+                                 file_name="linkPreview.json", mime="application/json")
+        col_html.download_button("差分サマリー (HTML) をダウンロード", render_html_report(report),
+                                 file_name="linkPreview.html", mime="text/html")
     
-    # 記事ID -> 合計リンク数, 内訳
-    article_usage_summary = {}
-    for art in articles_data:
-        art_id = art["id"]
-        article_usage_summary[art_id] = {
-            "title": art["title"],
-            "url": art["url"],
-            "total_link_count": 0,
-            "details": {}
-        }
-
-    # linkUsageから記事別リンク数を集計
-    for kw, usage_info in link_usage.items():
-        used_in = usage_info.get("articles_used_in", {})
-        for art_id, cnt in used_in.items():
-            if art_id not in article_usage_summary:
-                # もしarticles.jsonに未登録のIDがあってもスキップ
-                continue
-            article_usage_summary[art_id]["total_link_count"] += cnt
-            article_usage_summary[art_id]["details"].setdefault(kw, 0)
-            article_usage_summary[art_id]["details"][kw] += cnt
-
-    # フィルタ
-    filtered_list = []
-    for art_id, info in article_usage_summary.items():
-        # 記事タイトルフィルタ
-        if f_article and (f_article.lower() not in info["title"].lower()):
-            continue
-        # キーワードフィルタ
-        if f_kw:
-            # detailsにf_kwを含むkwがなければ除外
-            matched_kws = [k for k in info["details"].keys() if f_kw.lower() in k.lower()]
-            if not matched_kws:
-                continue
-        filtered_list.append((art_id, info))
-
-    # ソート
-    if sort_opt == "多い順":
-        filtered_list.sort(key=lambda x: x[1]["total_link_count"], reverse=True)
-    elif sort_opt == "少ない順":
-        filtered_list.sort(key=lambda x: x[1]["total_link_count"])
-    elif sort_opt == "記事ID昇順":
-        filtered_list.sort(key=lambda x: int(x[0]))
-    else:
-        filtered_list.sort(key=lambda x: int(x[0]), reverse=True)
-
-    st.write(f"#### 該当記事数: {len(filtered_list)}")
-
-    # ③ 記事一覧をチェックボックス形式で表示（複数選択可）
-    selected_articles = []
-    for art_id, info in filtered_list:
-        # ラベル
-        label = f"{info['title']} (ID={art_id})  [ 記事URL ]({info['url']})"
-        # 記事選択用チェックボックス
-        is_checked = st.checkbox(label, value=False, key=f"art_select_{art_id}")
-        # リンク数表示
-        if info["total_link_count"] == 0:
-            st.write("- 内部リンクはありません。")
+    # ONにするキーワードの候補記事 (索引から取得)
+    candidate_ids = None
+    if only_candidates:
+        candidate_ids = tuple(sorted({hit["id"] for kw in on_kws for hit in keyword_index.articles_for(kw)}))
+
+    # フィルタ・ソートはキャッシュした索引の上で行い、同じ条件なら結果も使い回す
+    filtered_ids = _cached_article_query(
+        file_signature(ARTICLES_FILE_PATH, LINK_MAPPING_FILE_PATH, LINK_USAGE_FILE_PATH),
+        f_article, f_kw, SORT_OPTIONS[sort_opt], candidate_ids)
+
+    st.write(f"#### 該当記事数: {len(filtered_ids)}")
+
+    # ③ 記事一覧 (表示中のページの行だけを表にする。選択はページをまたいで session_state に保持)
+    selected = st.session_state.setdefault("selected_article_ids", set())
+    st.session_state.setdefault("usage_table_version", 0)
+
+    col_size, col_page = st.columns(2)
+    page_size = col_size.selectbox("1ページの件数", PAGE_SIZE_OPTIONS, index=1, key="usage_page_size")
+    n_pages = max(1, -(-len(filtered_ids) // page_size))
+    # 値は session_state だけで持つ (value= と併用すると Streamlit が警告を出す)。絞り込みでページ数が減ったら寄せる
+    st.session_state["usage_page"] = min(max(1, st.session_state.get("usage_page", 1)), n_pages)
+    page = col_page.number_input(f"ページ (全{n_pages}ページ)", min_value=1, max_value=n_pages,
+                                 step=1, key="usage_page")
+    page_ids = filtered_ids[(page - 1) * page_size: page * page_size]
+
+    col_a, col_b, col_c = st.columns(3)
+    bulk_select = None
+    if col_a.button("このページをすべて選択"):
+        bulk_select = ("add", page_ids)
+    if col_b.button("該当記事をすべて選択"):
+        bulk_select = ("add", filtered_ids)
+    if col_c.button("選択をすべて解除"):
+        bulk_select = ("clear", ())
+    if bulk_select:
+        if bulk_select[0] == "clear":
+            selected.clear()
         else:
-            detail_txt = ", ".join([f"{k}({c}回)" for k,c in info["details"].items()])
-            st.write(f"- リンク挿入合計: {info['total_link_count']} ( {detail_txt} )")
+            selected.update(bulk_select[1])
+        # 表の編集状態を捨てて、選択状態から表を作り直す
+        st.session_state["usage_table_version"] += 1
+
+    if page_ids:
+        rows = []
+        for art_id in page_ids:
+            art = data.articles_by_id[art_id]
+            details = data.keywords_for(art_id)
+            rows.append({
+                "選択": art_id in selected,
+                "ID": art_id,
+                "タイトル": art["title"],
+                "リンク合計": data.article_link_totals[art_id],
+                "内訳": ", ".join(f"{k}({c}回)" for k, c in details.items()) or "内部リンクなし",
+                "URL": art["url"],
+            })
+        editor_key = "usage_table_{}_{}_{}_{}".format(
+            st.session_state["usage_table_version"], page, page_size,
+            hash((f_article, f_kw, sort_opt, candidate_ids)))
+        edited = st.data_editor(
+            rows,
+            key=editor_key,
+            hide_index=True,
+            use_container_width=True,
+            disabled=["ID", "タイトル", "リンク合計", "内訳", "URL"],
+            column_config={
+                "選択": st.column_config.CheckboxColumn("選択", width="small"),
+                "URL": st.column_config.LinkColumn("記事URL"),
+            },
+        )
+        for row in edited:
+            if row["選択"]:
+                selected.add(row["ID"])
+            else:
+                selected.discard(row["ID"])
+    else:
+        st.info("条件に一致する記事がありません。")
 
-        # 選択ならリストに追加
-        if is_checked:
-            selected_articles.append(art_id)
+    selected_articles = sorted(selected, key=int)
+    st.write(f"選択中: {len(selected_articles)}記事 (他のページ・絞り込みで非表示の記事を含む)")
 
     st.write("---")
     st.write("### 変更を保存 & WordPress更新")
@@ -515,12 +609,17 @@ def all_articles_link_management():
         # linkUsage.json に反映
         #   - on_kws に含まれるキーワード → 選択された記事を articles_used_in に追加
         #   - off_kws に含まれるキーワード → 選択された記事を articles_used_in から削除
+        #   WordPress へは、選択した記事のうち ON に変わったキーワード (on_maps) と OFF のリンクだけを反映する
+        # 編集用の dict はここで初めて作る (linkMapping のキーワード・URL と同期済み)
+        link_usage = data.link_usage
         changed = False
+        on_maps = {}
         for kw in on_kws:
             usage_info = link_usage.setdefault(kw, {"url": link_mapping_flat[kw], "articles_used_in": {}})
             for art_id in selected_articles:
                 if art_id not in usage_info["articles_used_in"]:
                     usage_info["articles_used_in"][art_id] = 1
+                    on_maps.setdefault(art_id, {})[kw] = link_mapping_flat[kw]
                     changed = True
 
         for kw in off_kws:
@@ -530,25 +629,32 @@ def all_articles_link_management():
                     del usage_info["articles_used_in"][art_id]
                     changed = True
 
-        if not changed:
+        # OFF のキーワードは linkUsage に記録が無くても、記事に残っているリンクを外す
+        if not changed and not off_kws:
             st.info("ON/OFF変更がありませんでした。")
             return
 
         # 1) linkUsage.json 保存
-        save_json_locally(link_usage, LINK_USAGE_FILE_PATH)
-        st.success("linkUsage.json を更新しました。")
+        if changed:
+            save_link_usage(link_usage, LINK_USAGE_FILE_PATH)
+            clear_link_data_cache()
+            st.success(f"{LINK_USAGE_FILE_PATH} を更新しました。")
 
-        # 2) WordPress記事更新
+        # 2) WordPress記事更新 (リンクの削除と挿入を記事ごとに1回の取得・更新で行う)
         if not (WP_URL and WP_USERNAME and WP_PASSWORD):
             st.error("WP_URL / WP_USERNAME / WP_PASSWORD が未設定のため、WP更新をスキップします。")
             return
-        run_insert_links(articles_data, link_usage, WP_URL, WP_USERNAME, WP_PASSWORD)
-        st.success("選択記事へのリンク挿入を完了しました。")
+        data = get_link_data()
+        unlink_maps = build_unlink_maps(selected_articles, off_kws, link_mapping_flat, data.article_kw_maps())
+        job_id = submit_insert_job(data, keyword_index is not None, "ON/OFF変更の反映",
+                                   kw_maps=on_maps, unlink_maps=unlink_maps)
+        st.success(f"リンクの挿入・削除をバックグラウンドで開始しました (ジョブID={job_id}、"
+                   f"リンク挿入の対象 {len(on_maps)}記事、リンク削除の対象 {len(unlink_maps)}記事)。進捗は「バックグラウンドジョブ」タブで確認できます。")
 
         # 3) GitHubコミット (オプション)
         if st.checkbox("linkUsage.json をGitHubへコミットする", value=False):
             usage_str = json.dumps(link_usage, ensure_ascii=False, indent=2)
-            commit_to_github(usage_str, LINK_USAGE_FILE_PATH, "Update linkUsage.json & WP updated")
+            commit_to_github(usage_str, LINK_USAGE_JSON_PATH, "Update linkUsage.json & WP updated")
 
 # ===================================
 # タブ3: WordPress記事一覧管理
@@ -556,7 +662,7 @@ def all_articles_link_management():
 def articles_management():
     st.subheader("WordPress記事一覧管理 (articles.json)")
 
-    articles_data = load_json(ARTICLES_FILE_PATH)
+    articles_data = get_link_data().articles
     st.write(f"登録済み記事数: {len(articles_data)}")
 
     if articles_data:
@@ -577,7 +683,7 @@ def articles_management():
 
         while True:
             params = {"per_page": per_page, "page": page}
-            r = requests.get(base_url, headers=HEADERS, params=params)
+            r = get_session().get(base_url, headers=HEADERS, params=params)
             if r.status_code != 200:
                 st.warning(f"記事取得失敗: HTTP {r.status_code}")
                 break
@@ -621,6 +727,56 @@ def articles_management():
         js = json.dumps(articles_data, ensure_ascii=False, indent=2)
         commit_to_github(js, ARTICLES_FILE_PATH, "Update articles.json from WP REST API")
 
+# ===================================
+# タブ4: バックグラウンドジョブ
+# ===================================
+def render_job(job, runner):
+    total, done = job["total"], job["done"]
+    status = JOB_STATUS_LABELS.get(job["status"], job["status"])
+    st.write(f"**{job['label']}** (ID={job['id']}) ─ {status}")
+    progress = min(done / total, 1.0) if total else (1.0 if job["status"] == DONE else 0.0)
+    st.progress(progress, text=f"{done}/{total or '?'} 件  {throughput(job):.1f} 件/秒  "
+                               f"失敗 {job['failed']} 件  スキップ {job['skipped']} 件")
+    if job["message"]:
+        st.error(job["message"])
+    if job["errors"]:
+        with st.expander(f"直近のエラー ({len(job['errors'])}件)"):
+            st.code("\n".join(job["errors"]))
+    if runner.is_active(job["id"]):
+        if st.button("キャンセル", key=f"job_cancel_{job['id']}"):
+            runner.cancel(job["id"])
+    elif job["status"] in (FAILED, CANCELLED, INTERRUPTED):
+        if st.button("再開", key=f"job_resume_{job['id']}"):
+            runner.resume(job["id"])
+
+def jobs_management():
+    st.subheader("バックグラウンドジョブ")
+    runner = get_runner()
+
+    col1, col2, col3 = st.columns([3, 3, 2])
+    if col1.button("記事一覧を取得 (crawl_links.py)"):
+        job_id = runner.submit(KIND_CRAWL, {"args": []}, label="記事一覧の取得")
+        st.success(f"ジョブを開始しました (ID={job_id})")
+    detect_source = col3.selectbox("取得元", ["page", "rest", "corpus"], key="job_detect_source")
+    if col2.button("リンク使用状況を調査 (detect_link_usage.py)"):
+        params = {"args": ["--source", detect_source], "total": len(get_link_data().articles)}
+        job_id = runner.submit(KIND_DETECT, params, label=f"リンク使用状況の調査 ({detect_source})")
+        st.success(f"ジョブを開始しました (ID={job_id})")
+
+    # 実行中のジョブがある間は、この部分だけを定期的に再描画して進捗を更新する
+    active = any(runner.is_active(job["id"]) for job in runner.list_jobs())
+
+    @st.fragment(run_every=JOB_POLL_SECONDS if active else None)
+    def job_list():
+        jobs = runner.list_jobs()
+        if not jobs:
+            st.info("まだジョブはありません。")
+        for job in jobs:
+            st.write("---")
+            render_job(job, runner)
+
+    job_list()
+
 # ===================================
 # メイン: Streamlitアプリ
 # ===================================
@@ -630,7 +786,8 @@ def main():
     tabs = st.tabs([
         "リンクマッピング管理",
         "全記事リンク管理",
-        "WordPress記事一覧管理"
+        "WordPress記事一覧管理",
+        "バックグラウンドジョブ"
     ])
 
     with tabs[0]:
@@ -642,5 +799,13 @@ def main():
     with tabs[2]:
         articles_management()
 
+    with tabs[3]:
+        jobs_management()
+
+    with st.sidebar:
+        st.caption("GitHub への保存")
+        if st.button("data/ の JSON をまとめてGitHubへコミット"):
+            commit_data_files_to_github()
+
 if __name__ == "__main__":
     main()
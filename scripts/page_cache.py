@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+記事ページの条件付き GET 用キャッシュ (detect_link_usage.py で使用)。
+
+URL ごとに ETag / Last-Modified と、ページから抽出したリンク数
+{正規化URL: 回数} だけを保存する (HTML 本体は保存しない)。
+次回は If-None-Match / If-Modified-Since を付けて GET し、
+304 が返ればページを再取得・再解析せずに前回のリンク数を使う。
+"""
+
+import json
+import os
+import threading
+
+from json_store import atomic_write_bytes
+
+PAGE_CACHE_PATH = os.path.join(".cache", "pageCache.json")
+CACHE_VERSION = 2  # 保存するリンク数の形式を変えたら上げる
+
+
+class PageCache:
+    def __init__(self, path=PAGE_CACHE_PATH):
+        self.path = path
+        self.entries = {}
+        self.seen = set()
+        self.stats = {"hits": 0, "misses": 0, "uncached": 0, "bytes_saved": 0, "bytes_fetched": 0}
+        # 並行クロールのワーカーから同時に呼ばれるため更新はロックで守る
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == CACHE_VERSION:
+                    self.entries = data.get("entries", {})
+            except (OSError, ValueError) as e:
+                print(f"[WARN] Ignoring broken page cache {path}: {e}")
+
+    def conditional_headers(self, url: str) -> dict:
+        """前回の ETag / Last-Modified から条件付き GET 用のヘッダを作る"""
+        with self._lock:
+            entry = self.entries.get(url)
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def hit(self, url: str):
+        """304 を受け取ったときに呼ぶ。前回のリンク数 {正規化URL: 回数} を返す"""
+        with self._lock:
+            entry = self.entries.get(url)
+            if entry is None:
+                return None
+            self.seen.add(url)
+            self.stats["hits"] += 1
+            self.stats["bytes_saved"] += entry.get("bytes", 0)
+            return entry["hrefs"]
+
+    def keep(self, url: str):
+        """今回は取得しなかったが (中断からの再開など) エントリを残したい URL を登録する"""
+        with self._lock:
+            self.seen.add(url)
+
+    def store(self, url: str, resp, hrefs: dict):
+        """200 を受け取ったときに呼ぶ。検証子があればリンク数と一緒に保存する"""
+        nbytes = len(resp.content)
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+        with self._lock:
+            self.seen.add(url)
+            self.stats["misses"] += 1
+            self.stats["bytes_fetched"] += nbytes
+            if not (etag or last_modified):
+                # 検証子が無いページは条件付き GET できないので保存しない
+                self.stats["uncached"] += 1
+                self.entries.pop(url, None)
+                return
+            self.entries[url] = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "bytes": nbytes,
+                "hrefs": hrefs,
+            }
+
+    def save(self):
+        """今回アクセスした URL だけを残して書き出す (一時ファイル経由で置き換え)"""
+        with self._lock:
+            entries = {url: e for url, e in self.entries.items() if url in self.seen}
+        payload = json.dumps({"version": CACHE_VERSION, "entries": entries}, ensure_ascii=False,
+                             separators=(",", ":"))
+        atomic_write_bytes(payload.encode("utf-8"), self.path)
+
+    def summary(self) -> str:
+        s = self.stats
+        requests_made = s["hits"] + s["misses"]
+        ratio = s["hits"] / requests_made if requests_made else 0.0
+        return (f"[CACHE] hits={s['hits']} misses={s['misses']} hit_ratio={ratio:.1%} "
+                f"bytes_saved={s['bytes_saved']} bytes_fetched={s['bytes_fetched']} "
+                f"uncacheable={s['uncached']}")
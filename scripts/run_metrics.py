@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+スクリプト実行ごとの段階別の計測と、その結果の書き出し。
+
+- 記事 (ページ) ごとに 取得 (fetch)・解析 (parse)・キーワード照合 (match)・更新 (write) などの所要時間を記録し、
+  段階ごとに件数・合計・p50 / p95 / max を集計する
+- http_client のリクエスト計測 (リトライ・エラー・ステータス) と合わせて、実行の最後に
+    reports/metrics/<スクリプト名>.json   実行レポート (JSON)
+    reports/metrics/<スクリプト名>.prom   Prometheus の textfile 形式 (node exporter の textfile collector 用)
+  を書き出す。出力先は RUN_METRICS_DIR / RUN_METRICS_TEXTFILE_DIR で変えられる
+- 環境変数 RUN_PROFILE=cpu で cProfile (メインスレッド。変換はここで行う)、RUN_PROFILE=memory で tracemalloc、
+  RUN_PROFILE=cpu,memory で両方を有効にし、結果を同じディレクトリに書き出す
+
+    @instrument_run("insert_links")
+    def main(argv=None):
+        ...
+        with timed("parse"):
+            ...
+
+計測は instrument_run() の実行中だけ有効で、それ以外 (Streamlit のジョブなど) では timed() / observe() は何もしない。
+レート制限の待ち時間は observe_wait() で rate_wait として別に記録し、同じスレッドで計測中の段階の時間からは除く
+(fetch / write の p50・p95 が --rate の間隔ではなく WordPress の応答時間を表すように)。
+"""
+
+import cProfile
+import functools
+import io
+import math
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from http_client import METRICS
+from json_store import atomic_write_bytes, dump_json_bytes
+
+METRICS_DIR = os.path.join("reports", "metrics")
+METRIC_PREFIX = "link_inserter"
+PROFILE_ENV = "RUN_PROFILE"
+PROFILE_TOP = 30           # プロファイルのテキスト出力に載せる行数
+TRACEMALLOC_FRAMES = 1
+QUANTILES = (0.5, 0.95)
+
+
+def quantile(sorted_values: list, q: float) -> float:
+    """最近傍順位法の q 分位点 (sorted_values は昇順)"""
+    if not sorted_values:
+        return 0.0
+    rank = min(len(sorted_values), max(1, math.ceil(q * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+class StageMetrics:
+    """段階ごとの所要時間 (1件ごと) と件数のカウンタ (スレッドセーフ)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.samples = {}
+            self.counts = {}
+
+    def observe(self, stage: str, seconds: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def count(self, name: str, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def summary(self) -> dict:
+        """{段階: {"count", "total", "p50", "p95", "max"}}"""
+        with self._lock:
+            samples = {stage: sorted(values) for stage, values in self.samples.items()}
+        result = {}
+        for stage, values in samples.items():
+            entry = {"count": len(values), "total": sum(values)}
+            for q in QUANTILES:
+                entry[f"p{int(q * 100)}"] = quantile(values, q)
+            entry["max"] = values[-1] if values else 0.0
+            result[stage] = entry
+        return result
+
+
+# 全スクリプト共通の段階別メトリクス
+STAGES = StageMetrics()
+# スレッドごとの observe_wait() の累計 (timed() / timed_call() の時間から待ち時間を除くため)
+_WAITS = threading.local()
+
+
+def _waited() -> float:
+    return getattr(_WAITS, "seconds", 0.0)
+
+
+def observe(stage: str, seconds: float):
+    STAGES.observe(stage, seconds)
+
+
+def count(name: str, n=1):
+    STAGES.count(name, n)
+
+
+def observe_wait(stage: str, seconds: float):
+    """待ち時間を stage の1件として記録し、同じスレッドで計測中の timed() / timed_call() の時間から除く"""
+    if not STAGES.enabled:
+        return
+    STAGES.observe(stage, seconds)
+    _WAITS.seconds = _waited() + seconds
+
+
+@contextmanager
+def timed(stage: str):
+    """with ブロックの所要時間を stage の1件として記録する"""
+    if not STAGES.enabled:
+        yield
+        return
+    started, waited = time.perf_counter(), _waited()
+    try:
+        yield
+    finally:
+        STAGES.observe(stage, time.perf_counter() - started - (_waited() - waited))
+
+
+def timed_call(stage: str, func):
+    """
+    func の1回の呼び出しを stage の1件として記録するラッパー。
+    戻り値が Future (別プロセスでの計算) の場合は投入しただけなので記録しない
+    (計算側の時間は呼び出し元が observe() で記録する)。
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not STAGES.enabled:
+            return func(*args, **kwargs)
+        started, waited = time.perf_counter(), _waited()
+        result = func(*args, **kwargs)
+        if not isinstance(result, Future):
+            STAGES.observe(stage, time.perf_counter() - started - (_waited() - waited))
+        return result
+    return wrapper
+
+
+# ---- 書き出し ----
+
+def _label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_label_value(v)}"' for k, v in labels.items()) + "}"
+
+
+def format_prometheus(report: dict) -> str:
+    """実行レポートを Prometheus の textfile 形式にする (値はすべて直近の実行のもの)"""
+    script = report["script"]
+    p = METRIC_PREFIX
+    lines = [
+        f"# HELP {p}_stage_seconds Per-item time of each stage in the last run.",
+        f"# TYPE {p}_stage_seconds summary",
+    ]
+    for stage, s in report["stages"].items():
+        for q in QUANTILES:
+            lines.append(f"{p}_stage_seconds{_labels(script=script, stage=stage, quantile=q)} "
+                         f"{s[f'p{int(q * 100)}']:.6f}")
+        lines.append(f"{p}_stage_seconds_sum{_labels(script=script, stage=stage)} {s['total']:.6f}")
+        lines.append(f"{p}_stage_seconds_count{_labels(script=script, stage=stage)} {s['count']}")
+    lines += [f"# HELP {p}_stage_max_seconds Slowest item of each stage in the last run.",
+              f"# TYPE {p}_stage_max_seconds gauge"]
+    for stage, s in report["stages"].items():
+        lines.append(f"{p}_stage_max_seconds{_labels(script=script, stage=stage)} {s['max']:.6f}")
+
+    lines += [f"# HELP {p}_run_items Items by result in the last run.", f"# TYPE {p}_run_items gauge"]
+    for name, value in sorted(report["counts"].items()):
+        lines.append(f"{p}_run_items{_labels(script=script, result=name)} {value}")
+
+    http = report["http"]
+    for name, key, help_text in (("http_requests", "requests", "HTTP requests"),
+                                 ("http_retries", "retries", "HTTP retries done by the session"),
+                                 ("http_errors", "errors", "HTTP requests that raised (timeouts, connection errors)"),
+                                 ("http_bytes", "bytes_received", "HTTP response bytes")):
+        lines += [f"# HELP {p}_run_{name} {help_text} in the last run.", f"# TYPE {p}_run_{name} gauge",
+                  f"{p}_run_{name}{_labels(script=script)} {http[key]}"]
+    lines += [f"# HELP {p}_run_http_responses HTTP responses by status in the last run.",
+              f"# TYPE {p}_run_http_responses gauge"]
+    for status, value in http["status_counts"].items():
+        lines.append(f"{p}_run_http_responses{_labels(script=script, status=status)} {value}")
+
+    lines += [
+        f"# HELP {p}_run_duration_seconds Wall time of the last run.",
+        f"# TYPE {p}_run_duration_seconds gauge",
+        f"{p}_run_duration_seconds{_labels(script=script)} {report['elapsed']:.3f}",
+        f"# HELP {p}_run_success Whether the last run finished without an exception.",
+        f"# TYPE {p}_run_success gauge",
+        f"{p}_run_success{_labels(script=script)} {1 if report['status'] == 'ok' else 0}",
+        f"# HELP {p}_run_timestamp_seconds When the last run finished.",
+        f"# TYPE {p}_run_timestamp_seconds gauge",
+        f"{p}_run_timestamp_seconds{_labels(script=script)} {report['finished']:.0f}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def format_stage_summary(stages: dict) -> str:
+    parts = [f"{stage} n={s['count']} p50={s['p50'] * 1000:.1f}ms p95={s['p95'] * 1000:.1f}ms "
+             f"max={s['max'] * 1000:.1f}ms" for stage, s in stages.items()]
+    return "[METRICS] " + (" | ".join(parts) if parts else "no stages recorded")
+
+
+class _Profiler:
+    """RUN_PROFILE で指定された cProfile / tracemalloc"""
+
+    def __init__(self, spec: str):
+        kinds = {k.strip().lower() for k in (spec or "").split(",") if k.strip()}
+        self.cpu = cProfile.Profile() if "cpu" in kinds else None
+        self.memory = "memory" in kinds
+
+    def start(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        if self.cpu is not None:
+            self.cpu.enable()
+
+    def stop(self, directory: str, script: str) -> dict:
+        result = {}
+        if self.cpu is not None:
+            self.cpu.disable()
+            prof_path = os.path.join(directory, f"{script}.prof")
+            self.cpu.dump_stats(prof_path)
+            out = io.StringIO()
+            pstats.Stats(self.cpu, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP)
+            text_path = os.path.join(directory, f"{script}.profile.txt")
+            atomic_write_bytes(out.getvalue().encode("utf-8"), text_path)
+            result["cpu"] = {"stats": prof_path, "text": text_path}
+        if self.memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics("lineno")[:PROFILE_TOP]
+            tracemalloc.stop()
+            text_path = os.path.join(directory, f"{script}.tracemalloc.txt")
+            atomic_write_bytes("\n".join(str(stat) for stat in top).encode("utf-8") + b"\n", text_path)
+            result["memory"] = {"current_kib": current // 1024, "peak_kib": peak // 1024, "text": text_path}
+        return result
+
+
+@contextmanager
+def run_report(script: str, directory=None, textfile_dir=None):
+    """
+    ブロックの実行中だけ段階別の計測を有効にし、終わったら (例外でも) JSON と textfile を書き出す。
+    HTTP の計測 (http_client.METRICS) もここで0から数え直す。
+    """
+    directory = directory or os.environ.get("RUN_METRICS_DIR", METRICS_DIR)
+    textfile_dir = textfile_dir or os.environ.get("RUN_METRICS_TEXTFILE_DIR", directory)
+    os.makedirs(directory, exist_ok=True)
+    profiler = _Profiler(os.environ.get(PROFILE_ENV, ""))
+    STAGES.reset()
+    METRICS.reset()
+    STAGES.enabled = True
+    started_wall, started = time.time(), time.perf_counter()
+    status = "ok"
+    profiler.start()
+    try:
+        yield STAGES
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        STAGES.enabled = False
+        profile = profiler.stop(directory, script)
+        with STAGES._lock:
+            counts = dict(STAGES.counts)
+        report = {
+            "script": script,
+            "argv": sys.argv[1:],
+            "status": status,
+            "started": started_wall,
+            "finished": time.time(),
+            "elapsed": time.perf_counter() - started,
+            "stages": STAGES.summary(),
+            "counts": counts,
+            "http": METRICS.summary(),
+            "profile": profile,
+        }
+        json_path = os.path.join(directory, f"{script}.json")
+        prom_path = os.path.join(textfile_dir, f"{script}.prom")
+        atomic_write_bytes(dump_json_bytes(report), json_path)
+        # node exporter が書きかけのファイルを読まないよう、置き換えで書く
+        atomic_write_bytes(format_prometheus(report).encode("utf-8"), prom_path)
+        print(format_stage_summary(report["stages"]))
+        print(f"[INFO] Wrote run metrics to {json_path} and {prom_path}")
+
+
+def instrument_run(script: str):
+    """main() を run_report() の中で実行するデコレータ"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with run_report(script):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
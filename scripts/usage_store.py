@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+linkUsage (キーワード → {url, articles_used_in: {記事ID: 回数}}) のバイナリ版の保存形式。
+
+linkUsage.json はキーワード数 × 記事数に比例して文字列キーが増え、読み込むと dict の dict がメモリに載る。
+こちらはキーワードと記事IDを連番 (0, 1, 2, ...) に置き換え、回数を疎行列として
+
+    キーワード → 記事 (CSR):  kw_ptr[K+1]  kw_art[nnz]  kw_cnt[nnz]
+    記事 → キーワード (CSC):  art_ptr[A+1] art_kw[nnz]  art_cnt[nnz]
+
+の配列 (array モジュール。値の範囲に応じて 2 / 4 バイト) で1ファイルに保存する。
+読み込みは配列をそのまま読むだけで、キーワードごと・記事ごとの参照はどちらも配列のスライスで済む。
+
+ファイル形式 (リトルエンディアン):
+
+    ヘッダ  "<4sII": マジック b"LUSG", バージョン, メタデータのバイト数
+    メタデータ (JSON): keywords / urls / articles (記事IDの文字列, 数値順) / 各配列の型と長さ
+    配列    kw_ptr, kw_art, kw_cnt, art_ptr, art_kw, art_cnt の順
+
+保存先の拡張子で形式を選ぶ (.json なら従来の JSON、.bin ならこちら):
+
+    usage = load_link_usage(path)          # どちらの形式でも従来と同じ dict を返す
+    save_link_usage(usage, path)
+    matrix = load_usage_matrix(path)       # dict を作らずに UsageMatrix のまま使う (link_data.LinkData)
+
+    python scripts/usage_store.py import                      # data/linkUsage.json → data/linkUsage.bin
+    python scripts/usage_store.py export                      # data/linkUsage.bin → data/linkUsage.json
+    python scripts/usage_store.py query --keyword 格安SIM      # キーワードを使っている記事
+    python scripts/usage_store.py query --article 6030         # 記事で使われているキーワード
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+from array import array
+
+from json_store import atomic_write_bytes, atomic_write_json
+
+LINK_USAGE_JSON = os.path.join("data", "linkUsage.json")
+USAGE_STORE_PATH = os.path.join("data", "linkUsage.bin")
+STORE_EXTENSIONS = (".bin",)
+MAGIC = b"LUSG"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sII")
+ARRAY_NAMES = ("kw_ptr", "kw_art", "kw_cnt", "art_ptr", "art_kw", "art_cnt")
+MAX_COUNT = 0xFFFF  # 回数は 2 バイトに収める (1記事内の同じリンクがこれを超えることはない)
+
+
+def is_store_path(path: str) -> bool:
+    return path.lower().endswith(STORE_EXTENSIONS)
+
+
+def _article_sort_key(art_id: str):
+    return (0, int(art_id), "") if art_id.isdigit() else (1, 0, art_id)
+
+
+def _typecode(max_value: int) -> str:
+    """max_value が収まる最小の符号なし整数型 (2 バイト / 4 バイト)"""
+    return "H" if max_value <= 0xFFFF else "I"
+
+
+def _to_le_bytes(arr: array) -> bytes:
+    if sys.byteorder == "big":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+class UsageMatrix:
+    """
+    linkUsage の疎行列 (CSR + CSC)。記事IDは外向きには従来どおり文字列で受け渡す。
+    keywords[k] / urls[k] がキーワード連番 k、articles[a] が記事連番 a (記事IDの数値順)。
+    """
+
+    def __init__(self, keywords, urls, articles, kw_ptr, kw_art, kw_cnt, art_ptr, art_kw, art_cnt):
+        self.keywords = keywords
+        self.urls = urls
+        self.articles = articles
+        self.kw_ptr, self.kw_art, self.kw_cnt = kw_ptr, kw_art, kw_cnt
+        self.art_ptr, self.art_kw, self.art_cnt = art_ptr, art_kw, art_cnt
+        self.keyword_ids = {kw: k for k, kw in enumerate(keywords)}
+        self.article_ids = {art_id: a for a, art_id in enumerate(articles)}
+
+    @classmethod
+    def from_dict(cls, usage: dict) -> "UsageMatrix":
+        keywords = list(usage)
+        urls = [info.get("url", "") for info in usage.values()]
+        articles = sorted({art_id for info in usage.values() for art_id in info.get("articles_used_in", {})},
+                          key=_article_sort_key)
+        article_ids = {art_id: a for a, art_id in enumerate(articles)}
+
+        # CSR: キーワードごとに記事連番の昇順
+        kw_ptr, kw_art, kw_cnt = [0], [], []
+        for info in usage.values():
+            row = sorted((article_ids[art_id], min(int(cnt), MAX_COUNT))
+                         for art_id, cnt in info.get("articles_used_in", {}).items())
+            kw_art.extend(a for a, _ in row)
+            kw_cnt.extend(c for _, c in row)
+            kw_ptr.append(len(kw_art))
+
+        # CSC: 記事ごとの件数を数えてから詰める (キーワード連番の昇順になる)
+        art_ptr = [0] * (len(articles) + 1)
+        for a in kw_art:
+            art_ptr[a + 1] += 1
+        for a in range(len(articles)):
+            art_ptr[a + 1] += art_ptr[a]
+        fill = art_ptr[:-1]
+        art_kw = [0] * len(kw_art)
+        art_cnt = [0] * len(kw_art)
+        for k in range(len(keywords)):
+            for i in range(kw_ptr[k], kw_ptr[k + 1]):
+                a = kw_art[i]
+                art_kw[fill[a]] = k
+                art_cnt[fill[a]] = kw_cnt[i]
+                fill[a] += 1
+
+        nnz = len(kw_art)
+        ptr_type = _typecode(nnz)
+        return cls(keywords, urls, articles,
+                   array(ptr_type, kw_ptr), array(_typecode(len(articles)), kw_art), array("H", kw_cnt),
+                   array(ptr_type, art_ptr), array(_typecode(len(keywords)), art_kw), array("H", art_cnt))
+
+    @classmethod
+    def load(cls, path: str) -> "UsageMatrix":
+        with open(path, "rb") as f:
+            payload = f.read()
+        magic, version, meta_len = HEADER.unpack_from(payload)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a linkUsage store (magic={magic!r}, version={version})")
+        offset = HEADER.size
+        meta = json.loads(payload[offset:offset + meta_len])
+        offset += meta_len
+        arrays = {}
+        for name in ARRAY_NAMES:
+            typecode, length = meta["arrays"][name]
+            arr = array(typecode)
+            size = arr.itemsize * length
+            arr.frombytes(payload[offset:offset + size])
+            if sys.byteorder == "big":
+                arr.byteswap()
+            arrays[name] = arr
+            offset += size
+        return cls(meta["keywords"], meta["urls"], meta["articles"], **arrays)
+
+    def save(self, path: str):
+        arrays = {name: getattr(self, name) for name in ARRAY_NAMES}
+        meta = json.dumps({
+            "keywords": self.keywords,
+            "urls": self.urls,
+            "articles": self.articles,
+            "arrays": {name: [arr.typecode, len(arr)] for name, arr in arrays.items()},
+        }, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        parts = [HEADER.pack(MAGIC, FORMAT_VERSION, len(meta)), meta]
+        parts.extend(_to_le_bytes(arr) for arr in arrays.values())
+        atomic_write_bytes(b"".join(parts), path)
+
+    def to_dict(self) -> dict:
+        """従来の linkUsage.json と同じ形の dict (記事IDは数値順)"""
+        usage = {}
+        articles, kw_ptr, kw_art, kw_cnt = self.articles, self.kw_ptr, self.kw_art, self.kw_cnt
+        for k, kw in enumerate(self.keywords):
+            s, e = kw_ptr[k], kw_ptr[k + 1]
+            usage[kw] = {"url": self.urls[k],
+                         "articles_used_in": dict(zip(map(articles.__getitem__, kw_art[s:e]), kw_cnt[s:e]))}
+        return usage
+
+    def keyword_url(self, keyword: str):
+        k = self.keyword_ids.get(keyword)
+        return None if k is None else self.urls[k]
+
+    def articles_for(self, keyword: str) -> dict:
+        """キーワードを使っている {記事ID: 回数}"""
+        k = self.keyword_ids.get(keyword)
+        if k is None:
+            return {}
+        s, e = self.kw_ptr[k], self.kw_ptr[k + 1]
+        return dict(zip(map(self.articles.__getitem__, self.kw_art[s:e]), self.kw_cnt[s:e]))
+
+    def keywords_for(self, article_id) -> dict:
+        """記事で使われている {キーワード: 回数}"""
+        a = self.article_ids.get(str(article_id))
+        if a is None:
+            return {}
+        s, e = self.art_ptr[a], self.art_ptr[a + 1]
+        return dict(zip(map(self.keywords.__getitem__, self.art_kw[s:e]), self.art_cnt[s:e]))
+
+    def article_totals(self) -> dict:
+        """{記事ID: その記事のリンク数の合計}"""
+        art_ptr, art_cnt = self.art_ptr, self.art_cnt
+        return {art_id: sum(art_cnt[art_ptr[a]:art_ptr[a + 1]]) for a, art_id in enumerate(self.articles)}
+
+    def iter_article_keywords(self):
+        """(記事ID, [キーワード連番, ...]) を記事連番の順に返す"""
+        art_ptr, art_kw = self.art_ptr, self.art_kw
+        for a, art_id in enumerate(self.articles):
+            yield art_id, art_kw[art_ptr[a]:art_ptr[a + 1]]
+
+    def stats(self) -> dict:
+        return {"keywords": len(self.keywords), "articles": len(self.articles), "entries": len(self.kw_art)}
+
+
+def load_link_usage(path: str) -> dict:
+    """linkUsage を読み込む (拡張子で形式を判断。ファイルが無ければ {})"""
+    if not os.path.exists(path):
+        return {}
+    if is_store_path(path):
+        return UsageMatrix.load(path).to_dict()
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_usage_matrix(path: str) -> UsageMatrix:
+    """linkUsage を UsageMatrix として読み込む (.bin はそのまま、.json は変換する。ファイルが無ければ空)"""
+    if is_store_path(path) and os.path.exists(path):
+        return UsageMatrix.load(path)
+    return UsageMatrix.from_dict(load_link_usage(path))
+
+
+def save_link_usage(usage: dict, path: str):
+    """linkUsage を保存する (拡張子で形式を判断。どちらも一時ファイルに書いてから置き換える)"""
+    if is_store_path(path):
+        UsageMatrix.from_dict(usage).save(path)
+    else:
+        atomic_write_json(usage, path)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="linkUsage のバイナリ版との変換・参照")
+    parser.add_argument("action", choices=("import", "export", "query"),
+                        help="import: JSON → バイナリ / export: バイナリ → JSON / query: バイナリを参照")
+    parser.add_argument("--path", default=os.environ.get("LINK_USAGE_STORE", USAGE_STORE_PATH),
+                        help="バイナリ版のファイル")
+    parser.add_argument("--json", default=LINK_USAGE_JSON, help="JSON ファイル")
+    parser.add_argument("--keyword", help="query: このキーワードを使っている記事を表示")
+    parser.add_argument("--article", help="query: この記事で使われているキーワードを表示")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    started = time.perf_counter()
+    if args.action == "import":
+        if not os.path.exists(args.json):
+            print(f"[ERROR] {args.json} not found")
+            return
+        matrix = UsageMatrix.from_dict(load_link_usage(args.json))
+        matrix.save(args.path)
+        stats = matrix.stats()
+        print(f"[INFO] Imported {args.json} into {args.path}: {stats['keywords']} keywords, "
+              f"{stats['articles']} articles, {stats['entries']} entries "
+              f"({os.path.getsize(args.json)} -> {os.path.getsize(args.path)} bytes) "
+              f"in {time.perf_counter() - started:.2f}s")
+        return stats
+
+    if not os.path.exists(args.path):
+        print(f"[ERROR] {args.path} not found. Run 'usage_store.py import' first.")
+        return
+    matrix = UsageMatrix.load(args.path)
+    if args.action == "export":
+        usage = matrix.to_dict()
+        atomic_write_json(usage, args.json)
+        print(f"[INFO] Exported {args.path} to {args.json}: {len(usage)} keywords "
+              f"in {time.perf_counter() - started:.2f}s")
+        return usage
+    if args.keyword:
+        used_in = matrix.articles_for(args.keyword)
+        print(f"[INFO] '{args.keyword}' ({matrix.keyword_url(args.keyword)}) is used in {len(used_in)} articles")
+        for art_id, count in used_in.items():
+            print(f"    article {art_id}: {count}")
+    if args.article:
+        kws = matrix.keywords_for(args.article)
+        print(f"[INFO] Article {args.article} uses {len(kws)} keywords")
+        for kw, count in kws.items():
+            print(f"    {kw}: {count}")
+    if not (args.keyword or args.article):
+        print(f"[INFO] {args.path}: {matrix.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+WordPress 記事の 取得 → 変換 → 更新 を並行に流すパイプライン。
+
+- 取得 (fetch) と更新 (write) はそれぞれスレッドプールで並行実行
+- 変換 (transform) は呼び出し元スレッドで逐次実行し、その間も取得・更新の I/O は進む
+  (transform が Future を返した場合は、その完了を待ってから更新に回す: プロセスプールでの変換用)
+- 同時に取得中 (と変換待ち) の記事数は workers * 2 までに抑える
+- HostRateLimiter でホストごとのリクエスト間隔を制限し、WAF に弾かれないようにする
+- run_metrics の計測中は、取得・変換・更新の1件ごとの所要時間を fetch / match / write として記録する
+  (HostRateLimiter の待ち時間は rate_wait として別に記録し、fetch / write には含めない)
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+from run_metrics import observe_wait, timed_call
+
+DEFAULT_WORKERS = 8
+DEFAULT_RATE_PER_HOST = 5.0  # 1ホストあたりの最大リクエスト数/秒
+
+_END = object()
+
+
+class HostRateLimiter:
+    """ホストごとに 1 秒あたりのリクエスト数を制限する (スレッドセーフ)"""
+
+    def __init__(self, rate_per_sec=DEFAULT_RATE_PER_HOST):
+        self.interval = 1.0 / rate_per_sec if rate_per_sec and rate_per_sec > 0 else 0.0
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str):
+        """url のホストに次のリクエストを送ってよい時刻まで待つ"""
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+            observe_wait("rate_wait", slot - now)
+
+
+def run_pipeline(items, fetch, transform, write, workers=DEFAULT_WORKERS, label=repr):
+    """
+    items の各要素に fetch(item) → transform(item, fetched) → write(item, transformed) を適用する。
+
+    - fetch が None を返した要素は取得失敗として以降を行わない
+    - transform が None を返した要素は「変更なし」として write しない
+    - transform が Future を返した場合はその結果を変換結果として扱う (None なら「変更なし」)
+    - write は成功なら真を返す
+    - 各段の例外はその要素の失敗として数え、他の要素の処理は続ける
+    - label(item) はログ出力用の表示名
+
+    戻り値: 件数と所要時間の dict
+    """
+    workers = max(1, int(workers))
+    fetch = timed_call("fetch", fetch)
+    transform = timed_call("match", transform)
+    write = timed_call("write", write)
+    stats = {
+        "total": 0,
+        "fetch_failed": 0,
+        "unchanged": 0,
+        "updated": 0,
+        "write_failed": 0,
+        "transform_failed": 0,
+        "elapsed": 0.0,
+    }
+    started = time.perf_counter()
+    item_iter = iter(items)
+    pending_fetch = {}
+    pending_transform = {}
+    pending_write = {}
+
+    with ThreadPoolExecutor(workers, thread_name_prefix="wp-fetch") as fetch_pool, \
+            ThreadPoolExecutor(workers, thread_name_prefix="wp-write") as write_pool:
+
+        def refill():
+            # 取得中と変換待ち (Future) の記事を合わせて workers * 2 件までに抑える
+            while len(pending_fetch) + len(pending_transform) < workers * 2:
+                item = next(item_iter, _END)
+                if item is _END:
+                    return
+                stats["total"] += 1
+                pending_fetch[fetch_pool.submit(fetch, item)] = item
+
+        refill()
+
+        def submit_write(item, transformed):
+            if transformed is None:
+                stats["unchanged"] += 1
+            else:
+                pending_write[write_pool.submit(write, item, transformed)] = item
+
+        while pending_fetch or pending_transform:
+            done, _ = wait(list(pending_fetch) + list(pending_transform), return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut in pending_transform:
+                    item = pending_transform.pop(fut)
+                    try:
+                        transformed = fut.result()
+                    except Exception as e:
+                        print(f"[ERROR] transform failed for {label(item)}: {e}")
+                        stats["transform_failed"] += 1
+                        continue
+                    submit_write(item, transformed)
+                    continue
+
+                item = pending_fetch.pop(fut)
+                try:
+                    fetched = fut.result()
+                except Exception as e:
+                    print(f"[ERROR] fetch failed for {label(item)}: {e}")
+                    fetched = None
+                if fetched is None:
+                    stats["fetch_failed"] += 1
+                    continue
+
+                try:
+                    transformed = transform(item, fetched)
+                except Exception as e:
+                    print(f"[ERROR] transform failed for {label(item)}: {e}")
+                    stats["transform_failed"] += 1
+                    continue
+                if isinstance(transformed, Future):
+                    pending_transform[transformed] = item
+                    continue
+                submit_write(item, transformed)
+            refill()
+
+        for fut, item in pending_write.items():
+            try:
+                ok = fut.result()
+            except Exception as e:
+                print(f"[ERROR] write failed for {label(item)}: {e}")
+                ok = False
+            stats["updated" if ok else "write_failed"] += 1
+
+    stats["elapsed"] = time.perf_counter() - started
+    return stats